@@ -1,19 +1,69 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Response, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
-from Crypto.Cipher import AES
-from hashlib import md5
-import base64
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future
 import re
 import requests
 from pydantic import BaseModel
 import time
-import io
 import zipfile
 import json
+import hashlib
+import hmac
+import sys
+import asyncio
+import os
+import httpx
+from compression import (
+    DECOMPRESSION_ERRORS,
+    CompressionMiddleware,
+    UnsupportedUploadEncoding,
+    detect_upload_encoding,
+    open_decompressed,
+)
+from result_cache import ResultCache, RESULT_CACHE_MAX_MB
+from ingest_progress import START_WAIT_SECONDS, IngestProgressRegistry, format_sse
+from log_parser import PASS_PHRASE, cryptojs_decrypt, iter_text_lines, time_to_ms, LogFileParser
+from log_columns import TIMELINE_GROUPS, compute_dwell, compute_timeline, device_level_counts, duration_stats
+from log_lexer import DEVICE, ENTRY, INFO, LOGIN, NAVIGATE, TESTING_INFO, lex_message
+from log_store import LogStore, StoreWriter, LOG_STORE_MEMORY_BUDGET_MB, LOG_STORE_SPILL_DIR
+from store_catalog import CatalogReader, CatalogWriter
+from stage_timings import StageLaps, StageTimer, timed_stage
+from profiling import ProfilingMiddleware, RequestProfiler
+from remote_zip import MemberReader, RemoteZip, RemoteZipError, RemoteZipMember
+from batch_ingest import parse_batch
+from local_ingest import (
+    LOCAL_FOLLOW_SEGMENT_ROWS, LocalFollow, LocalFollowRegistry, LocalIngestError, TailedFile, resolve_local_paths,
+)
+from resumable_upload import UPLOAD_MAX_CHUNK_MB, UploadError, UploadRegistry
+from request_stats import SlowRequestLog, SlowRequestMiddleware, set_request_timings, set_rows_returned
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    MetricsMiddleware,
+    UpstreamCall,
+    collect_result_cache_metrics,
+    collect_store_metrics,
+    record_ingest,
+    registry as metrics_registry,
+)
 
 app = FastAPI()
 
+# Deployment role:
+# - standalone: one process holds the store and serves the API (default)
+# - store: holds the store, serves the API on STORE_SOCKET and publishes snapshots for workers
+# - worker: stateless HTTP worker; reads from the published snapshots and forwards writes to the store
+# - coordinator: holds no logs; spreads ingests over SHARD_URLS and merges their results (coordinator.py)
+BACKEND_ROLE = os.environ.get("BACKEND_ROLE", "standalone")
+STORE_SOCKET = os.environ.get("STORE_SOCKET", "/tmp/log_dashboard_store.sock")
+BACKEND_WORKERS = int(os.environ.get("BACKEND_WORKERS", "4"))
+# Token for the /admin endpoints and the X-Profile header (admin features are off when unset)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,12 +73,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-PASS_PHRASE = "ecsite"
+# Compress large JSON/text responses (gzip, plus zstd/br when installed)
+app.add_middleware(CompressionMiddleware)
+
+# in-memory storage for logs and session summaries, one segment per ingested file.
+# log_store.generation increases on every ingest or clear; used for ETags and caching.
+# Handlers read from log_store.snapshot() (an immutable view); all writes go through
+# store_writer, which applies ingests and clears one at a time.
+# Above LOG_STORE_MEMORY_BUDGET_MB, rows of the least recently queried files are spilled to disk.
+log_store = LogStore(
+    memory_budget_bytes=int(LOG_STORE_MEMORY_BUDGET_MB * 1024 * 1024),
+    spill_dir=LOG_STORE_SPILL_DIR,
+)
+store_writer = StoreWriter()
+
+# Memoized results of expensive analytic endpoints, keyed on the store generation
+result_cache = ResultCache(max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024))
+log_store.add_listener(result_cache.invalidate)
+
+# On-demand CPU/allocation profiles of live requests (see /admin/profile)
+request_profiler = RequestProfiler()
+
+# Requests slower than SLOW_REQUEST_THRESHOLD_MS with their parameters and dataset size (see /admin/slow-requests)
+slow_requests = SlowRequestLog()
 
-# in-memory storage for logs
-logs_storage: List[dict] = []
-# in-memory storage for session summaries (rebuilt on upload)
-sessions_storage: List[dict] = []
+
+def store_info() -> dict:
+    """Generation and size of the store, recorded with every slow request."""
+    snapshot = log_store.snapshot()
+    return {"generation": snapshot.generation, "rows": snapshot.log_count(), "files": len(snapshot.filenames())}
+
+
+# Progress of running/recent ingests, streamed over /ingest/{ingest_id}/events
+ingest_progress = IngestProgressRegistry(on_done=record_ingest)
+
+# Resumable chunked uploads in flight (see /uploads)
+uploads = UploadRegistry(on_expire=lambda upload: upload.progress.fail("Upload expired"))
+
+# Server-local files being tailed (see /admin/local-ingest); each poll runs on the store writer
+local_follows = LocalFollowRegistry(poll=lambda follow: store_writer.submit(poll_local_follow, follow).result())
+
+# Store size and cache stats are read when /metrics is scraped
+metrics_registry.add_collector(lambda: collect_store_metrics(log_store))
+metrics_registry.add_collector(lambda: collect_result_cache_metrics(result_cache))
+
+if BACKEND_ROLE == "store":
+    # Every new generation is written to the catalog directory the workers read from
+    catalog_writer = CatalogWriter()
+    log_store.add_listener(lambda generation: catalog_writer.publish(log_store.snapshot()))
+elif BACKEND_ROLE == "worker":
+    # Mirrored segments are held to the same memory budget as in the store process
+    catalog_reader = CatalogReader(residency=log_store.residency)
+    store_client = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(uds=STORE_SOCKET), base_url="http://store", timeout=None
+    )
 
 # Token caching for S3 API
 _cached_auth_token: str = None
@@ -70,7 +168,8 @@ def get_auth_token():
         "password": "Ecsite@1234"
     }
     
-    auth_response = requests.post(auth_url, json=auth_payload)
+    with UpstreamCall("auth") as call:
+        auth_response = call.record(requests.post(auth_url, json=auth_payload))
     if auth_response.status_code != 200:
         raise HTTPException(status_code=auth_response.status_code, detail=f"Authentication failed: {auth_response.text}")
     
@@ -104,7 +203,8 @@ def refresh_auth_token():
         "refreshToken": _cached_refresh_token
     }
     
-    refresh_response = requests.post(refresh_url, json=refresh_payload)
+    with UpstreamCall("auth") as call:
+        refresh_response = call.record(requests.post(refresh_url, json=refresh_payload))
     if refresh_response.status_code != 200:
         # If refresh fails, try initial authentication
         print("Refresh token failed, re-authenticating...")
@@ -158,7 +258,8 @@ def make_authenticated_request(method: str, url: str, headers: dict = None, json
     headers["Authorization"] = f"Bearer {auth_token}"
     headers["Content-Type"] = "application/json"
     
-    response = requests.request(method, url, headers=headers, json=json)
+    with UpstreamCall("graphql") as call:
+        response = call.record(requests.request(method, url, headers=headers, json=json))
     
     # Check if token expired
     if response.status_code != 200 and retry:
@@ -168,30 +269,144 @@ def make_authenticated_request(method: str, url: str, headers: dict = None, json
             # Refresh token and retry once
             new_token = refresh_auth_token()
             headers["Authorization"] = f"Bearer {new_token}"
-            response = requests.request(method, url, headers=headers, json=json)
+            with UpstreamCall("graphql") as call:
+                response = call.record(requests.request(method, url, headers=headers, json=json))
     
     return response
 
 
-# ----------------- AES Decrypt -----------------
-def cryptojs_decrypt(passphrase: str, ciphertext: str) -> str:
-    ct = base64.b64decode(ciphertext)
-    if ct[:8] != b"Salted__":
-        raise ValueError("Not a valid salted CryptoJS ciphertext")
-    salt = ct[8:16]
-    ciphertext_bytes = ct[16:]
+# ----------------- Conditional GET -----------------
+# Read endpoints whose responses depend only on the stored logs and request arguments
+CONDITIONAL_GET_PATHS = {
+    "/logs",
+    "/logs/paginated",
+    "/logs/files",
+    "/logs/raw",
+    "/logs/raw/file",
+    "/sessions",
+    "/sessions/paginated",
+    "/stats/devices",
+    "/flowchart",
+    "/flowchart/events",
+    "/debug/login",
+}
+# /test-results is a POST but is still a pure read of the stored logs
+CONDITIONAL_POST_PATHS = {"/test-results"}
+
+
+def compute_etag(generation: int, method: str, path: str, query: str, body: bytes = b"") -> str:
+    """
+    Build a weak ETag from the store generation plus the request arguments.
+    Query parameters are sorted so equivalent requests share the same tag.
+    """
+    normalized_query = "&".join(sorted(query.split("&"))) if query else ""
+    digest = hashlib.sha1(f"{method} {path}?{normalized_query}".encode("utf-8") + b"\n" + body).hexdigest()[:16]
+    return f'W/"g{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip() == etag for tag in if_none_match.split(","))
+
+
+@app.middleware("http")
+async def conditional_get_middleware(request: Request, call_next):
+    """
+    Emit ETags on read endpoints and answer If-None-Match with 304
+    without running the endpoint when nothing has changed.
+    """
+    path = request.url.path
+    is_conditional = (
+        (request.method == "GET" and path in CONDITIONAL_GET_PATHS)
+        or (request.method == "POST" and path in CONDITIONAL_POST_PATHS)
+    )
+    if not is_conditional:
+        return await call_next(request)
+
+    generation = log_store.generation
+    body = await request.body() if request.method == "POST" else b""
+    etag = compute_etag(generation, request.method, path, request.url.query, body)
+
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    response = await call_next(request)
+    # Only tag the response if the data did not change while it was being computed
+    if response.status_code == 200 and generation == log_store.generation:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# ----------------- Worker Role -----------------
+# Requests that change the store (or need the store's ingest state) are handled by the store process
+STORE_FORWARD_PATHS = {"/read-log/", "/read-logs/", "/s3/process-selected-files", "/clear-data/", "/clear-file-data/"}
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host"}
 
-    d = d_i = b""
-    while len(d) < 32 + 16:  # key=32, iv=16
-        d_i = md5(d_i + passphrase.encode() + salt).digest()
-        d += d_i
-    key = d[:32]
-    iv = d[32:48]
 
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    decrypted = cipher.decrypt(ciphertext_bytes)
-    pad_len = decrypted[-1]
-    return decrypted[:-pad_len].decode("utf-8", errors="ignore")
+def is_store_request(path: str) -> bool:
+    return path in STORE_FORWARD_PATHS or path.startswith(("/ingest/", "/uploads", "/admin/local-ingest"))
+
+
+def forwarded_headers(request: Request):
+    return [(k, v) for k, v in request.headers.raw if k.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS]
+
+
+async def forward_to_store(request: Request) -> StreamingResponse:
+    """
+    Proxy a request to the store process over its Unix socket.
+    """
+    url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    return await proxy_request(store_client, request, url, "Store process")
+
+
+async def proxy_request(client: httpx.AsyncClient, request: Request, url: str, target: str) -> StreamingResponse:
+    """
+    Proxy a request with httpx. The body and the response are streamed (uploads, SSE progress).
+    """
+    upstream_request = client.build_request(request.method, url, headers=forwarded_headers(request), content=request.stream())
+    try:
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.TransportError as e:
+        raise HTTPException(status_code=503, detail=f"{target} unavailable: {e}")
+    response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        background=BackgroundTask(upstream.aclose),
+    )
+
+
+async def worker_role_middleware(request: Request, call_next):
+    """
+    Forward store writes to the store process; serve everything else locally
+    from the latest snapshot published by the store.
+    """
+    if is_store_request(request.url.path):
+        try:
+            return await forward_to_store(request)
+        except HTTPException as e:
+            return Response(content=json.dumps({"detail": e.detail}), status_code=e.status_code, media_type="application/json")
+    if catalog_reader.changed():
+        snapshot = await run_in_threadpool(catalog_reader.refresh)
+        if snapshot is not None:
+            log_store.replace_snapshot(snapshot)
+    return await call_next(request)
+
+
+if BACKEND_ROLE == "worker":
+    # Registered after the ETag middleware so it runs first: the snapshot is fresh before ETags are computed
+    app.middleware("http")(worker_role_middleware)
+
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler, admin_token=ADMIN_TOKEN, router=app.router)
+app.add_middleware(SlowRequestMiddleware, slow_log=slow_requests, store_info=store_info, router=app.router)
+
+# Outermost middleware: times every request, including 304s and forwarded writes
+app.add_middleware(MetricsMiddleware, router=app.router)
 
 
 # ----------------- Clear Data -----------------
@@ -199,11 +414,12 @@ def cryptojs_decrypt(passphrase: str, ciphertext: str) -> str:
 async def clear_data():
     """
     Clear all stored logs and sessions data.
+    Queued behind running ingests, so an ingest is never half-cleared.
+    Followed local files are no longer tailed, so they cannot add rows back.
     """
-    global logs_storage, sessions_storage
-    logs_storage.clear()
-    sessions_storage.clear()
-    return {"message": "All data cleared successfully"}
+    stopped = local_follows.clear()
+    await store_writer.run(log_store.clear)
+    return {"message": "All data cleared successfully", "stopped_follows": len(stopped)}
 
 
 @app.get("/clear-file-data/")
@@ -211,153 +427,337 @@ async def clear_file_data(filename: str = Query(...)):
     """
     Clear logs and sessions data for a specific file.
     Handles both exact matches (local files) and partial matches (S3 files with full paths).
+    Only the file's segments are dropped; other rows are not touched.
+    A followed local file that is cleared is no longer tailed.
     """
-    global logs_storage, sessions_storage
-    
-    # First try exact match
-    exact_match_logs = [log for log in logs_storage if log.get("filename") == filename]
-    exact_match_sessions = [session for session in sessions_storage if session.get("filename") == filename]
-    
-    if exact_match_logs or exact_match_sessions:
-        # Exact match found - remove by exact match
-        logs_storage = [log for log in logs_storage if log.get("filename") != filename]
-        sessions_storage = [session for session in sessions_storage if session.get("filename") != filename]
-    else:
-        # No exact match - try partial match (filename ends with the provided name)
-        # This handles S3 files where frontend sends short name but backend has full path
-        logs_storage = [log for log in logs_storage if not log.get("filename", "").endswith(filename)]
-        sessions_storage = [session for session in sessions_storage if not session.get("filename", "").endswith(filename)]
-    
-    return {"message": f"Data cleared for file: {filename}", "remaining_logs": len(logs_storage), "remaining_sessions": len(sessions_storage)}
+    await store_writer.run(remove_file_data, filename)
+    snapshot = log_store.snapshot()
+    return {"message": f"Data cleared for file: {filename}", "remaining_logs": snapshot.log_count(), "remaining_sessions": snapshot.session_count()}
+
+def remove_file_data(filename: str) -> List[str]:
+    """Drop the segments of a file and stop following it. Runs on the store writer thread, between polls."""
+    removed = log_store.remove_file(filename)
+    local_follows.stop_files(removed)
+    return removed
+
 
 # ----------------- Upload & Read Logs -----------------
 @app.post("/read-log/")
-async def read_log(file: UploadFile = File(...)):
+async def read_log(
+    file: UploadFile = File(...),
+    ingest_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/{ingest_id}/events"),
+    log_id_start: Optional[int] = Query(None, include_in_schema=False),  # set by a coordinator
+    session_id_start: Optional[int] = Query(None, include_in_schema=False),
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
     """
     Upload a file, decrypt each line, and store in memory.
     Append to existing data for session persistence.
+    The file may be gzip, zstd or zip compressed (detected from its first bytes, or
+    announced by the part's Content-Encoding/Content-Type); it is decompressed as it is read.
+    Progress is published under ingest_id while the file is processed.
     """
-    global logs_storage, sessions_storage
-    filename = file.filename  # Capture the filename
-    content = await file.read()
-    lines = content.decode("utf-8").splitlines()
+    progress = ingest_progress.get_or_create(ingest_id)
+    progress.begin("upload", [file.filename])
+    timer = StageTimer("ingest", kind="upload", filenames=[file.filename])
+    declared_encoding = file.headers.get("content-encoding") or file.content_type
+    try:
+        # Queue the CPU-bound decrypt/parse loop on the store writer; the event loop stays free so progress can stream
+        with timer.activate():
+            result = await store_writer.run(
+                ingest_encrypted_file, file.filename, file.file, progress, log_id_start, session_id_start, declared_encoding
+            )
+    except Exception as e:
+        progress.fail(str(e))
+        raise
+    progress.finish(result)
+    return finish_timings(timer, {**result, "ingest_id": progress.ingest_id}, timings)
 
-    # Get the highest existing IDs to continue numbering
-    existing_log_count = len(logs_storage)
-    existing_session_count = len(sessions_storage)
-    max_existing_log_id = max([log.get("id", 0) for log in logs_storage], default=0)
-    max_existing_session_id = max([session.get("session_id", 0) for session in sessions_storage], default=0)
-    
-    device_counters: Dict[str, int] = {}
-    current_device_id = None
-    current_session_id = max_existing_session_id  # Continue from existing sessions
-    current_session_screens: List[str] = []
-    current_session_start_time = None
-    last_log_time = None
-    global_counter = max_existing_log_id + 1  # Continue ID numbering from existing logs
-
-    for line in lines:
-        if not line.strip():
-            continue
 
-        try:
-            decrypted = cryptojs_decrypt(PASS_PHRASE, line.strip())
-        except Exception as e:
-            decrypted = f"ERROR: {str(e)}"
-
-        # Detect DEVICE ID
-        match = re.search(r"DEVICE ID\s+([A-Z0-9\-]+)", decrypted)
-        if match:
-            current_device_id = match.group(1)
-            if current_device_id not in device_counters:
-                device_counters[current_device_id] = 1
-            continue
+def ingest_encrypted_file(
+    filename: str, fileobj, progress, log_id_start: int = None, session_id_start: int = None, declared_encoding: str = None
+):
+    """
+    Decrypt each line of an uploaded file and publish its logs and sessions as one segment
+    (one segment per member for a zip upload).
+    Runs on the store writer thread, so the id counters cannot move underneath it.
+    A coordinator passes explicit id starts so ids stay unique across shards.
+    """
+    # Continue ID numbering from existing logs / sessions
+    next_log_id = log_store.next_log_id if log_id_start is None else log_id_start
+    last_session_id = log_store.last_session_id if session_id_start is None else session_id_start
+    parsed_files = []
+    try:
+        encoding = detect_upload_encoding(fileobj, declared_encoding)
+        for member_name, member_file in iter_upload_files(filename, fileobj, encoding):
+            progress.set_file(member_name)
+            parser = LogFileParser(
+                member_name,
+                decrypt=True,
+                log_id_start=next_log_id,
+                session_id_start=last_session_id,
+                progress=progress,
+            )
+            with member_file:
+                parser.feed_lines(iter_text_lines(member_file, progress))
+            parsed = parser.finish()
+            parsed_files.append(parsed)
+            next_log_id = parser.next_log_id
+            last_session_id = parsed.last_session_id
+    except UnsupportedUploadEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress {filename}: {e}")
+    publish_parsed_files(parsed_files)
+
+    snapshot = log_store.snapshot()
+    return {
+        "message": "File processed successfully",
+        "total_logs": snapshot.log_count(),
+        "total_sessions": snapshot.session_count(),
+        "next_log_id": next_log_id,
+        "last_session_id": last_session_id,
+    }
 
-        # Identify session boundaries:
-        # 1) Entry log point: "LOG-APP: App Version:" starts/renews a session
-        # 2) Background → Active keeps same session; Background → next entry without Active means new session
-        is_entry_log = "LOG-APP" in decrypted and "App Version" in decrypted
-        is_background = "ECS-ACTIVITY" in decrypted and "App state background" in decrypted
-        is_active = "ECS-ACTIVITY" in decrypted and "App state active" in decrypted
-        is_navigate = "ECS-ACTIVITY" in decrypted and "NAVIGATE-TO" in decrypted
-
-        if is_entry_log:
-            # Start a new session
-            current_session_id += 1
-            current_session_screens = []
-            # time will be extracted below; set start_time after parsing
-            current_session_start_time = None
-
-        # Only log if device is known
-        if current_device_id:
-            # Extract time at the beginning of the decrypted message if present.
-            # Expected format: HH:MM:SS:MMM or HH:MM:SS:MM e.g., 07:25:03:987 or 07:25:04:07
-            time_match = re.match(r"^(\d{2}:\d{2}:\d{2}:\d{2,3})", decrypted)
-            extracted_time = time_match.group(1) if time_match else None
-
-            # Remove the time and any following separators like " |" from the message for cleaner display
-            if time_match:
-                cleaned_message = decrypted[time_match.end():].lstrip(" |")
-            else:
-                cleaned_message = decrypted
-
-            log_entry = {
-                "id": global_counter,  # unique across all logs
-                "device_log_id": device_counters[current_device_id],  # per-device counter
-                "device_id": current_device_id,
-                "time": extracted_time,  # optional precise time from decrypted line
-                "message": cleaned_message,
-                "session_id": current_session_id if current_session_id > 0 else 1,
-                "raw": line.strip(),
-                "filename": filename,  # track which file this log came from
-            }
-            logs_storage.append(log_entry)
-
-            # Update session tracking metadata
-            if extracted_time:
-                last_log_time = extracted_time
-                if current_session_start_time is None:
-                    current_session_start_time = extracted_time
-            if is_navigate:
-                # capture screen transitions, e.g., NAVIGATE-TO : { screen : siteList }
-                screen_match = re.search(r"NAVIGATE-TO\s*:\s*\{\s*screen\s*:\s*([^}\s]+)", decrypted)
-                if screen_match:
-                    current_session_screens.append(screen_match.group(1))
-
-            # If a new session started on this log, finalize previous session summary
-            if is_entry_log and current_session_id > 1:
-                prev_session_id = current_session_id - 1
-                prev_logs = [l for l in logs_storage if l["session_id"] == prev_session_id and l["device_id"] == current_device_id]
-                if prev_logs:
-                    sessions_storage.append({
-                        "device_id": current_device_id,
-                        "session_id": prev_session_id,
-                        "start_time": prev_logs[0].get("time"),
-                        "end_time": prev_logs[-1].get("time"),
-                        "entries_count": len(prev_logs),
-                        "screens": [s for s in current_session_screens[:-1]] if len(current_session_screens) > 0 else [],
-                        "filename": filename,  # track which file this session came from
-                    })
-
-            # Increment counters
-            device_counters[current_device_id] += 1
-            global_counter += 1
-
-    # Finalize last session summary
-    if current_session_id >= 1 and current_device_id:
-        last_session_logs = [l for l in logs_storage if l["session_id"] == current_session_id and l["device_id"] == current_device_id]
-        if last_session_logs:
-            sessions_storage.append({
-                "device_id": current_device_id,
-                "session_id": current_session_id,
-                "start_time": last_session_logs[0].get("time"),
-                "end_time": last_session_logs[-1].get("time"),
-                "entries_count": len(last_session_logs),
-                "screens": current_session_screens,
-                "filename": filename,  # track which file this session came from
+
+def iter_upload_files(filename: str, fileobj, encoding: Optional[str]):
+    """
+    (name, binary file object) of each log file in an upload: the upload itself
+    (decompressed on the fly for gzip/zstd) or every file member of a zip upload,
+    named "<upload name>/<member>" so /clear-file-data/ with the upload name drops them all.
+    """
+    if encoding != "zip":
+        yield filename, open_decompressed(fileobj, encoding)
+        return
+    # Uploads are spooled to a seekable file, so members are inflated straight from it
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if not info.is_dir():
+                yield f"{filename}/{info.filename}", zf.open(info)
+
+
+# ----------------- Batch Uploads -----------------
+@app.post("/read-logs/")
+async def read_logs(
+    files: List[UploadFile] = File(...),
+    ingest_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/{ingest_id}/events"),
+    log_id_start: Optional[int] = Query(None, include_in_schema=False),
+    session_id_start: Optional[int] = Query(None, include_in_schema=False),
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
+    """
+    Upload several encrypted log files at once (each may be gzip/zstd compressed,
+    or a zip/tar archive of log files). Files are decrypted and parsed in parallel
+    worker processes, then published in upload order, so ids come out exactly as
+    if the files had been sent one by one to /read-log/.
+    A file that cannot be read or parsed is reported in its entry; the others are still stored.
+    """
+    filenames = [file.filename for file in files]
+    progress = ingest_progress.get_or_create(ingest_id)
+    progress.begin("batch-upload", filenames)
+    timer = StageTimer("ingest", kind="batch-upload", filenames=filenames)
+    try:
+        with timer.activate():
+            # Reading the parts and waiting for the workers blocks; keep it off the event loop
+            parsed_files = await run_in_threadpool(parse_batch, [(file.filename, file.file) for file in files], progress)
+            result = await store_writer.run(publish_batch, parsed_files, log_id_start, session_id_start)
+    except Exception as e:
+        progress.fail(str(e))
+        raise
+    progress.finish(result)
+    return finish_timings(timer, {**result, "ingest_id": progress.ingest_id}, timings)
+
+
+def publish_batch(parsed_files, log_id_start: int = None, session_id_start: int = None):
+    """
+    Give the files of a batch their final ids, one after the other in upload order,
+    and publish them in a single generation. Runs on the store writer thread.
+    """
+    next_log_id = log_store.next_log_id if log_id_start is None else log_id_start
+    last_session_id = log_store.last_session_id if session_id_start is None else session_id_start
+    entries = []
+    published = []
+    with timed_stage("renumber"):
+        for batch_file in parsed_files:
+            parsed = batch_file.parsed
+            if parsed is None:
+                entries.append({"filename": batch_file.filename, "error": batch_file.error})
+                continue
+            entries.append({
+                "filename": batch_file.filename,
+                "logs": len(parsed.logs),
+                "sessions": len(parsed.sessions),
+                "decrypt_failures": batch_file.counters.get("decrypt_failures", 0),
             })
+            # Files without rows are not stored, so they do not move the counters either
+            if not (parsed.logs or parsed.sessions):
+                continue
+            parsed.renumber(next_log_id, last_session_id)
+            published.append(parsed)
+            next_log_id = parsed.next_log_id or next_log_id
+            last_session_id = parsed.last_session_id
+    publish_parsed_files(published)
+
+    snapshot = log_store.snapshot()
+    return {
+        "message": "Files processed",
+        "files": entries,
+        "failed_files": sum(1 for entry in entries if "error" in entry),
+        "total_logs": snapshot.log_count(),
+        "total_sessions": snapshot.session_count(),
+        "next_log_id": next_log_id,
+        "last_session_id": last_session_id,
+    }
+
+
+# ----------------- Resumable Uploads -----------------
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None  # total bytes, if known up front
 
-    return {"message": "File processed successfully", "total_logs": len(logs_storage), "total_sessions": len(sessions_storage)}
+
+def get_upload(upload_id: str):
+    upload = uploads.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+@app.post("/uploads")
+async def create_upload(
+    body: UploadCreateRequest,
+    ingest_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/{ingest_id}/events"),
+):
+    """
+    Start a resumable upload of an encrypted log file.
+    Send the file with PUT /uploads/{upload_id}?offset=N (any chunk size, any order,
+    chunks may be resent), check GET /uploads/{upload_id} after a dropped connection,
+    then POST /uploads/{upload_id}/finalize.
+    """
+    if body.size is not None and body.size < 0:
+        raise HTTPException(status_code=400, detail="size must be >= 0")
+    progress = ingest_progress.get_or_create(ingest_id)
+    progress.begin("resumable-upload", [body.filename])
+    upload = uploads.create(body.filename, body.size, progress)
+    return {**upload.status(), "ingest_id": progress.ingest_id}
+
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """
+    Store the request body at `offset`. Complete lines are decrypted and parsed
+    as soon as everything before them has arrived.
+    """
+    upload = get_upload(upload_id)
+    max_bytes = int(UPLOAD_MAX_CHUNK_MB * 1024 * 1024)
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Chunks are limited to {UPLOAD_MAX_CHUNK_MB:g} MB")
+    data = await request.body()
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Chunks are limited to {UPLOAD_MAX_CHUNK_MB:g} MB")
+    try:
+        # Parsing is CPU-bound; keep it off the event loop
+        await run_in_threadpool(upload.write, offset, data)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await run_in_threadpool(upload.status)
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """Received and missing byte ranges of an upload, and how far it has been parsed."""
+    # status() waits for a chunk that is being parsed
+    return await run_in_threadpool(get_upload(upload_id).status)
+
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    log_id_start: Optional[int] = Query(None, include_in_schema=False),  # set by a coordinator
+    session_id_start: Optional[int] = Query(None, include_in_schema=False),
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
+    """
+    Publish a completely received upload. Its lines were parsed while the chunks
+    arrived, so this only closes the last session and assigns the final ids.
+    """
+    upload = get_upload(upload_id)
+    timer = StageTimer("ingest", kind="resumable-upload", filenames=[upload.filename])
+    try:
+        with timer.activate():
+            parsed = await run_in_threadpool(upload.finalize)
+            result = await store_writer.run(publish_uploaded_file, parsed, log_id_start, session_id_start)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        upload.progress.fail(str(e))
+        raise
+    uploads.remove(upload_id)
+    upload.progress.finish(result)
+    return finish_timings(timer, {**result, "ingest_id": upload.progress.ingest_id}, timings)
+
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    upload = uploads.remove(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    upload.progress.fail("Upload aborted")
+    return {"message": "Upload aborted", "upload_id": upload_id}
+
+
+def publish_uploaded_file(parsed, log_id_start: int = None, session_id_start: int = None):
+    """
+    Give a file parsed ahead of time its final ids and publish it.
+    Runs on the store writer thread.
+    """
+    with timed_stage("renumber"):
+        parsed.renumber(
+            log_store.next_log_id if log_id_start is None else log_id_start,
+            log_store.last_session_id if session_id_start is None else session_id_start,
+        )
+    publish_parsed_file(parsed)
+
+    snapshot = log_store.snapshot()
+    return {
+        "message": "File processed successfully",
+        "total_logs": snapshot.log_count(),
+        "total_sessions": snapshot.session_count(),
+        "next_log_id": parsed.next_log_id or log_store.next_log_id,
+        "last_session_id": parsed.last_session_id,
+    }
+
+
+def publish_parsed_file(parsed):
+    """Add a parsed file to the store as a new segment (files without rows are skipped)."""
+    publish_parsed_files([parsed])
+
+
+def publish_parsed_files(parsed_files, merge_rows: int = 0):
+    """
+    Add several parsed files to the store in a single generation (files without rows are skipped).
+    merge_rows: see LogStore.add_segments.
+    """
+    log_store.add_segments([
+        (parsed.filename, parsed.logs, parsed.sessions, parsed.last_session_id)
+        for parsed in parsed_files
+        if parsed.logs or parsed.sessions
+    ], merge_rows)
+
+
+def finish_timings(timer: StageTimer, response: dict, include: bool) -> dict:
+    """
+    Log the stage breakdown of a finished ingest/computation and add it to the
+    response as "timings" when the client asked for it.
+    """
+    timer.finish()
+    timings = timer.as_dict()
+    if timer.stages:
+        timer.log()
+    else:
+        timings["cached"] = True  # nothing was computed: served from the result cache
+    set_request_timings(timings)
+    return {**response, "timings": timings} if include else response
 
 
 # ----------------- Get S3 Logs -----------------
@@ -391,7 +791,12 @@ async def read_s3_log():
         raise HTTPException(status_code=500, detail=str(e))
 
 # ----------------- Parse Test Results from Logs -----------------
-def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
+# A "Test Aborted" event only counts if one of the ABORTED_LOOKBACK logs before it is "INFO : Aborted"
+ABORTED_LOOKBACK = 5
+ABORTED_INFO_RE = re.compile(r"INFO\s*:\s*Aborted", re.IGNORECASE)
+
+
+def parse_test_results_from_logs(snapshot, processed_files: Optional[List[str]] = None):
     """
     Parse test results from logs_storage by analyzing TESTING-INFO events.
     Counts completed, incomplete, and deleted tests per file.
@@ -404,12 +809,15 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
         }
     }
     """
+    laps = StageLaps()
+    stored_logs = snapshot.logs()
+
     # Filter logs by processed_files if provided and create filename mapping
     # Map log filenames to full S3 paths for consistent response keys
     filename_to_fullpath: Dict[str, str] = {}
     if processed_files and len(processed_files) > 0:
         filtered_logs = []
-        for log in logs_storage:
+        for log in stored_logs:
             log_filename = log.get("filename", "")
             # Check if any processed_file path contains this filename
             for proc_file in processed_files:
@@ -419,12 +827,13 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
                     filename_to_fullpath[log_filename] = proc_file
                     break
     else:
-        filtered_logs = logs_storage
+        filtered_logs = stored_logs
         # If no processed_files, use log filenames as-is
-        for log in logs_storage:
+        for log in stored_logs:
             log_filename = log.get("filename", "unknown")
             if log_filename not in filename_to_fullpath:
                 filename_to_fullpath[log_filename] = log_filename
+    laps.lap("collect")
     
     # Dictionary to track test info per file
     # Structure: {filename: {unique_test_key: {"started": bool, "completed": bool, "aborted": bool, "stopped": bool, "deleted": bool, "test_id": str}}}
@@ -444,13 +853,20 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
         "deleted_found": 0
     }
     
+    # The last few messages of each file, for the "INFO : Aborted" check of aborted tests
+    recent_messages: Dict[str, deque] = {}
+
     for log in filtered_logs:
         message = log.get("message", "")
         filename = log.get("filename", "unknown")
         debug_stats["total_logs_checked"] += 1
+        window = recent_messages.get(filename)
+        if window is None:
+            window = recent_messages[filename] = deque(maxlen=ABORTED_LOOKBACK + 1)
+        window.append((log.get("id"), message))
         
         # Skip if not a TESTING-INFO message
-        if "TESTING-INFO" not in message or "ECS-ACTIVITY" not in message:
+        if lex_message(message).kind != TESTING_INFO:
             continue
         
         debug_stats["testing_info_found"] += 1
@@ -562,45 +978,18 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
         
         # Validate "Test Aborted" events - must have preceding "INFO : Aborted" log (without TESTING-INFO)
         if test_status == "aborted":
-            # Find the current log's position in logs_storage to check preceding logs
             current_log_id = log.get("id")
-            log_time = log.get("time", "")
             
-            # Look back in logs_storage for the same file to find "INFO : Aborted" message
+            # Look back up to ABORTED_LOOKBACK logs of the same file for an "INFO : Aborted" message
+            # (usually the previous event)
             has_preceding_aborted = False
-            lookback_limit = 5  # Check up to 5 logs back (usually the previous event)
-            
-            # Find logs from the same file before this one
-            file_logs = [l for l in logs_storage if l.get("filename") == filename]
-            current_index = None
-            for idx, file_log in enumerate(file_logs):
-                if file_log.get("id") == current_log_id:
-                    current_index = idx
-                    break
-            
-            if current_index is not None:
-                # Check preceding logs within lookback window
-                start_idx = max(0, current_index - lookback_limit)
-                for i in range(current_index - 1, start_idx - 1, -1):
-                    if i < 0:
+            for prev_id, prev_message in reversed(list(window)[:-1]):
+                # Check if this is an "INFO : Aborted" message (without TESTING-INFO)
+                if "TESTING-INFO" not in prev_message and "ECS-ACTIVITY" not in prev_message:
+                    if ABORTED_INFO_RE.search(prev_message):
+                        has_preceding_aborted = True
+                        print(f"DEBUG: Found preceding 'INFO : Aborted' at log {prev_id}")
                         break
-                    prev_log = file_logs[i]
-                    prev_message = prev_log.get("message", "")
-                    prev_time = prev_log.get("time", "")
-                    
-                    # Check if this is an "INFO : Aborted" message (without TESTING-INFO)
-                    if "TESTING-INFO" not in prev_message and "ECS-ACTIVITY" not in prev_message:
-                        # Check for "INFO : Aborted" pattern
-                        if re.search(r"INFO\s*:\s*Aborted", prev_message, re.IGNORECASE):
-                            has_preceding_aborted = True
-                            print(f"DEBUG: Found preceding 'INFO : Aborted' at log {prev_log.get('id')} (time: {prev_time})")
-                            break
-                    # Stop looking if we go too far back in time (more than a few seconds)
-                    # This is a heuristic to avoid checking unrelated logs
-                    if prev_time and log_time:
-                        # Simple check: if times are very different, stop looking
-                        # (This is approximate, but should work for most cases)
-                        pass
             
             if not has_preceding_aborted:
                 print(f"DEBUG: 'Test Aborted' event at log {current_log_id} has no preceding 'INFO : Aborted' - SKIPPING aborted status")
@@ -680,6 +1069,8 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
                 }
                 print(f"DEBUG: Orphaned event (no start) - Key: {unique_key[:60]}..., Event: '{details}'")
     
+    laps.lap("classify")
+
     # Print debug statistics
     total_tests_tracked = sum(len(tests) for tests in test_tracking.values())
     print(f"DEBUG Test Parsing Stats: {debug_stats}")
@@ -763,7 +1154,7 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
                 for log_filename, mapped_path in filename_to_fullpath.items():
                     if mapped_path == proc_file:
                         # Found a mapping, check if logs exist for this filename
-                        if any(log.get("filename", "") == log_filename for log in logs_storage):
+                        if any(log.get("filename", "") == log_filename for log in stored_logs):
                             file_exists = True
                             matching_log_filename = log_filename
                             break
@@ -771,7 +1162,7 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
                 # If not found in mapping, check direct matches (for local files)
                 if not file_exists:
                     # Check if proc_file matches any log filename directly
-                    for log in logs_storage:
+                    for log in stored_logs:
                         log_filename = log.get("filename", "")
                         # For local files: exact match
                         # For S3 files: check if log_filename is in proc_file or proc_file ends with log_filename
@@ -795,7 +1186,7 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
     else:
         # If no processed_files provided, ensure all files in logs_storage are included
         unique_filenames = set()
-        for log in logs_storage:
+        for log in stored_logs:
             log_filename = log.get("filename", "")
             if log_filename and log_filename not in unique_filenames:
                 unique_filenames.add(log_filename)
@@ -810,80 +1201,102 @@ def parse_test_results_from_logs(processed_files: Optional[List[str]] = None):
                     }
                     print(f"DEBUG: Added file '{key}' with zero counts (no test events found)")
     
+    laps.lap("aggregate")
     return {"testInfo": test_info}
 
 
-@app.post("/test-results")
-async def test_results(body: Optional[S3SiteRequest] = None):
-    try:
-        resolved_site_id = (body.siteId if body and body.siteId else None)
-        resolved_company_id = (body.companyId if body and body.companyId else None)
-        resolved_company_code = (body.companyCode if body and body.companyCode else None)
-        resolved_site_code = (body.siteCode if body and body.siteCode else None)
-        resolved_bucket_name = (body.bucket_name if body and body.bucket_name else "ecsite-cloud-uat")
-        processed_files = (body.processed_files if body and body.processed_files else None)
-        
-        # Check if there are any logs in storage
-        if not logs_storage or len(logs_storage) == 0:
-            # Return empty result structure
-            result_json = {
-                "data": {
-                    "response": {"testInfo": {}}
-                }
-            }
-            response_data = {
-                "data": {
-                    "runWorkflow": {
-                        "stepResults": [
-                            {
-                                "stepId": "parse_logs",
-                                "stepInfo": "No logs found",
-                                "result": json.dumps(result_json),
-                                "metricSummary": None
-                            }
-                        ],
-                        "status": "success",
-                        "message": "No logs found in storage",
-                        "errorLog": None
-                    }
-                }
-            }
-            return {"message": "No logs found", "data": response_data}
-        
-        # Parse test results from logs_storage instead of using external API
-        test_results_data = parse_test_results_from_logs(processed_files)
-        
-        # Format response to match what frontend expects
-        # The frontend expects: apiResponse.data.data.runWorkflow.stepResults[0].result
-        # Where result is a JSON string containing: { data: { response: { testInfo: {...} } } }
+def test_results_response(test_results_data: Optional[dict]):
+    """
+    Wrap parsed test results (None when no logs are stored) in the workflow
+    response format the frontend expects.
+    """
+    if test_results_data is None:
+        # Return empty result structure
         result_json = {
             "data": {
-                "response": test_results_data
+                "response": {"testInfo": {}}
             }
         }
-        
-        # Create response in the format expected by frontend
-        # After axios, response.data will contain this structure
-        # Frontend accesses: response.data.data.runWorkflow
         response_data = {
             "data": {
                 "runWorkflow": {
                     "stepResults": [
                         {
                             "stepId": "parse_logs",
-                            "stepInfo": "Parsed test results from logs",
+                            "stepInfo": "No logs found",
                             "result": json.dumps(result_json),
                             "metricSummary": None
                         }
                     ],
                     "status": "success",
-                    "message": "Test results parsed successfully",
+                    "message": "No logs found in storage",
                     "errorLog": None
                 }
             }
         }
+        return {"message": "No logs found", "data": response_data}
+
+    # Format response to match what frontend expects
+    # The frontend expects: apiResponse.data.data.runWorkflow.stepResults[0].result
+    # Where result is a JSON string containing: { data: { response: { testInfo: {...} } } }
+    result_json = {
+        "data": {
+            "response": test_results_data
+        }
+    }
+    
+    # Create response in the format expected by frontend
+    # After axios, response.data will contain this structure
+    # Frontend accesses: response.data.data.runWorkflow
+    response_data = {
+        "data": {
+            "runWorkflow": {
+                "stepResults": [
+                    {
+                        "stepId": "parse_logs",
+                        "stepInfo": "Parsed test results from logs",
+                        "result": json.dumps(result_json),
+                        "metricSummary": None
+                    }
+                ],
+                "status": "success",
+                "message": "Test results parsed successfully",
+                "errorLog": None
+            }
+        }
+    }
+    
+    return {"message": "Test results fetched successfully", "data": response_data}
+
+
+@app.post("/test-results")
+async def test_results(
+    body: Optional[S3SiteRequest] = None,
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
+    try:
+        resolved_site_id = (body.siteId if body and body.siteId else None)
+        resolved_company_id = (body.companyId if body and body.companyId else None)
+        resolved_company_code = (body.companyCode if body and body.companyCode else None)
+        resolved_site_code = (body.siteCode if body and body.siteCode else None)
+        resolved_bucket_name = (body.bucket_name if body and body.bucket_name else "ecsite-cloud-uat")
+        processed_files = (body.processed_files if body and body.processed_files else None)
         
-        return {"message": "Test results fetched successfully", "data": response_data}
+        # Check if there are any logs in storage
+        snapshot = log_store.snapshot()
+        if snapshot.log_count() == 0:
+            return test_results_response(None)
+        
+        # Parse test results from logs_storage instead of using external API
+        timer = StageTimer("test-results", processed_files=processed_files)
+        with timer.activate():
+            test_results_data = result_cache.get_or_compute(
+                "test-results",
+                {"processed_files": processed_files},
+                snapshot.generation,
+                lambda: parse_test_results_from_logs(snapshot, processed_files),
+            )
+        return finish_timings(timer, test_results_response(test_results_data), timings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1128,43 +1541,48 @@ async def generate_s3_log_files1(site_id: str, body: Optional[S3SiteRequest] = N
 
 
 # ----------------- List Files in S3 ZIP -----------------
+def decrypted_zip_url(company_code: str, site_code: str, timestamp_ms: str) -> str:
+    return (
+        f"https://cloud-uat-api.ecsiteapp.com/api/s3/ecsite-cloud-uat/"
+        f"{company_code}/{site_code}/ecsOpsTool/decrypted_{timestamp_ms}/decryptedLogs.zip"
+    )
+
+
+def is_log_member(name: str) -> bool:
+    lower = name.lower()
+    return not name.endswith('/') and (lower.endswith('.log') or lower.endswith('.txt'))
+
+
 @app.post("/s3/list-zip-files")
 async def list_zip_files(body: S3SiteRequest):
     """
-    Download the decryptedLogs.zip from S3 and list all log files inside it.
+    List all log files inside the decryptedLogs.zip on S3.
+    Only the central directory is read (HTTP range requests of a few KB);
+    servers without range support fall back to a full download.
     Returns list of file paths that can be selected for processing.
     """
     try:
         if not body or not body.companyCode or not body.siteCode or not body.timestamp_ms:
             raise HTTPException(status_code=400, detail="companyCode, siteCode, and timestamp_ms are required")
 
-        zip_url = (
-            f"https://cloud-uat-api.ecsiteapp.com/api/s3/ecsite-cloud-uat/"
-            f"{body.companyCode}/{body.siteCode}/ecsOpsTool/decrypted_{body.timestamp_ms}/decryptedLogs.zip"
-        )
-
-        # Fetch the zip (server-side avoids browser CORS)
-        resp = requests.get(zip_url, stream=True, allow_redirects=True)
-        if resp.status_code != 200:
-            raise HTTPException(status_code=resp.status_code, detail=f"Failed to fetch zip: {resp.text[:300]}")
-
-        zip_bytes = io.BytesIO(resp.content)
+        # Fetched server-side (avoids browser CORS), off the event loop
+        remote = RemoteZip(decrypted_zip_url(body.companyCode, body.siteCode, body.timestamp_ms))
         try:
-            with zipfile.ZipFile(zip_bytes) as zf:
-                # List all files, filtering for log/text files
-                all_files = zf.namelist()
-                log_files = [
-                    f for f in all_files 
-                    if not f.endswith('/') and (f.lower().endswith('.log') or f.lower().endswith('.txt') or f.lower().endswith('.log.txt'))
-                ]
-                return {
-                    "files": log_files,
-                    "total_files": len(log_files),
-                    "all_files": all_files  # Include all for debugging
-                }
+            members = await run_in_threadpool(remote.members)
+        except RemoteZipError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         except zipfile.BadZipFile:
             raise HTTPException(status_code=400, detail="Downloaded file is not a valid zip")
 
+        # List all files, filtering for log/text files
+        log_members = [member for member in members if is_log_member(member.name)]
+        return {
+            "files": [member.name for member in log_members],
+            "total_files": len(log_members),
+            "members": [member.as_dict() for member in log_members],
+            "all_files": [member.name for member in members],  # Include all for debugging
+        }
+
     except HTTPException:
         raise
     except Exception as e:
@@ -1173,171 +1591,229 @@ async def list_zip_files(body: S3SiteRequest):
 
 # ----------------- Process Selected Files from ZIP -----------------
 @app.post("/s3/process-selected-files")
-async def process_selected_files(body: ZipFileSelectionRequest):
+async def process_selected_files(
+    body: ZipFileSelectionRequest,
+    ingest_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/{ingest_id}/events"),
+    log_id_start: Optional[int] = Query(None, include_in_schema=False),  # set by a coordinator
+    session_id_start: Optional[int] = Query(None, include_in_schema=False),
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
     """
-    Download the ZIP, extract selected files, and process them (decrypted logs).
+    Fetch the selected files from the ZIP (HTTP range requests for just those members) and process them (decrypted logs).
     Reuses the same parsing logic as read_log but without decryption step.
+    Progress is published under ingest_id while the files are processed.
     """
+    progress = ingest_progress.get_or_create(ingest_id)
+    progress.begin("s3-zip", body.selectedFiles)
+    timer = StageTimer("ingest", kind="s3-zip", filenames=body.selectedFiles)
     try:
-        if not body.selectedFiles:
-            raise HTTPException(status_code=400, detail="selectedFiles cannot be empty")
+        # Read the ZIP directory off the event loop and start the member downloads,
+        # then queue the parse/publish on the store writer (it waits for each member in turn)
+        with timer.activate():
+            downloads = await run_in_threadpool(fetch_selected_members, body)
+            result = await store_writer.run(
+                ingest_selected_zip_files, body, downloads, progress, log_id_start, session_id_start
+            )
+    except HTTPException as e:
+        progress.fail(str(e.detail))
+        raise
+    except Exception as e:
+        progress.fail(str(e))
+        raise
+    progress.finish(result)
+    return finish_timings(timer, {**result, "ingest_id": progress.ingest_id}, timings)
 
-        zip_url = (
-            f"https://cloud-uat-api.ecsiteapp.com/api/s3/ecsite-cloud-uat/"
-            f"{body.companyCode}/{body.siteCode}/ecsOpsTool/decrypted_{body.timestamp_ms}/decryptedLogs.zip"
-        )
 
-        # Fetch the zip
-        resp = requests.get(zip_url, stream=True, allow_redirects=True)
-        if resp.status_code != 200:
-            raise HTTPException(status_code=resp.status_code, detail=f"Failed to fetch zip: {resp.text[:300]}")
+def fetch_selected_members(body: ZipFileSelectionRequest) -> List[Tuple[RemoteZipMember, "Future[bytes]"]]:
+    """
+    Read the central directory of the decrypted logs ZIP and start downloading the
+    selected members (only their compressed bytes, several at a time).
+    Members missing from the archive are skipped.
+    """
+    try:
+        if not body.selectedFiles:
+            raise HTTPException(status_code=400, detail="selectedFiles cannot be empty")
 
-        zip_bytes = io.BytesIO(resp.content)
+        remote = RemoteZip(decrypted_zip_url(body.companyCode, body.siteCode, body.timestamp_ms))
         try:
-            with zipfile.ZipFile(zip_bytes) as zf:
-                global logs_storage, sessions_storage
-                filename_context = f"{body.companyCode}_{body.siteCode}_decrypted.zip"
-
-                # Initialize counters
-                max_existing_log_id = max([log.get("id", 0) for log in logs_storage], default=0)
-                max_existing_session_id = max([session.get("session_id", 0) for session in sessions_storage], default=0)
-
-                device_counters: Dict[str, int] = {}
-                current_device_id = None
-                current_session_id = max_existing_session_id
-                current_session_screens: List[str] = []
-                current_session_start_time = None
-                last_log_time = None
-                global_counter = max_existing_log_id + 1
-                current_session_filename = None  # Track filename for current session
-
-                # Process only selected files
-                for member in body.selectedFiles:
-                    if member not in zf.namelist():
-                        continue  # Skip if file doesn't exist in ZIP
-
-                    try:
-                        content_bytes = zf.read(member)
-                        lines = content_bytes.decode("utf-8", errors="ignore").splitlines()
-                    except Exception as e:
-                        print(f"Error reading {member}: {e}")
-                        continue
-
-                    for line in lines:
-                        if not line.strip():
-                            continue
-
-                        decrypted = line.strip()
-
-                        # Detect DEVICE ID
-                        match = re.search(r"DEVICE ID\s+([A-Z0-9\-]+)", decrypted)
-                        if match:
-                            current_device_id = match.group(1)
-                            if current_device_id not in device_counters:
-                                device_counters[current_device_id] = 1
-                            continue
-
-                        is_entry_log = "LOG-APP" in decrypted and "App Version" in decrypted
-                        is_background = "ECS-ACTIVITY" in decrypted and "App state background" in decrypted
-                        is_active = "ECS-ACTIVITY" in decrypted and "App state active" in decrypted
-                        is_navigate = "ECS-ACTIVITY" in decrypted and "NAVIGATE-TO" in decrypted
-
-                        if is_entry_log:
-                            current_session_id += 1
-                            current_session_screens = []
-                            current_session_start_time = None
-                            current_session_filename = member or filename_context  # Track filename for new session
-
-                        if current_device_id:
-                            time_match = re.match(r"^(\d{2}:\d{2}:\d{2}:\d{2,3})", decrypted)
-                            extracted_time = time_match.group(1) if time_match else None
-
-                            if time_match:
-                                cleaned_message = decrypted[time_match.end():].lstrip(" |")
-                            else:
-                                cleaned_message = decrypted
-
-                            log_entry = {
-                                "id": global_counter,
-                                "device_log_id": device_counters[current_device_id],
-                                "device_id": current_device_id,
-                                "time": extracted_time,
-                                "message": cleaned_message,
-                                "session_id": current_session_id if current_session_id > 0 else 1,
-                                "raw": decrypted,
-                                "filename": member or filename_context,
-                            }
-                            logs_storage.append(log_entry)
-
-                            if extracted_time:
-                                last_log_time = extracted_time
-                                if current_session_start_time is None:
-                                    current_session_start_time = extracted_time
-                            if is_navigate:
-                                screen_match = re.search(r"NAVIGATE-TO\s*:\s*\{\s*screen\s*:\s*([^}\s]+)", decrypted)
-                                if screen_match:
-                                    current_session_screens.append(screen_match.group(1))
-
-                            if is_entry_log and current_session_id > 1:
-                                prev_session_id = current_session_id - 1
-                                prev_logs = [l for l in logs_storage if l["session_id"] == prev_session_id and l["device_id"] == current_device_id]
-                                if prev_logs:
-                                    # Get filename from the logs of previous session
-                                    prev_session_filename = prev_logs[0].get("filename", member or filename_context)
-                                    sessions_storage.append({
-                                        "device_id": current_device_id,
-                                        "session_id": prev_session_id,
-                                        "start_time": prev_logs[0].get("time"),
-                                        "end_time": prev_logs[-1].get("time"),
-                                        "entries_count": len(prev_logs),
-                                        "screens": [s for s in current_session_screens[:-1]] if len(current_session_screens) > 0 else [],
-                                        "filename": prev_session_filename,
-                                    })
-
-                            device_counters[current_device_id] += 1
-                            global_counter += 1
-
-                # Finalize last session summary
-                if current_session_id >= 1 and current_device_id:
-                    last_session_logs = [l for l in logs_storage if l["session_id"] == current_session_id and l["device_id"] == current_device_id]
-                    if last_session_logs:
-                        # Get filename from the logs of the last session
-                        last_session_filename = last_session_logs[0].get("filename", current_session_filename or filename_context)
-                        sessions_storage.append({
-                            "device_id": current_device_id,
-                            "session_id": current_session_id,
-                            "start_time": last_session_logs[0].get("time"),
-                            "end_time": last_session_logs[-1].get("time"),
-                            "entries_count": len(last_session_logs),
-                            "screens": current_session_screens,
-                            "filename": last_session_filename,
-                        })
-
-            return {
-                "message": "Selected files processed successfully",
-                "total_logs": len(logs_storage),
-                "total_sessions": len(sessions_storage),
-                "processed_files": body.selectedFiles
-            }
+            with timed_stage("download"):
+                members = {member.name: member for member in remote.members()}
+        except RemoteZipError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         except zipfile.BadZipFile:
             raise HTTPException(status_code=400, detail="Downloaded file is not a valid zip")
 
+        selected = [members[name] for name in body.selectedFiles if name in members]
+        return list(zip(selected, remote.fetch_members(selected)))
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def ingest_selected_zip_files(
+    body: ZipFileSelectionRequest,
+    downloads: List[Tuple[RemoteZipMember, "Future[bytes]"]],
+    progress,
+    log_id_start: int = None,
+    session_id_start: int = None,
+):
+    """
+    Parse each selected member of the ZIP into its own segment and publish them together.
+    Members are inflated straight into the parser as their download completes.
+    Members that are missing or cannot be read are left out and listed in file_errors.
+    Runs on the store writer thread.
+    """
+    try:
+        filename_context = f"{body.companyCode}_{body.siteCode}_decrypted.zip"
+        fetched = {member.name for member, _ in downloads}
+        file_errors = [
+            {"filename": name, "error": "Not found in the archive"} for name in body.selectedFiles if name not in fetched
+        ]
+
+        # Members are numbered one after another and published in one step at the end
+        parsed_files = []
+        processed = []
+        if log_id_start is None:
+            log_id_start = log_store.next_log_id
+        if session_id_start is None:
+            session_id_start = log_store.last_session_id
+        for member, download in downloads:
+            progress.set_file(member.name)
+            with timed_stage("download"):
+                compressed = download.result()
+            parser = LogFileParser(
+                member.name or filename_context,
+                decrypt=False,  # ZIP members are already decrypted
+                log_id_start=log_id_start,
+                session_id_start=session_id_start,
+                progress=progress,
+            )
+            try:
+                with MemberReader(member, compressed) as member_file:
+                    parser.feed_lines(iter_text_lines(member_file, progress, errors="ignore"))
+            except Exception as e:
+                file_errors.append({"filename": member.name, "error": str(e)})
+                continue
+            parsed = parser.finish()
+            parsed_files.append(parsed)
+            processed.append(member.name)
+            log_id_start = parser.next_log_id
+            session_id_start = parsed.last_session_id
+        publish_parsed_files(parsed_files)
+
+        snapshot = log_store.snapshot()
+        return {
+            "message": "Selected files processed successfully",
+            "total_logs": snapshot.log_count(),
+            "total_sessions": snapshot.session_count(),
+            "processed_files": processed,
+            "file_errors": file_errors,
+            "next_log_id": log_id_start,
+            "last_session_id": session_id_start,
+        }
+
+    except RemoteZipError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Downloaded file is not a valid zip")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for _, download in downloads:
+            download.cancel()
+
+
+# ----------------- Ingest Progress -----------------
+@app.get("/ingest/{ingest_id}/events")
+async def stream_ingest_events(ingest_id: str):
+    """
+    Server-sent events stream of ingest progress.
+    The stream may be opened before the upload starts: it waits up to
+    START_WAIT_SECONDS for the ingest to appear, else it ends with an error event.
+    It ends after the final summary (or error) event.
+    """
+
+    async def event_stream():
+        progress = ingest_progress.get(ingest_id)
+        deadline = time.monotonic() + START_WAIT_SECONDS
+        while progress is None:
+            if time.monotonic() >= deadline:
+                yield format_sse({"event": "error", "ingest_id": ingest_id, "error": "Ingest not found"})
+                return
+            await asyncio.sleep(0.2)
+            progress = ingest_progress.get(ingest_id)
+
+        sent = 0
+        while True:
+            events = progress.events_since(sent)
+            for event in events:
+                yield format_sse(event)
+            sent += len(events)
+            if progress.done and not progress.events_since(sent):
+                break
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/ingest/{ingest_id}")
+async def get_ingest_status(ingest_id: str):
+    """
+    Latest progress snapshot of an ingest (for clients that cannot use SSE).
+    """
+    progress = ingest_progress.get(ingest_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Ingest not found")
+    return progress.snapshot()
+
+
+# ----------------- Time Range Filters -----------------
+TIME_FROM_QUERY = Query(None, description="Only rows at or after this time: ms as in time_ms, or HH:MM:SS:MMM on the first day of each file")
+TIME_TO_QUERY = Query(None, description="Only rows at or before this time: ms as in time_ms, or HH:MM:SS:MMM on the first day of each file")
+
+
+def parse_time_bound(value: Optional[str], name: str) -> Optional[int]:
+    """
+    A time_from/time_to parameter in ms (see time_ms); None when not given.
+    time_ms is relative to each file, so the bound applies to every file's own first day.
+    """
+    if value is None or value == "":
+        return None
+    if value.isdigit():
+        return int(value)
+    time_ms = time_to_ms(value)
+    if time_ms is None:
+        raise HTTPException(status_code=400, detail=f"{name} must be milliseconds or a HH:MM:SS:MMM time")
+    return time_ms
+
+
 # ----------------- Get All Logs -----------------  
 @app.get("/logs")
-async def get_logs(device_id: str = None):
+async def get_logs(device_id: str = None, time_from: Optional[str] = TIME_FROM_QUERY, time_to: Optional[str] = TIME_TO_QUERY):
     """
-    Get all logs (optionally filter by device_id).
+    Get all logs (optionally filter by device_id and time range).
     """
-    if device_id:
-        filtered_logs = [log for log in logs_storage if log["device_id"] == device_id]
-        return {"logs": filtered_logs}
-    return {"logs": logs_storage}
+    snapshot = log_store.snapshot()
+    time_from, time_to = parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to")
+    if time_from is not None or time_to is not None:
+        filtered_logs = snapshot.iter_logs_in_time(time_from, time_to)
+        if device_id:
+            filtered_logs = (log for log in filtered_logs if log["device_id"] == device_id)
+        filtered_logs = list(filtered_logs)
+    elif device_id:
+        filtered_logs = [log for log in snapshot.iter_logs() if log["device_id"] == device_id]
+    else:
+        filtered_logs = snapshot.logs()
+    set_rows_returned(len(filtered_logs))
+    return {"logs": filtered_logs}
     
 
 # ----------------- Get Paginated Logs -----------------
@@ -1347,23 +1823,32 @@ async def get_paginated_logs(
     per_page: int = Query(250, ge=1, le=1000),
     device_id: str = None,
     session_id: int = None,
+    time_from: Optional[str] = TIME_FROM_QUERY,
+    time_to: Optional[str] = TIME_TO_QUERY,
 ):
     """
-    Get logs with pagination (optionally filter by device_id or session_id).
+    Get logs with pagination (optionally filter by device_id, session_id or time range).
     """
-    filtered_logs = logs_storage
-    
-    if device_id:
-        filtered_logs = [log for log in filtered_logs if log["device_id"] == device_id]
-    
-    if session_id is not None:
-        filtered_logs = [log for log in filtered_logs if log["session_id"] == session_id]
-
-    total = len(filtered_logs)
     start = (page - 1) * per_page
     end = start + per_page
-    paginated_logs = filtered_logs[start:end]
+    snapshot = log_store.snapshot()
+    time_from, time_to = parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to")
 
+    if device_id is None and session_id is None and time_from is None and time_to is None:
+        # No filter: slice straight out of the segments without building a full list
+        total = snapshot.log_count()
+        paginated_logs = snapshot.slice_logs(start, end)
+    else:
+        filtered_logs = snapshot.iter_logs_in_time(time_from, time_to)
+        if device_id:
+            filtered_logs = (log for log in filtered_logs if log["device_id"] == device_id)
+        if session_id is not None:
+            filtered_logs = (log for log in filtered_logs if log["session_id"] == session_id)
+        filtered_logs = list(filtered_logs)
+        total = len(filtered_logs)
+        paginated_logs = filtered_logs[start:end]
+
+    set_rows_returned(len(paginated_logs))
     return {
         "metadata": {
             "total_logs": total,
@@ -1377,13 +1862,23 @@ async def get_paginated_logs(
 
 # ----------------- Sessions Endpoints -----------------
 @app.get("/sessions")
-async def get_sessions(device_id: str = None):
+async def get_sessions(device_id: str = None, time_from: Optional[str] = TIME_FROM_QUERY, time_to: Optional[str] = TIME_TO_QUERY):
     """
-    Return list of session summaries, optionally filtered by device_id.
+    Return list of session summaries, optionally filtered by device_id and by
+    time range (sessions overlapping it), with duration statistics.
     """
+    sessions = log_store.snapshot().sessions_in_time(
+        parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to")
+    )
     if device_id:
-        return {"sessions": [s for s in sessions_storage if s["device_id"] == device_id]}
-    return {"sessions": sessions_storage}
+        sessions = [s for s in sessions if s["device_id"] == device_id]
+    set_rows_returned(len(sessions))
+    return {"sessions": sessions, "duration": session_duration_stats(sessions)}
+
+
+def session_duration_stats(sessions):
+    """Statistics of the sessions' duration_ms (sessions without times are left out)."""
+    return duration_stats([s["duration_ms"] for s in sessions if s.get("duration_ms") is not None])
 
 
 @app.get("/sessions/paginated")
@@ -1391,17 +1886,23 @@ async def get_sessions_paginated(
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100),
     device_id: str = None,
+    time_from: Optional[str] = TIME_FROM_QUERY,
+    time_to: Optional[str] = TIME_TO_QUERY,
 ):
+    sessions = log_store.snapshot().sessions_in_time(
+        parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to")
+    )
     if device_id:
-        filtered = [s for s in sessions_storage if s["device_id"] == device_id]
+        filtered = [s for s in sessions if s["device_id"] == device_id]
     else:
-        filtered = sessions_storage
+        filtered = sessions
 
     total = len(filtered)
     start = (page - 1) * per_page
     end = start + per_page
     page_items = filtered[start:end]
 
+    set_rows_returned(len(page_items))
     return {
         "metadata": {
             "total_sessions": total,
@@ -1417,14 +1918,10 @@ async def get_sessions_paginated(
 @app.get("/logs/files")
 async def get_log_files():
     """
-    Get list of unique filenames from logs_storage.
+    Get list of unique filenames from the store catalog.
     Returns list of all files that have been uploaded and processed.
     """
-    unique_files = set()
-    for log in logs_storage:
-        filename = log.get("filename")
-        if filename:
-            unique_files.add(filename)
+    unique_files = set(filename for filename in log_store.snapshot().filenames() if filename)
     
     # Return as sorted list
     return {
@@ -1433,68 +1930,23 @@ async def get_log_files():
     }
 
 
-# ----------------- Get Raw Log File by Filename -----------------
-@app.get("/logs/raw/file")
-async def get_raw_log_file_by_filename(filename: str = Query(..., description="Name of the log file")):
-    """
-    Get full raw log file content for a specific filename.
-    Returns all logs for that file in raw format (timestamp | level: message).
-    """
-    filtered_logs = [log for log in logs_storage if log.get("filename") == filename]
-    
-    if not filtered_logs:
-        raise HTTPException(status_code=404, detail=f"No logs found for file: {filename}")
-    
-    # Format logs in raw file format: timestamp | level: message
+# ----------------- Raw Log Formatting -----------------
+def format_raw_log_content(logs) -> str:
+    """Format logs in raw file format: timestamp | level: message (one per line)."""
     raw_content = []
-    for log in filtered_logs:
+    for log in logs:
         timestamp = log.get("time", "") or ""
         message = log.get("message", "")
         
-        # Extract log level from message
-        message_upper = message.upper()
-        if "ERROR" in message_upper or "EXCEPTION" in message_upper:
-            level = "ERROR"
-        elif "WARNING" in message_upper or "WARN" in message_upper:
-            level = "WARNING"
-        elif "INFO" in message_upper:
-            level = "INFO"
-        elif "DEBUG" in message_upper:
-            level = "DEBUG"
-        else:
-            level = "INFO"
+        # Log level keyword of the message (INFO when there is none)
+        level = lex_message(message).level or INFO
         
         # Format: timestamp | level: message
         if timestamp:
             raw_content.append(f"{timestamp} | {level}: {message}")
         else:
             raw_content.append(f"{level}: {message}")
-    
-    return {
-        "content": "\n".join(raw_content),
-        "total_logs": len(filtered_logs),
-        "filename": filename
-    }
-
-
-# ----------------- Get List of Log Files -----------------
-@app.get("/logs/files")
-async def get_log_files():
-    """
-    Get list of unique filenames from logs_storage.
-    Returns list of all files that have been uploaded and processed.
-    """
-    unique_files = set()
-    for log in logs_storage:
-        filename = log.get("filename")
-        if filename:
-            unique_files.add(filename)
-    
-    # Return as sorted list
-    return {
-        "files": sorted(list(unique_files)),
-        "total_files": len(unique_files)
-    }
+    return "\n".join(raw_content)
 
 
 # ----------------- Get Raw Log File by Filename -----------------
@@ -1504,38 +1956,14 @@ async def get_raw_log_file_by_filename(filename: str = Query(..., description="N
     Get full raw log file content for a specific filename.
     Returns all logs for that file in raw format (timestamp | level: message).
     """
-    filtered_logs = [log for log in logs_storage if log.get("filename") == filename]
+    filtered_logs = log_store.snapshot().logs(filename)
     
     if not filtered_logs:
         raise HTTPException(status_code=404, detail=f"No logs found for file: {filename}")
     
-    # Format logs in raw file format: timestamp | level: message
-    raw_content = []
-    for log in filtered_logs:
-        timestamp = log.get("time", "") or ""
-        message = log.get("message", "")
-        
-        # Extract log level from message
-        message_upper = message.upper()
-        if "ERROR" in message_upper or "EXCEPTION" in message_upper:
-            level = "ERROR"
-        elif "WARNING" in message_upper or "WARN" in message_upper:
-            level = "WARNING"
-        elif "INFO" in message_upper:
-            level = "INFO"
-        elif "DEBUG" in message_upper:
-            level = "DEBUG"
-        else:
-            level = "INFO"
-        
-        # Format: timestamp | level: message
-        if timestamp:
-            raw_content.append(f"{timestamp} | {level}: {message}")
-        else:
-            raw_content.append(f"{level}: {message}")
-    
+    set_rows_returned(len(filtered_logs))
     return {
-        "content": "\n".join(raw_content),
+        "content": format_raw_log_content(filtered_logs),
         "total_logs": len(filtered_logs),
         "filename": filename
     }
@@ -1549,38 +1977,15 @@ async def get_raw_log_file(session_id: int = None):
     Returns all logs in raw format (timestamp | level: message).
     Optionally filter by session_id.
     """
-    filtered_logs = logs_storage
-    
+    snapshot = log_store.snapshot()
     if session_id is not None:
-        filtered_logs = [log for log in logs_storage if log.get("session_id") == session_id]
-    
-    # Format logs in raw file format: timestamp | level: message
-    raw_content = []
-    for log in filtered_logs:
-        timestamp = log.get("time", "") or ""
-        message = log.get("message", "")
-        
-        # Extract log level from message
-        message_upper = message.upper()
-        if "ERROR" in message_upper or "EXCEPTION" in message_upper:
-            level = "ERROR"
-        elif "WARNING" in message_upper or "WARN" in message_upper:
-            level = "WARNING"
-        elif "INFO" in message_upper:
-            level = "INFO"
-        elif "DEBUG" in message_upper:
-            level = "DEBUG"
-        else:
-            level = "INFO"
-        
-        # Format: timestamp | level: message
-        if timestamp:
-            raw_content.append(f"{timestamp} | {level}: {message}")
-        else:
-            raw_content.append(f"{level}: {message}")
+        filtered_logs = [log for log in snapshot.iter_logs() if log.get("session_id") == session_id]
+    else:
+        filtered_logs = snapshot.logs()
     
+    set_rows_returned(len(filtered_logs))
     return {
-        "content": "\n".join(raw_content),
+        "content": format_raw_log_content(filtered_logs),
         "total_logs": len(filtered_logs)
     }
 
@@ -1591,7 +1996,7 @@ async def get_log(log_id: int):
     """
     Get details of a single log entry by its unique ID.
     """
-    log = next((log for log in logs_storage if log["id"] == log_id), None)
+    log = log_store.snapshot().get_log(log_id)
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
     return log
@@ -1603,30 +2008,62 @@ async def get_device_stats():
     """
     Get statistics about devices and their log counts.
     """
-    device_stats = {}
-    for log in logs_storage:
-        device_id = log["device_id"]
-        if device_id not in device_stats:
-            device_stats[device_id] = {
-                "device_id": device_id,
-                "total_logs": 0,
-                "error_count": 0,
-                "warning_count": 0,
-                "info_count": 0,
-            }
-        
-        device_stats[device_id]["total_logs"] += 1
-        
-        # Count log levels
-        message = log["message"].upper()
-        if "ERROR" in message or "EXCEPTION" in message:
-            device_stats[device_id]["error_count"] += 1
-        elif "WARNING" in message or "WARN" in message:
-            device_stats[device_id]["warning_count"] += 1
-        else:
-            device_stats[device_id]["info_count"] += 1
-    
-    return {"devices": list(device_stats.values())}
+    snapshot = log_store.snapshot()
+    return result_cache.get_or_compute("stats/devices", {}, snapshot.generation, lambda: compute_device_stats(snapshot))
+
+
+def compute_device_stats(snapshot):
+    """Count logs per device, split by level (from the segments' level columns)."""
+    devices = []
+    for device_id, counts in device_level_counts(snapshot.segments()).items():
+        error_count, warning_count, info_count, debug_count = counts.tolist()
+        devices.append({
+            "device_id": device_id,
+            "total_logs": error_count + warning_count + info_count + debug_count,
+            "error_count": error_count,
+            "warning_count": warning_count,
+            "info_count": info_count + debug_count,
+        })
+    return {"devices": devices}
+
+
+@app.get("/stats/timeline")
+async def get_timeline(
+    bucket_ms: int = Query(60000, ge=1, description="Bucket width in ms"),
+    group_by: Optional[str] = Query(None, description="Split into series by device and/or file, comma separated"),
+    device_id: str = None,
+    filename: str = None,
+    time_from: Optional[str] = TIME_FROM_QUERY,
+    time_to: Optional[str] = TIME_TO_QUERY,
+):
+    """
+    Log counts per time bucket (by time_ms), split by level and optionally by
+    device and/or file, in columnar form: one list of bucket start times and,
+    per series, one list of counts per level aligned with it. time_ms is relative
+    to each file, so files from different days are overlaid on one axis; pass
+    filename to chart a single file.
+    """
+    groups = parse_timeline_groups(group_by)
+    time_from, time_to = parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to")
+    snapshot = log_store.snapshot()
+    try:
+        return result_cache.get_or_compute(
+            "stats/timeline",
+            {"bucket_ms": bucket_ms, "group_by": ",".join(groups), "device_id": device_id, "filename": filename,
+             "time_from": time_from, "time_to": time_to},
+            snapshot.generation,
+            lambda: compute_timeline(snapshot.segments(filename), bucket_ms, groups, device_id, time_from, time_to),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def parse_timeline_groups(group_by: Optional[str]) -> List[str]:
+    groups = [name.strip() for name in (group_by or "").split(",") if name.strip()]
+    unknown = [name for name in groups if name not in TIMELINE_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"group_by must be one or both of {', '.join(TIMELINE_GROUPS)}")
+    return list(dict.fromkeys(groups))
 
 
 # ----------------- Flowchart Data Processing -----------------
@@ -1646,22 +2083,20 @@ def normalize_logs_by_session_device(logs):
     current_session_indices: list[int] = []
     
     for log in logs:
-        message = log.get("message", "")
+        token = lex_message(log.get("message", ""))
         
         # Session starts at App Version entry
-        if re.search(r"LOG-APP.*App Version", message):
+        if token.kind == ENTRY:
             in_session = True
             current_session_device_id = None
             current_session_indices = []
         
         # Capture device id within a session
-        if in_session and re.search(r"LOG-DEVICE-INFO\s*:\s*DEVICE ID\s+", message, re.IGNORECASE):
-            device_match = re.search(r"DEVICE ID\s+([A-Z0-9-]+)", message, re.IGNORECASE)
-            if device_match and device_match.group(1):
-                current_session_device_id = device_match.group(1)
-                # Backfill device_id to all logs already seen in this session
-                for idx in current_session_indices:
-                    normalized_logs[idx]["device_id"] = current_session_device_id
+        if in_session and token.kind == DEVICE:
+            current_session_device_id = token.device_id
+            # Backfill device_id to all logs already seen in this session
+            for idx in current_session_indices:
+                normalized_logs[idx]["device_id"] = current_session_device_id
         
         # Assign device id for this log
         normalized_log = log.copy()
@@ -1680,26 +2115,40 @@ def generate_flowchart_data(logs):
     Generate scalable flowchart data from logs with advanced navigation analysis.
     Handles complex patterns: loops, multiple sessions, bidirectional flows.
     """
+    return finalize_flowchart(build_flowchart_partial(logs))
+
+
+def build_flowchart_partial(logs):
+    """
+    Screen and transition counts of a set of logs, before any derived statistics.
+    Partials of disjoint sets of sessions merge additively (merge_flowchart_partials),
+    which is how a coordinator combines shards.
+    """
     if not logs:
-        return {"nodes": [], "edges": []}
+        return {"sessions": [], "login_sessions": [], "screens": {}, "transitions": [], "session_durations_ms": []}
 
     normalized_logs = normalize_logs_by_session_device(logs)
+    tokens = [lex_message(log.get("message", "")) for log in normalized_logs]
 
     # Extract all unique screens and their metadata
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
     screen_data = {}  # screen_name -> {count, sessions, first_seen, last_seen}
     transition_matrix = {}  # (from_screen, to_screen) -> {count, sessions, avg_events}
-    login_pattern = r"LOG-APP.*Model Name"
+    # Time columns for the dwell times: session and time_ms of every row, (row, screen)
+    # of every navigation and the row of each session's first login
+    row_sessions, row_times, navigations, logins = [], [], [], {}
     
     # Analyze each log entry
-    for log in normalized_logs:
-        message = log.get("message", "")
+    for index, (log, token) in enumerate(zip(normalized_logs, tokens)):
         session_id = log.get("session_id", 0)
         timestamp = log.get("time", "")
+        row_sessions.append(session_id)
+        row_times.append(log.get("time_ms"))
         
-        screen_match = re.search(screen_pattern, message)
-        if screen_match:
-            screen_name = screen_match.group(1).strip()
+        if token.kind == LOGIN and session_id not in logins:
+            logins[session_id] = index
+        if token.kind == NAVIGATE:
+            screen_name = token.screen
+            navigations.append((index, screen_name))
             
             # Track screen metadata
             if screen_name not in screen_data:
@@ -1707,42 +2156,35 @@ def generate_flowchart_data(logs):
                     "count": 0,
                     "sessions": set(),
                     "first_seen": timestamp,
-                    "last_seen": timestamp
+                    "last_seen": timestamp,
+                    "first_id": log.get("id"),
+                    "last_id": log.get("id"),
                 }
             
             screen_data[screen_name]["count"] += 1
             screen_data[screen_name]["sessions"].add(session_id)
             screen_data[screen_name]["last_seen"] = timestamp
+            screen_data[screen_name]["last_id"] = log.get("id")
 
     # Build transition matrix by analyzing session sequences
-    sessions = {}
-    for log in normalized_logs:
+    sessions = {}  # session_id -> tokens of its logs, in order
+    for log, token in zip(normalized_logs, tokens):
         session_id = log.get("session_id", 0)
         if session_id not in sessions:
             sessions[session_id] = []
-        sessions[session_id].append(log)
+        sessions[session_id].append(token)
 
     # Analyze transitions within each session
     login_sessions = set()  # Track sessions with login
-    for session_id, session_logs in sessions.items():
+    for session_id, session_tokens in sessions.items():
         screen_sequence = []
-        screen_timestamps = {}
-        # Track login->home (siteList) per session
         has_login = False
-        first_site_idx = None
         
-        # Extract screen sequence with timestamps and detect login/home boundaries
-        for log in session_logs:
-            message = log.get("message", "")
-            timestamp = log.get("time", "")
-            screen_match = re.search(screen_pattern, message)
-            if screen_match:
-                screen_name = screen_match.group(1).strip()
-                screen_sequence.append(screen_name)
-                screen_timestamps[screen_name] = timestamp
-                if first_site_idx is None and screen_name == "siteList":
-                    first_site_idx = len(session_logs)  # placeholder not used
-            if not has_login and re.search(login_pattern, message):
+        # Extract screen sequence and detect the login
+        for token in session_tokens:
+            if token.kind == NAVIGATE:
+                screen_sequence.append(token.screen)
+            elif not has_login and token.kind == LOGIN:
                 has_login = True  # flag that a login exists in this session
                 login_sessions.add(session_id)
 
@@ -1761,7 +2203,7 @@ def generate_flowchart_data(logs):
                 }
             
             # Count events between these screens in this session
-            events_between = count_events_between_screens(session_logs, from_screen, to_screen)
+            events_between = count_events_between_screens(session_tokens, from_screen, to_screen)
             
             transition_matrix[transition_key]["count"] += 1
             transition_matrix[transition_key]["sessions"].add(session_id)
@@ -1770,9 +2212,9 @@ def generate_flowchart_data(logs):
 
         # Add synthetic Login -> first screen transition (dynamic, not hardcoded)
         if has_login:
-            fs = find_first_screen_after_login(session_logs)
+            fs = find_first_screen_after_login(session_tokens)
             if fs is not None:
-                events_between_login = count_events_login_to_first_screen(session_logs)
+                events_between_login = count_events_login_to_first_screen(session_tokens)
                 transition_key = ("login", fs)
                 if transition_key not in transition_matrix:
                     transition_matrix[transition_key] = {
@@ -1786,6 +2228,89 @@ def generate_flowchart_data(logs):
                 transition_matrix[transition_key]["total_events"] += max(0, events_between_login or 0)
                 transition_matrix[transition_key]["event_counts"].append(max(0, events_between_login or 0))
 
+    # Time spent per screen and per edge, and session durations, in one vectorized pass
+    dwell = compute_dwell(row_sessions, row_times, navigations, logins)
+
+    return {
+        "sessions": sorted(sessions),
+        "login_sessions": sorted(login_sessions),
+        "screens": {
+            name: {**data, "sessions": sorted(data["sessions"]), "dwell_ms": dwell["screens"].get(name, [])}
+            for name, data in screen_data.items()
+        },
+        "transitions": [
+            {
+                "from": from_screen, "to": to_screen, **data, "sessions": sorted(data["sessions"]),
+                "dwell_ms": dwell["transitions"].get((from_screen, to_screen), []),
+            }
+            for (from_screen, to_screen), data in transition_matrix.items()
+        ],
+        "session_durations_ms": list(dwell["session_durations"].values()),
+    }
+
+
+def merge_flowchart_partials(partials):
+    """Combine partials computed over disjoint sessions (e.g. one per shard)."""
+    sessions = set()
+    login_sessions = set()
+    screen_data = {}
+    transition_matrix = {}
+    session_durations = []
+    for partial in partials:
+        sessions.update(partial["sessions"])
+        login_sessions.update(partial["login_sessions"])
+        session_durations.extend(partial["session_durations_ms"])
+        for name, data in partial["screens"].items():
+            merged = screen_data.get(name)
+            if merged is None:
+                screen_data[name] = {**data, "sessions": list(data["sessions"]), "dwell_ms": list(data["dwell_ms"])}
+                continue
+            merged["count"] += data["count"]
+            merged["sessions"].extend(data["sessions"])
+            merged["dwell_ms"].extend(data["dwell_ms"])
+            # first/last seen follow the global (id) order of the logs
+            if data["first_id"] < merged["first_id"]:
+                merged["first_id"], merged["first_seen"] = data["first_id"], data["first_seen"]
+            if data["last_id"] > merged["last_id"]:
+                merged["last_id"], merged["last_seen"] = data["last_id"], data["last_seen"]
+        for transition in partial["transitions"]:
+            key = (transition["from"], transition["to"])
+            merged = transition_matrix.get(key)
+            if merged is None:
+                transition_matrix[key] = {
+                    **transition,
+                    "sessions": list(transition["sessions"]),
+                    "event_counts": list(transition["event_counts"]),
+                    "dwell_ms": list(transition["dwell_ms"]),
+                }
+                continue
+            merged["count"] += transition["count"]
+            merged["sessions"].extend(transition["sessions"])
+            merged["total_events"] += transition["total_events"]
+            merged["event_counts"].extend(transition["event_counts"])
+            merged["dwell_ms"].extend(transition["dwell_ms"])
+    return {
+        "sessions": sorted(sessions),
+        "login_sessions": sorted(login_sessions),
+        "screens": screen_data,
+        "transitions": list(transition_matrix.values()),
+        "session_durations_ms": session_durations,
+    }
+
+
+def finalize_flowchart(partial):
+    """Turn a (possibly merged) flowchart partial into nodes, edges and metadata."""
+    if not partial["sessions"]:
+        return {"nodes": [], "edges": []}
+
+    sessions = partial["sessions"]
+    login_sessions = partial["login_sessions"]
+    screen_data = {name: {**data, "sessions": set(data["sessions"])} for name, data in partial["screens"].items()}
+    transition_matrix = {
+        (transition["from"], transition["to"]): {**transition, "sessions": set(transition["sessions"])}
+        for transition in partial["transitions"]
+    }
+
     # Calculate transition statistics
     for transition_key, data in transition_matrix.items():
         data["avg_events"] = data["total_events"] / data["count"] if data["count"] > 0 else 0
@@ -1813,7 +2338,8 @@ def generate_flowchart_data(logs):
             "session_count": len(data["sessions"]),
             "frequency": len(data["sessions"]) / len(sessions) if sessions else 0,
             "first_seen": data["first_seen"],
-            "last_seen": data["last_seen"]
+            "last_seen": data["last_seen"],
+            "dwell": duration_stats(data["dwell_ms"]),
         })
 
     if login_sessions:
@@ -1826,6 +2352,11 @@ def generate_flowchart_data(logs):
             "frequency": len(login_sessions) / len(sessions) if sessions else 0,
             "first_seen": None,
             "last_seen": None,
+            # Time from the login to the first screen
+            "dwell": duration_stats([
+                sample for (from_screen, _), data in transition_matrix.items() if from_screen == "login"
+                for sample in data["dwell_ms"]
+            ]),
         })
 
     # Create edges with enhanced metadata
@@ -1838,7 +2369,9 @@ def generate_flowchart_data(logs):
             "avg_events": round(data["avg_events"], 1),
             "session_count": data["session_count"],
             "frequency": round(data["frequency"], 2),
-            "strength": calculate_transition_strength(data)
+            "strength": calculate_transition_strength(data),
+            # Time spent on the source screen before moving to the target
+            "dwell": duration_stats(data["dwell_ms"]),
         })
 
     return {
@@ -1848,100 +2381,71 @@ def generate_flowchart_data(logs):
             "total_sessions": len(sessions),
             "total_screens": len(screen_data),
             "total_transitions": len(transition_matrix),
-            "has_loops": detect_loops(transition_matrix)
+            "has_loops": detect_loops(transition_matrix),
+            "session_duration": duration_stats(partial["session_durations_ms"]),
         }
     }
 
 
-def count_events_between_screens(session_logs, from_screen, to_screen):
-    """Count events between two specific screens in a session."""
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
+def count_events_between_screens(session_tokens, from_screen, to_screen):
+    """Count events between two specific screens in a session (tokens of its logs, in order)."""
     # Special case: login -> any specific screen
     if from_screen == "login":
-        value = count_events_login_to_specific_screen(session_logs, to_screen)
+        value = count_events_login_to_specific_screen(session_tokens, to_screen)
         return 0 if value is None else max(0, value)
     start_idx = None
     event_count = 0
     
-    for i, log in enumerate(session_logs):
-        message = log.get("message", "")
-        screen_match = re.search(screen_pattern, message)
-        if screen_match:
-            current_screen = screen_match.group(1).strip()
-            if start_idx is None and current_screen == from_screen:
+    for i, token in enumerate(session_tokens):
+        if token.kind == NAVIGATE:
+            if start_idx is None and token.screen == from_screen:
                 start_idx = i
-            elif start_idx is not None and current_screen == to_screen:
+            elif start_idx is not None and token.screen == to_screen:
                 event_count = i - start_idx - 1
                 break
     
     return max(0, event_count)
 
 
-def find_first_screen_after_login(session_logs):
+def find_first_screen_after_login(session_tokens):
     """Return the first NAVIGATE-TO screen name after login within a session, if any."""
-    login_pattern = r"LOG-APP.*Model Name"
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
     saw_login = False
-    for log in session_logs:
-        msg = log.get("message", "")
-        if not saw_login and re.search(login_pattern, msg):
+    for token in session_tokens:
+        if not saw_login and token.kind == LOGIN:
             saw_login = True
             continue
-        if saw_login:
-            m = re.search(screen_pattern, msg)
-            if m:
-                return m.group(1).strip()
+        if saw_login and token.kind == NAVIGATE:
+            return token.screen
     return None
 
 
-def count_events_login_to_first_screen(session_logs):
+def count_events_login_to_first_screen(session_tokens):
     """Count events from login to the first NAVIGATE-TO of any screen within the session."""
-    login_pattern = r"LOG-APP.*Model Name"
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
-    saw_login = False
-    start_index = None
-    for i, log in enumerate(session_logs):
-        msg = log.get("message", "")
-        if not saw_login and re.search(login_pattern, msg):
-            saw_login = True
-            start_index = i
-            continue
-        if saw_login:
-            m = re.search(screen_pattern, msg)
-            if m:
-                return i - start_index - 1
-    if saw_login and start_index is not None:
-        return len(session_logs) - start_index - 1
-    return None
+    return count_events_login_to_specific_screen(session_tokens, None)
 
 
-def count_events_login_to_specific_screen(session_logs, target_screen: str):
-    """Count events from login to the first occurrence of the given target NAVIGATE-TO screen."""
-    if not target_screen:
-        return count_events_login_to_first_screen(session_logs)
-    login_pattern = r"LOG-APP.*Model Name"
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
-    saw_login = False
+def count_events_login_to_specific_screen(session_tokens, target_screen: Optional[str]):
+    """
+    Count events from login to the first occurrence of the given target NAVIGATE-TO screen
+    (any screen when target_screen is empty). Without that screen, events up to the session end.
+    """
     start_index = None
-    for i, log in enumerate(session_logs):
-        msg = log.get("message", "")
-        if not saw_login and re.search(login_pattern, msg):
-            saw_login = True
-            start_index = i
-            continue
-        if saw_login:
-            m = re.search(screen_pattern, msg)
-            if m and m.group(1).strip() == target_screen:
-                return i - start_index - 1
-    if saw_login and start_index is not None:
-        return len(session_logs) - start_index - 1
+    for i, token in enumerate(session_tokens):
+        if start_index is None:
+            if token.kind == LOGIN:
+                start_index = i
+        elif token.kind == NAVIGATE and (not target_screen or token.screen == target_screen):
+            return i - start_index - 1
+    if start_index is not None:
+        return len(session_tokens) - start_index - 1
     return None
 
 
 def calculate_transition_strength(data):
     """Calculate transition strength based on frequency and consistency."""
     frequency_score = data["frequency"] * 10  # 0-10 scale
-    consistency_score = 1 - (max(data["event_counts"]) - min(data["event_counts"])) / max(data["event_counts"]) if data["event_counts"] else 1
+    # All-zero counts (screens with no events in between) are perfectly consistent
+    consistency_score = 1 - (max(data["event_counts"]) - min(data["event_counts"])) / max(data["event_counts"]) if data["event_counts"] and max(data["event_counts"]) > 0 else 1
     return min(10, round(frequency_score + consistency_score, 1))
 
 
@@ -1954,87 +2458,183 @@ def detect_loops(transition_matrix):
     return False
 
 
-def get_events_for_edge(logs, from_state, to_state):
+def session_device_ids(logs):
     """
-    Get events between two screens for the events panel.
-    Uses dynamic screen detection from NAVIGATE-TO entries.
+    Same device normalization as normalize_logs_by_session_device, but returns
+    the normalized device_id of every log instead of copying the logs.
     """
-    normalized_logs = normalize_logs_by_session_device(logs)
-    events = []
-
-    # Dynamic screen pattern
-    screen_pattern = r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)"
-
-    def find_between_screens(logs_seq, from_screen: str, to_screen: str):
-        """Find events between first occurrence of from_screen and next occurrence of to_screen within same session."""
-        start_idx = None
-        current_session = None
-        for i, log in enumerate(logs_seq):
-            msg = log.get("message", "")
-            sid = log.get("session_id")
-            # Reset when session changes
-            if current_session is None:
-                current_session = sid
-            elif sid != current_session:
-                start_idx = None
-                current_session = sid
-            
-            screen_match = re.search(screen_pattern, msg)
-            if screen_match:
-                current_screen = screen_match.group(1).strip()
-                if start_idx is None and current_screen == from_screen:
-                    start_idx = i
-                elif start_idx is not None and current_screen == to_screen:
-                    return logs_seq[start_idx + 1:i]
-        return []
+    device_ids = [log.get("device_id") for log in logs]
+    in_session = False
+    current_session_device_id = None
+    current_session_indices: list[int] = []
 
-    # Handle Login -> any specific screen dynamically
-    if from_state == "login":
-        sessions_map = {}
-        for log in normalized_logs:
-            sessions_map.setdefault(log.get("session_id"), []).append(log)
-        for _sid, s_logs in sessions_map.items():
-            login_idx = None
-            end_idx = None
-            for i, log in enumerate(s_logs):
-                if login_idx is None and re.search(r"LOG-APP.*Model Name", log.get("message", "")):
-                    login_idx = i
-                    continue
-                if login_idx is not None:
-                    m = re.search(screen_pattern, log.get("message", ""))
-                    if m and (to_state is None or m.group(1).strip() == to_state):
-                        end_idx = i
-                        break
-            if login_idx is not None:
-                if end_idx is not None and end_idx > login_idx:
-                    return s_logs[login_idx + 1:end_idx]
-                else:
-                    return s_logs[login_idx + 1:]
-        return []
+    for i, log in enumerate(logs):
+        token = lex_message(log.get("message", ""))
+        if token.kind == ENTRY:
+            in_session = True
+            current_session_device_id = None
+            current_session_indices = []
+        if in_session and token.kind == DEVICE:
+            current_session_device_id = token.device_id
+            for idx in current_session_indices:
+                device_ids[idx] = current_session_device_id
+        if in_session and current_session_device_id:
+            device_ids[i] = current_session_device_id
+        if in_session:
+            current_session_indices.append(i)
+
+    return device_ids
 
-    # Use dynamic screen detection
-    events = find_between_screens(normalized_logs, from_state, to_state)
-    return events
+
+class EdgeOccurrenceIndex:
+    """
+    Per-session rows, navigations and first login of the logs, built in a single pass;
+    the occurrences of an edge are then found from the navigations alone instead of
+    re-scanning the store.
+
+    An occurrence of from -> to starts at a navigation to `from` and ends at the next
+    navigation to `to` in the same session (other screens may come in between); the
+    next one starts at the following navigation to `from`. login -> to runs from the
+    session's first login to the first navigation to `to` after it, or to the end of
+    the session when there is none. The occurrences of each edge are found once and
+    kept, so paging through them with occurrence= is a list lookup.
+    """
+
+    def __init__(self, logs, device_ids):
+        self.logs = logs
+        self.device_ids = device_ids
+        # session_id -> indices into logs, in order
+        self.session_rows: Dict[int, List[int]] = {}
+        # session_id -> [(pos, screen)] of its navigations; pos indexes session_rows[session_id]
+        self.navigations: Dict[int, List[tuple]] = {}
+        # session_id -> pos of its first login (only the first counts, as in the flowchart)
+        self.logins: Dict[int, int] = {}
+        # (from_state, to_state) -> occurrences in all sessions, filled in on first request
+        self.occurrences: Dict[Tuple[str, str], List[tuple]] = {}
+
+        for i, log in enumerate(logs):
+            session_id = log.get("session_id")
+            rows = self.session_rows.setdefault(session_id, [])
+            pos = len(rows)
+            rows.append(i)
+            token = lex_message(log.get("message", ""))
+            if token.kind == NAVIGATE:
+                self.navigations.setdefault(session_id, []).append((pos, token.screen))
+            elif token.kind == LOGIN and session_id not in self.logins:
+                self.logins[session_id] = pos
+
+    def __sizeof__(self):
+        # Only count what the index owns; the log dicts and strings belong to the store
+        size = object.__sizeof__(self) + sys.getsizeof(self.device_ids)
+        for table in (self.session_rows, self.navigations):
+            size += sys.getsizeof(table) + sum(sys.getsizeof(entries) for entries in table.values())
+        size += sum(sys.getsizeof(entry) for entries in self.navigations.values() for entry in entries)
+        size += sys.getsizeof(self.occurrences)
+        size += sum(sys.getsizeof(entries) + len(entries) * sys.getsizeof((0, 0, 0)) for entries in self.occurrences.values())
+        return size + sys.getsizeof(self.logins)
+
+    def edge_occurrences(self, from_state: str, to_state: str, session_id: int = None):
+        """(session_id, start_pos, end_pos) of every occurrence, in row order; end_pos None = session end."""
+        if session_id is not None:
+            # One session's navigations are few; no need to keep them
+            return self._find_occurrences(from_state, to_state, [session_id] if session_id in self.session_rows else [])
+        key = (from_state, to_state)
+        occurrences = self.occurrences.get(key)
+        if occurrences is None:
+            # Concurrent requests may both find them; either list is the same
+            occurrences = self.occurrences.setdefault(key, self._find_occurrences(from_state, to_state, self.session_rows))
+        return occurrences
+
+    def _find_occurrences(self, from_state: str, to_state: str, session_ids) -> List[tuple]:
+        occurrences = []
+        for sid in session_ids:
+            navigations = self.navigations.get(sid, ())
+            if from_state == "login":
+                login = self.logins.get(sid)
+                if login is not None:
+                    end = next((pos for pos, screen in navigations if pos > login and screen == to_state), None)
+                    occurrences.append((sid, login, end))
+                continue
+            start = None
+            for pos, screen in navigations:
+                if start is None:
+                    if screen == from_state:
+                        start = pos
+                elif screen == to_state:
+                    occurrences.append((sid, start, pos))
+                    start = None
+        return occurrences
+
+    def events_for(self, occurrence: tuple):
+        """Normalized copies of the logs strictly between the two ends of an occurrence."""
+        session_id, start_pos, end_pos = occurrence
+        rows = self.session_rows[session_id]
+        events = []
+        for i in rows[start_pos + 1:end_pos]:
+            event = self.logs[i].copy()
+            event["device_id"] = self.device_ids[i]
+            events.append(event)
+        return events
+
+
+def build_edge_index(logs, device_id: str = None):
+    """Edge-occurrence index over all logs, or only those of device_id (after normalization)."""
+    device_ids = session_device_ids(logs)
+    if device_id:
+        keep = [i for i, d in enumerate(device_ids) if d == device_id]
+        logs = [logs[i] for i in keep]
+        device_ids = [device_ids[i] for i in keep]
+    return EdgeOccurrenceIndex(logs, device_ids)
 
 
 @app.get("/flowchart")
-async def get_flowchart_data(device_id: str = None, session_id: int = None):
+async def get_flowchart_data(
+    device_id: str = None,
+    session_id: int = None,
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
     """
     Get flowchart data with nodes and edges, optionally filtered by device_id or session_id.
     """
+    snapshot = log_store.snapshot()
+    timer = StageTimer("flowchart", device_id=device_id, session_id=session_id)
+    with timer.activate():
+        result = result_cache.get_or_compute(
+            "flowchart",
+            {"device_id": device_id, "session_id": session_id},
+            snapshot.generation,
+            lambda: compute_flowchart(snapshot, device_id, session_id),
+        )
+    return finish_timings(timer, result, timings)
+
+
+def compute_flowchart(snapshot, device_id: str = None, session_id: int = None):
+    """Build flowchart data from the stored logs (uncached)."""
+    partial = compute_flowchart_partial(snapshot, device_id, session_id)
+    with timed_stage("finalize"):
+        return finalize_flowchart(partial)
+
+
+def compute_flowchart_partial(snapshot, device_id: str = None, session_id: int = None):
+    """Mergeable flowchart counts of the stored logs (uncached)."""
+    with timed_stage("collect"):
+        logs = snapshot.logs()
+
     # First normalize all logs to ensure device_id is populated
-    normalized_logs = normalize_logs_by_session_device(logs_storage)
+    with timed_stage("normalize"):
+        normalized_logs = normalize_logs_by_session_device(logs)
     
     # Then filter by device_id or session_id
-    if device_id:
-        filtered_logs = [log for log in normalized_logs if log.get("device_id") == device_id]
-    elif session_id:
-        filtered_logs = [log for log in normalized_logs if log.get("session_id") == session_id]
-    else:
-        filtered_logs = normalized_logs
+    with timed_stage("filter"):
+        if device_id:
+            filtered_logs = [log for log in normalized_logs if log.get("device_id") == device_id]
+        elif session_id:
+            filtered_logs = [log for log in normalized_logs if log.get("session_id") == session_id]
+        else:
+            filtered_logs = normalized_logs
     
-    flowchart_data = generate_flowchart_data(filtered_logs)
-    return flowchart_data
+    with timed_stage("build"):
+        return build_flowchart_partial(filtered_logs)
 
 
 @app.get("/flowchart/events")
@@ -2042,24 +2642,41 @@ async def get_flowchart_events(
     from_state: str = Query(..., description="Source state (login, home, site, node)"),
     to_state: str = Query(..., description="Target state (home, site, node, logout)"),
     device_id: str = None,
-    session_id: int = None
+    session_id: int = None,
+    occurrence: int = Query(0, ge=0, description="Which occurrence of the edge to return (0 = first)"),
 ):
     """
     Get events between two states for the events panel.
+    Every occurrence of the edge is indexed; page through them with occurrence=,
+    optionally restricted to one session with session_id=.
     """
-    # First normalize all logs to ensure device_id is populated
-    normalized_logs = normalize_logs_by_session_device(logs_storage)
-    
-    # Then filter by device_id or session_id
-    if device_id:
-        filtered_logs = [log for log in normalized_logs if log.get("device_id") == device_id]
-    elif session_id:
-        filtered_logs = [log for log in normalized_logs if log.get("session_id") == session_id]
-    else:
-        filtered_logs = normalized_logs
-    
-    events = get_events_for_edge(filtered_logs, from_state, to_state)
-    return {"events": events}
+    snapshot = log_store.snapshot()
+    return result_cache.get_or_compute(
+        "flowchart/events",
+        {"from_state": from_state, "to_state": to_state, "device_id": device_id, "session_id": session_id, "occurrence": occurrence},
+        snapshot.generation,
+        lambda: compute_flowchart_events(snapshot, from_state, to_state, device_id, session_id, occurrence),
+    )
+
+
+def compute_flowchart_events(snapshot, from_state: str, to_state: str, device_id: str = None, session_id: int = None, occurrence: int = 0):
+    """Slice the events of one edge occurrence out of the cached edge index (uncached)."""
+    edge_index = result_cache.get_or_compute(
+        "edge-index", {"device_id": device_id}, snapshot.generation, lambda: build_edge_index(snapshot.logs(), device_id)
+    )
+    occurrences = edge_index.edge_occurrences(from_state, to_state, session_id)
+    total = len(occurrences)
+    if occurrence >= total:
+        return {"events": [], "occurrence": occurrence, "total_occurrences": total, "session_id": None, "has_next": False}
+
+    selected = occurrences[occurrence]
+    return {
+        "events": edge_index.events_for(selected),
+        "occurrence": occurrence,
+        "total_occurrences": total,
+        "session_id": selected[0],
+        "has_next": occurrence + 1 < total,
+    }
 
 
 # ----------------- Health Check -----------------
@@ -2068,19 +2685,26 @@ async def debug_login(session_id: int = None):
     """
     Debug endpoint to check login detection.
     """
-    normalized_logs = normalize_logs_by_session_device(logs_storage)
+    snapshot = log_store.snapshot()
+    return result_cache.get_or_compute(
+        "debug/login", {"session_id": session_id}, snapshot.generation, lambda: compute_debug_login(snapshot, session_id)
+    )
+
+
+def compute_debug_login(snapshot, session_id: int = None):
+    """Find login entries in the stored logs (uncached)."""
+    normalized_logs = normalize_logs_by_session_device(snapshot.logs())
     
     if session_id:
         filtered_logs = [log for log in normalized_logs if log.get("session_id") == session_id]
     else:
         filtered_logs = normalized_logs
     
-    login_pattern = r"LOG-APP.*Model Name"
     login_found = []
     
     for log in filtered_logs:
         message = log.get("message", "")
-        if re.search(login_pattern, message):
+        if lex_message(message).kind == LOGIN:
             login_found.append({
                 "session_id": log.get("session_id"),
                 "message": message,
@@ -2088,20 +2712,308 @@ async def debug_login(session_id: int = None):
             })
     
     return {
-        "login_pattern": login_pattern,
+        "login_pattern": "LOG-APP.*Model Name",
         "login_found": login_found,
         "total_logs_checked": len(filtered_logs)
     }
 
 
+# ----------------- Shard Endpoints -----------------
+# Used by a coordinator (coordinator.py) to fetch partial results it can merge across shards.
+@app.get("/shard/logs", include_in_schema=False)
+async def shard_logs(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=0),
+    device_id: str = None,
+    session_id: int = None,
+    filename: str = None,
+    time_from: Optional[str] = TIME_FROM_QUERY,
+    time_to: Optional[str] = TIME_TO_QUERY,
+):
+    """
+    Logs in id order with the same filters as /logs/paginated, but without a page size cap.
+    """
+    snapshot = log_store.snapshot()
+    filtered_logs = snapshot.iter_logs_in_time(
+        parse_time_bound(time_from, "time_from"), parse_time_bound(time_to, "time_to"), filename
+    )
+    if device_id:
+        filtered_logs = (log for log in filtered_logs if log["device_id"] == device_id)
+    if session_id is not None:
+        filtered_logs = (log for log in filtered_logs if log["session_id"] == session_id)
+    filtered_logs = list(filtered_logs)
+    end = None if limit is None else offset + limit
+    return {"total": len(filtered_logs), "logs": filtered_logs[offset:end]}
+
+
+@app.get("/shard/flowchart", include_in_schema=False)
+async def shard_flowchart(device_id: str = None, session_id: int = None):
+    """
+    Flowchart counts before derived statistics (see merge_flowchart_partials).
+    """
+    snapshot = log_store.snapshot()
+    return result_cache.get_or_compute(
+        "shard/flowchart",
+        {"device_id": device_id, "session_id": session_id},
+        snapshot.generation,
+        lambda: compute_flowchart_partial(snapshot, device_id, session_id),
+    )
+
+
+@app.post("/shard/test-results", include_in_schema=False)
+async def shard_test_results(body: Optional[S3SiteRequest] = None):
+    """
+    Parsed testInfo counts of this shard (null when it holds no logs).
+    """
+    processed_files = (body.processed_files if body and body.processed_files else None)
+    snapshot = log_store.snapshot()
+    if snapshot.log_count() == 0:
+        return {"test_results": None}
+    return {"test_results": result_cache.get_or_compute(
+        "test-results",
+        {"processed_files": processed_files},
+        snapshot.generation,
+        lambda: parse_test_results_from_logs(snapshot, processed_files),
+    )}
+
+
 @app.get("/health")
 async def health_check():
     """
     Health check endpoint.
     """
-    return {"status": "healthy", "total_logs": len(logs_storage)}
+    return {"status": "healthy", "total_logs": log_store.log_count()}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters and memory usage of the analytic result cache.
+    """
+    return {"generation": log_store.generation, **result_cache.stats()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Request latency, ingest, upstream, store size, event loop lag and cache metrics
+    of this process in the Prometheus text format.
+    """
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/store/residency")
+async def store_residency():
+    """
+    Memory budget usage of the log store and per-file residency (in memory vs spilled to disk).
+    """
+    return log_store.residency_stats()
+
+
+# ----------------- Admin -----------------
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need ADMIN_TOKEN to be configured and sent as X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    # Compare bytes: compare_digest rejects non-ASCII str, and headers arrive decoded as latin-1
+    if not hmac.compare_digest((x_admin_token or "").encode("latin-1"), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class ProfileArmRequest(BaseModel):
+    requests: int = 1
+    route: Optional[str] = None  # e.g. "/flowchart" or "/logs/{log_id}"; any route when omitted
+    allocations: bool = False  # also record a tracemalloc diff of each profiled request
+
+
+@app.post("/admin/profile/arm", dependencies=[Depends(require_admin)])
+async def arm_profiler(body: ProfileArmRequest):
+    """
+    Profile the next `requests` requests (to `route`, if given).
+    Captures are listed under /admin/profile/captures.
+    """
+    if body.requests < 0:
+        raise HTTPException(status_code=400, detail="requests must be >= 0")
+    request_profiler.arm(body.requests, body.route, body.allocations)
+    return request_profiler.arm_state()
+
+
+@app.delete("/admin/profile/arm", dependencies=[Depends(require_admin)])
+async def disarm_profiler():
+    request_profiler.disarm()
+    return request_profiler.arm_state()
+
+
+@app.get("/admin/profile/captures", dependencies=[Depends(require_admin)])
+async def list_profile_captures():
+    """
+    Recent profile captures, newest first, plus what is currently armed.
+    """
+    return {
+        "armed": request_profiler.arm_state(),
+        "captures": [capture.summary() for capture in reversed(request_profiler.captures)],
+    }
+
+
+@app.get("/admin/profile/captures/{capture_id}", dependencies=[Depends(require_admin)])
+async def get_profile_capture(
+    capture_id: int,
+    format: str = Query("speedscope", description="speedscope, collapsed or allocations"),
+):
+    """
+    One capture as a speedscope profile, collapsed stacks (flamegraph.pl / speedscope
+    import) or its tracemalloc diff.
+    """
+    capture = request_profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail=f"Profile capture {capture_id} not found")
+    if format == "collapsed":
+        return Response(content=capture.collapsed(), media_type="text/plain")
+    if format == "allocations":
+        if capture.allocation_diff is None:
+            raise HTTPException(status_code=404, detail="Capture has no allocation data (arm with allocations=true)")
+        return {
+            **capture.summary(),
+            "peak_traced_bytes": capture.allocation_peak_bytes,
+            "top_allocations": capture.allocation_diff,
+        }
+    if format == "speedscope":
+        return capture.speedscope()
+    raise HTTPException(status_code=400, detail="format must be speedscope, collapsed or allocations")
+
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def list_slow_requests(
+    limit: int = Query(50, ge=1, le=1000),
+    route: str = None,
+    min_duration_ms: float = Query(0, ge=0),
+):
+    """
+    Recorded slow requests, newest first, optionally only those to `route`
+    (a route template such as "/logs/{log_id}") or slower than `min_duration_ms`.
+    """
+    entries = [
+        entry for entry in reversed(slow_requests.entries())
+        if (route is None or entry["route"] == route) and entry["duration_ms"] >= min_duration_ms
+    ]
+    return {
+        "threshold_ms": slow_requests.threshold_ms,
+        "recorded": slow_requests.recorded,
+        "requests": entries[:limit],
+    }
+
+
+@app.delete("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def clear_slow_requests():
+    slow_requests.clear()
+    return {"message": "Slow request log cleared"}
+
+
+class LocalIngestRequest(BaseModel):
+    path: str  # absolute file path or glob under LOCAL_INGEST_ROOTS, e.g. "/data/logs/**/*.log"
+    follow: bool = False  # keep tailing the files (and new matches) after the initial ingest
+    encrypted: Optional[bool] = None  # detected per file when omitted
+
+
+@app.post("/admin/local-ingest", dependencies=[Depends(require_admin)])
+async def ingest_local_files(
+    body: LocalIngestRequest,
+    ingest_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/{ingest_id}/events"),
+    log_id_start: Optional[int] = Query(None, include_in_schema=False),  # set by a coordinator
+    session_id_start: Optional[int] = Query(None, include_in_schema=False),
+    timings: bool = Query(False, description="Include the per-stage timing breakdown"),
+):
+    """
+    Ingest log files that are already on the server's disk (encrypted or decrypted,
+    optionally gzip/zstd compressed), in path order, as one store generation.
+    With follow=true the files keep being tailed: lines appended later are added
+    every LOCAL_FOLLOW_INTERVAL_SECONDS, continuing the open session of each file.
+    """
+    try:
+        paths = await run_in_threadpool(resolve_local_paths, body.path)
+    except LocalIngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    progress = ingest_progress.get_or_create(ingest_id)
+    progress.begin("local", paths)
+    timer = StageTimer("ingest", kind="local", filenames=paths)
+    tailed_files = [TailedFile(path, body.encrypted, progress) for path in paths]
+    try:
+        with timer.activate():
+            result = await store_writer.run(read_local_files, tailed_files, not body.follow, log_id_start, session_id_start)
+    except Exception as e:
+        progress.fail(str(e))
+        raise
+    for tailed in tailed_files:
+        tailed.progress = None
+        if tailed.parser is not None:
+            tailed.parser.progress = None
+    if body.follow:
+        follow = LocalFollow(body.path, tailed_files, body.encrypted)
+        local_follows.add(follow)
+        result["follow_id"] = follow.follow_id
+    progress.finish(result)
+    return finish_timings(timer, {**result, "ingest_id": progress.ingest_id}, timings)
+
+
+@app.get("/admin/local-ingest/follows", dependencies=[Depends(require_admin)])
+async def list_local_follows():
+    """Followed paths with the read offset and rows added per file."""
+    return {"follows": [follow.status() for follow in local_follows.list()]}
+
+
+@app.delete("/admin/local-ingest/follows/{follow_id}", dependencies=[Depends(require_admin)])
+async def stop_local_follow(follow_id: str):
+    """Stop tailing: the remaining lines (including an unterminated last line) are read and the open sessions closed."""
+    follow = local_follows.remove(follow_id)
+    if follow is None:
+        raise HTTPException(status_code=404, detail="Follow not found")
+    result = await store_writer.run(read_local_files, list(follow.files.values()), True, merge_rows=LOCAL_FOLLOW_SEGMENT_ROWS)
+    return {**result, "message": "Follow stopped", "follow_id": follow_id}
+
+
+def poll_local_follow(follow: LocalFollow):
+    """Add the lines appended to the files of a follow since the last poll. Runs on the store writer thread."""
+    if local_follows.get(follow.follow_id) is None:
+        return  # stopped while this poll was queued
+    read_local_files(follow.refresh(), False, merge_rows=LOCAL_FOLLOW_SEGMENT_ROWS)
+
+
+def read_local_files(tailed_files, final: bool, log_id_start: int = None, session_id_start: int = None, merge_rows: int = 0):
+    """
+    Parse the new lines of local files, numbering on from the store (or from the
+    given ids), and publish them in one generation. Runs on the store writer thread.
+    Polls pass merge_rows, so appended lines extend a file's last segment when they can.
+    """
+    next_log_id = log_store.next_log_id if log_id_start is None else log_id_start
+    last_session_id = log_store.last_session_id if session_id_start is None else session_id_start
+    parsed_files = []
+    for tailed in tailed_files:
+        for parsed in tailed.read_new(next_log_id, last_session_id, final):
+            parsed_files.append(parsed)
+            next_log_id = parsed.next_log_id or next_log_id
+            last_session_id = max(last_session_id, parsed.last_session_id)
+    publish_parsed_files(parsed_files, merge_rows)
+
+    snapshot = log_store.snapshot()
+    return {
+        "message": "Files processed",
+        "files": [tailed.status() for tailed in tailed_files],
+        "total_logs": snapshot.log_count(),
+        "total_sessions": snapshot.session_count(),
+        "next_log_id": next_log_id,
+        "last_session_id": last_session_id,
+    }
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if BACKEND_ROLE == "store":
+        if os.path.exists(STORE_SOCKET):
+            os.remove(STORE_SOCKET)
+        uvicorn.run(app, uds=STORE_SOCKET)
+    elif BACKEND_ROLE == "worker":
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=BACKEND_WORKERS)
+    elif BACKEND_ROLE == "coordinator":
+        uvicorn.run("coordinator:app", host="0.0.0.0", port=8000)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,151 @@
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from compression import DECOMPRESSION_ERRORS, UnsupportedUploadEncoding, detect_upload_encoding, open_decompressed
+from log_parser import LogFileParser, ParsedFile, iter_text_lines
+from stage_timings import timed_stage
+
+
+# Processes that decrypt and parse the files of a batch upload (0 = one per CPU)
+BATCH_PARSE_WORKERS = int(os.environ.get("BATCH_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class BatchFile:
+    """Outcome of parsing one file of a batch: rows with provisional ids, or an error."""
+
+    __slots__ = ("filename", "parsed", "counters", "error")
+
+    def __init__(self, filename: str, parsed: Optional[ParsedFile] = None, counters: Optional[Dict[str, int]] = None, error: Optional[str] = None):
+        self.filename = filename
+        self.parsed = parsed
+        self.counters = counters or {}
+        self.error = error
+
+
+class _Counters:
+    """Collects what IngestProgress would count, to send back from a worker process."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def add(self, **deltas: int):
+        for key, value in deltas.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+
+def parse_file_bytes(filename: str, data: bytes) -> Tuple[ParsedFile, Dict[str, int]]:
+    """Decrypt and parse one encrypted log file (plain, gzip or zstd). Runs in a worker process."""
+    counters = _Counters()
+    fileobj = io.BytesIO(data)
+    fileobj = open_decompressed(fileobj, detect_upload_encoding(fileobj))
+    parser = LogFileParser(filename, decrypt=True, progress=counters)
+    parser.feed_lines(iter_text_lines(fileobj, counters))
+    return parser.finish(), counters.counts
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server has threads running (store writer, threadpool) that fork would not copy safely
+            _pool = ProcessPoolExecutor(max_workers=BATCH_PARSE_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Forget a pool whose worker died, so the next batch starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_batch_files(filename: str, fileobj: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """
+    (name, bytes) of every log file in one uploaded part: the part itself, or
+    each file member of a zip or tar archive (tar may be gzip/zstd compressed),
+    named "<part name>/<member>".
+    """
+    encoding = detect_upload_encoding(fileobj)
+    if encoding == "zip":
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield f"{filename}/{info.filename}", zf.read(info)
+        return
+    if _is_tar(fileobj, encoding):
+        # Stream mode: members are read in archive order without seeking
+        with tarfile.open(fileobj=open_decompressed(fileobj, encoding), mode="r|") as tf:
+            for member in tf:
+                if member.isfile():
+                    yield f"{filename}/{member.name}", tf.extractfile(member).read()
+        return
+    yield filename, fileobj.read()
+
+
+def _is_tar(fileobj: BinaryIO, encoding: Optional[str]) -> bool:
+    position = fileobj.tell()
+    try:
+        header = open_decompressed(fileobj, encoding).read(tarfile.BLOCKSIZE)
+    except (UnsupportedUploadEncoding, *DECOMPRESSION_ERRORS):
+        return False
+    finally:
+        fileobj.seek(position)
+    return header[257:262] == b"ustar"
+
+
+def parse_batch(parts: List[Tuple[str, BinaryIO]], progress=None) -> List[BatchFile]:
+    """
+    Parse every file of a batch upload in the process pool, BATCH_PARSE_WORKERS at a time.
+    Results come back in upload order (archive members in archive order), whatever
+    order the workers finish in. At most two files per worker are held in memory
+    waiting for a worker.
+    """
+    pool = get_pool()
+    results: List[BatchFile] = []
+    pending: "deque[Tuple[str, object]]" = deque()
+
+    def collect_oldest():
+        filename, future = pending.popleft()
+        if isinstance(future, BatchFile):
+            results.append(future)
+            return
+        try:
+            with timed_stage("parse"):
+                parsed, counters = future.result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        except Exception as e:
+            results.append(BatchFile(filename, error=str(e)))
+            return
+        if progress is not None:
+            progress.set_file(filename)
+            progress.add(**counters)
+        results.append(BatchFile(filename, parsed, counters))
+
+    for part_name, fileobj in parts:
+        try:
+            with timed_stage("read"):
+                for filename, data in iter_batch_files(part_name, fileobj):
+                    pending.append((filename, pool.submit(parse_file_bytes, filename, data)))
+                    while len(pending) >= 2 * BATCH_PARSE_WORKERS:
+                        collect_oldest()
+        except (tarfile.TarError, UnsupportedUploadEncoding, *DECOMPRESSION_ERRORS) as e:
+            # Files of the part read before the error are kept
+            pending.append((part_name, BatchFile(part_name, error=f"Could not read {part_name}: {e}")))
+    while pending:
+        collect_oldest()
+    return results
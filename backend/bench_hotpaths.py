@@ -0,0 +1,169 @@
+"""
+In-process benchmarks of the hot paths (needs pytest-benchmark).
+
+Runs decrypt, lexing, ingest, flowchart, test results, timeline, pagination and
+raw export on synthetic corpora from generate_test_logs.py. Corpus sizes (lines)
+come from BENCH_LINES; generated corpora are cached in BENCH_CORPUS_DIR between runs.
+
+    python -m pytest bench_hotpaths.py --benchmark-json=bench-$(git rev-parse --short HEAD).json
+    BENCH_LINES=10000,1000000,10000000 python -m pytest bench_hotpaths.py --benchmark-autosave
+    pytest-benchmark compare --group-by=name      # compare autosaved runs across commits
+
+Not collected by a plain `pytest` run (the file does not match test_*.py).
+"""
+import os
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as backend
+from generate_test_logs import generate_corpus
+from log_columns import compute_timeline
+from log_lexer import lex
+from log_parser import PASS_PHRASE, cryptojs_decrypt
+
+BENCH_LINES = [int(size) for size in os.environ.get("BENCH_LINES", "10000").split(",") if size.strip()]
+BENCH_CORPUS_DIR = os.environ.get("BENCH_CORPUS_DIR", "") or os.path.join(tempfile.gettempdir(), "log_dashboard_bench")
+# Lines per corpus file; larger corpora are split over several files like real uploads
+BENCH_FILE_LINES = 1_000_000
+BENCH_SEED = 1234
+
+
+def rounds_for(lines: int) -> int:
+    """Repeat small runs for stable numbers; run the big corpora once."""
+    return max(1, min(5, 1_000_000 // lines))
+
+
+def corpus_files(lines: int):
+    """Encrypted corpus of `lines` lines, generated on first use."""
+    files = max(1, -(-lines // BENCH_FILE_LINES))
+    out_dir = os.path.join(BENCH_CORPUS_DIR, f"{lines}-{BENCH_SEED}")
+    paths = [os.path.join(out_dir, f"corpus-{BENCH_SEED}-{index:03d}.log") for index in range(files)]
+    if not all(os.path.exists(path) for path in paths):
+        paths = generate_corpus(out_dir, files=files, lines=lines // files, seed=BENCH_SEED)
+    return paths
+
+
+def ingest_files(paths):
+    backend.log_store.clear()
+    for path in paths:
+        with open(path, "rb") as f:
+            backend.ingest_encrypted_file(os.path.basename(path), f, backend.ingest_progress.get_or_create(None))
+
+
+@pytest.fixture(scope="module", params=BENCH_LINES, ids=lambda lines: f"{lines}lines")
+def corpus(request):
+    return request.param, corpus_files(request.param)
+
+
+@pytest.fixture(scope="module")
+def loaded_store(corpus):
+    lines, paths = corpus
+    ingest_files(paths)
+    yield lines, paths
+    backend.log_store.clear()
+
+
+def record(benchmark, lines: int):
+    benchmark.extra_info["lines"] = lines
+    if benchmark.stats:
+        benchmark.extra_info["lines_per_second"] = round(lines / benchmark.stats.stats.mean)
+
+
+def test_decrypt(benchmark, corpus):
+    lines, paths = corpus
+
+    def decrypt_all():
+        failures = 0
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        cryptojs_decrypt(PASS_PHRASE, line.strip())
+                    except Exception:
+                        failures += 1
+        return failures
+
+    benchmark.pedantic(decrypt_all, rounds=rounds_for(lines))
+    record(benchmark, lines)
+
+
+def test_lex(benchmark, corpus):
+    lines, paths = corpus
+    decrypted = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    decrypted.append(cryptojs_decrypt(PASS_PHRASE, line.strip()))
+                except Exception:
+                    pass
+
+    def lex_all():
+        for line in decrypted:
+            lex(line)
+
+    benchmark.pedantic(lex_all, rounds=rounds_for(lines))
+    record(benchmark, len(decrypted))
+
+
+def test_ingest(benchmark, corpus):
+    lines, paths = corpus
+    benchmark.pedantic(ingest_files, args=(paths,), rounds=rounds_for(lines))
+    record(benchmark, lines)
+    assert backend.log_store.log_count() > 0
+
+
+def test_flowchart(benchmark, loaded_store):
+    lines, _ = loaded_store
+    snapshot = backend.log_store.snapshot()
+    result = benchmark.pedantic(backend.compute_flowchart, args=(snapshot,), rounds=rounds_for(lines))
+    record(benchmark, lines)
+    assert result["nodes"]
+
+
+def test_test_results(benchmark, loaded_store):
+    lines, _ = loaded_store
+    snapshot = backend.log_store.snapshot()
+    result = benchmark.pedantic(backend.parse_test_results_from_logs, args=(snapshot,), rounds=rounds_for(lines))
+    record(benchmark, lines)
+    assert result["testInfo"]
+
+
+def test_timeline(benchmark, loaded_store):
+    lines, _ = loaded_store
+    segments = backend.log_store.snapshot().segments()
+    # Hourly buckets (large corpora span weeks). The warmup round builds the
+    # segments' columns; the timed rounds only aggregate.
+    result = benchmark.pedantic(
+        compute_timeline, args=(segments, 3600000, ("device", "file")), rounds=max(5, rounds_for(lines)), warmup_rounds=1
+    )
+    record(benchmark, lines)
+    assert result["series"]
+
+
+def test_pagination(benchmark, loaded_store):
+    lines, _ = loaded_store
+    per_page = 250
+    middle_page = max(1, backend.log_store.log_count() // per_page // 2)
+    with TestClient(backend.app) as client:
+        def paginate():
+            first = client.get("/logs/paginated", params={"page": 1, "per_page": per_page})
+            middle = client.get("/logs/paginated", params={"page": middle_page, "per_page": per_page})
+            device = client.get("/logs/paginated", params={"page": 2, "per_page": per_page, "device_id": "DEV-0001"})
+            return first.status_code, middle.status_code, device.status_code
+
+        assert benchmark.pedantic(paginate, rounds=max(5, rounds_for(lines))) == (200, 200, 200)
+    record(benchmark, lines)
+
+
+def test_raw_export(benchmark, loaded_store):
+    lines, paths = loaded_store
+    filename = os.path.basename(paths[0])
+    with TestClient(backend.app) as client:
+        def export():
+            return client.get("/logs/raw/file", params={"filename": filename}).status_code
+
+        assert benchmark.pedantic(export, rounds=rounds_for(lines)) == 200
+    record(benchmark, lines)
@@ -0,0 +1,121 @@
+"""
+Read throughput of the multi-worker deployment.
+
+Starts a store process (BACKEND_ROLE=store) on a Unix socket, uploads a
+synthetic corpus once, then for each worker count starts uvicorn with
+BACKEND_ROLE=worker and hammers read endpoints from several client processes.
+
+    python bench_workers.py --workers 1 4 8 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from generate_test_logs import render_lines
+
+READ_PATHS = [
+    "/logs/paginated?page=1&per_page=250",
+    "/logs/paginated?page=5&per_page=250&device_id=DEV-0001",
+    "/sessions",
+    "/stats/devices",
+    "/flowchart",
+    "/logs/files",
+]
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def client_loop(args):
+    base_url, duration, seed = args
+    session = requests.Session()
+    rnd = random.Random(seed)
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        response = session.get(base_url + rnd.choice(READ_PATHS))
+        if response.status_code == 200:
+            done += 1
+    return done
+
+
+def run_workers(workers: int, port: int, env: dict, duration: float, clients: int, backend_dir: str, corpus=None) -> float:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=backend_dir,
+        env={**env, "BACKEND_ROLE": "worker"},
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_for(base_url + "/health")
+        for name, payload in corpus or []:
+            requests.post(base_url + "/read-log/", files={"file": (name, payload)}).raise_for_status()
+        # Warm up every worker (each loads the snapshot once)
+        with multiprocessing.Pool(clients) as pool:
+            pool.map(client_loop, [(base_url, 1.0, i) for i in range(clients)])
+            counts = pool.map(client_loop, [(base_url, duration, i) for i in range(clients)])
+        return sum(counts) / duration
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client processes")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=2000, help="lines per file")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    env = {
+        **os.environ,
+        "STORE_SOCKET": os.path.join(workdir, "store.sock"),
+        "STORE_CATALOG_DIR": os.path.join(workdir, "catalog"),
+    }
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    store = subprocess.Popen([sys.executable, "app.py"], cwd=backend_dir, env={**env, "BACKEND_ROLE": "store"})
+    try:
+        deadline = time.time() + 30
+        while not os.path.exists(env["STORE_SOCKET"]) and time.time() < deadline:
+            time.sleep(0.2)
+
+        print(f"Generating {args.files} files x {args.lines} lines...")
+        corpus = [(f"bench-{i}.log", render_lines(args.lines, i, 4).encode()) for i in range(args.files)]
+
+        results = []
+        for index, workers in enumerate(args.workers):
+            rps = run_workers(workers, args.port, env, args.duration, args.clients, backend_dir, corpus if index == 0 else None)
+            results.append((workers, rps))
+            print(f"{workers:>3} workers: {rps:10.1f} req/s")
+
+        base = results[0][1] or 1.0
+        print("\nworkers   req/s   speedup")
+        for workers, rps in results:
+            print(f"{workers:>7} {rps:8.1f} {rps / base:8.2f}x")
+    finally:
+        store.terminate()
+        store.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import gzip
+import os
+import zipfile
+import zlib
+from typing import BinaryIO, List, Optional, Tuple
+
+# Optional codecs - used only when the package is installed
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+# Responses smaller than this are sent as-is (compression overhead is not worth it)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Content types worth compressing (JSON and text bodies)
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "application/javascript")
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+def available_encodings() -> List[str]:
+    """Encodings this server can produce, in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def _make_encoder(encoding: str):
+    if encoding == "zstd":
+        return _ZstdEncoder()
+    if encoding == "br":
+        return _BrotliEncoder()
+    return _GzipEncoder()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best encoding from an Accept-Encoding header value.
+    Honors q-values (q=0 disables an encoding) and the "*" wildcard.
+    Ties are broken by server preference (zstd > br > gzip).
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    best: Tuple[float, int, Optional[str]] = (0.0, 0, None)
+    supported = available_encodings()
+    for rank, encoding in enumerate(supported):
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        # Higher q wins, then server preference (lower rank)
+        candidate = (q, -rank, encoding)
+        if q > 0 and candidate[:2] > best[:2]:
+            best = candidate
+    return best[2]
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses based on Accept-Encoding.
+    Bodies are compressed chunk by chunk as the app sends them, so large
+    responses are never buffered a second time. Small single-chunk bodies
+    (below minimum_size) and non-text content types are passed through.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        # Without an accepted encoding the body is passed through, but still marked with Vary
+        responder = _CompressingResponder(send, negotiate_encoding(accept_encoding), self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Add Accept-Encoding to the Vary header, keeping the fields already listed (e.g. Origin)."""
+    for index, (key, value) in enumerate(headers):
+        if key.lower() == b"vary":
+            fields = [field.strip().lower() for field in value.split(b",")]
+            if b"accept-encoding" in fields or b"*" in fields:
+                return headers
+            headers = list(headers)
+            headers[index] = (key, value + b", Accept-Encoding")
+            return headers
+    return list(headers) + [(b"vary", b"Accept-Encoding")]
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoding: Optional[str], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Hold the start message until we have seen the first body chunk
+            self.start_message = message
+            headers = {k.lower(): v for k, v in message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+            if (
+                b"content-encoding" in headers
+                or message.get("status", 200) in (204, 304)
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                self.passthrough = True
+                await self.send(message)
+                return
+            # The body may be sent compressed or not depending on Accept-Encoding
+            message["headers"] = _add_vary(message.get("headers", []))
+            if self.encoding is None:
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                # Small complete body - send uncompressed
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.encoder = _make_encoder(self.encoding)
+            headers = [
+                (k, v) for k, v in self.start_message.get("headers", [])
+                if k.lower() not in (b"content-length", b"content-encoding")
+            ]
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            self.start_message["headers"] = headers
+            await self.send(self.start_message)
+
+        chunk = self.encoder.compress(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+# ----------------- Compressed uploads -----------------
+# Leading bytes of the compressed formats accepted for uploads
+_UPLOAD_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"PK\x03\x04", "zip"),
+)
+# Content-Encoding / Content-Type values that announce a compressed upload
+_UPLOAD_DECLARED = {
+    "gzip": "gzip", "x-gzip": "gzip", "application/gzip": "gzip", "application/x-gzip": "gzip",
+    "zstd": "zstd", "application/zstd": "zstd",
+    "application/zip": "zip", "application/x-zip-compressed": "zip",
+}
+
+class UnsupportedUploadEncoding(ValueError):
+    """The upload is compressed with a format this server cannot read."""
+
+
+# Raised while reading a corrupt compressed upload
+DECOMPRESSION_ERRORS: Tuple[type, ...] = (OSError, EOFError, zlib.error, zipfile.BadZipFile)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+def detect_upload_encoding(fileobj: BinaryIO, declared: Optional[str] = None) -> Optional[str]:
+    """
+    "gzip", "zstd" or "zip" for a compressed upload, None for plain text.
+    Magic bytes win; a declared Content-Encoding/Content-Type is used when the
+    first bytes are not conclusive. The file position is left unchanged.
+    """
+    position = fileobj.tell()
+    head = fileobj.read(4)
+    fileobj.seek(position)
+    for magic, encoding in _UPLOAD_MAGIC:
+        if head.startswith(magic):
+            return encoding
+    if declared:
+        for value in declared.lower().split(","):
+            encoding = _UPLOAD_DECLARED.get(value.split(";")[0].strip())
+            if encoding is not None:
+                return encoding
+    return None
+
+
+def open_decompressed(fileobj: BinaryIO, encoding: Optional[str]) -> BinaryIO:
+    """
+    File object that decompresses a gzip/zstd stream as it is read
+    (only a chunk is held in memory at a time). Plain text is returned as is.
+    """
+    if encoding is None:
+        return fileobj
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedUploadEncoding("zstd uploads need the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    raise UnsupportedUploadEncoding(f"Unsupported upload encoding: {encoding}")
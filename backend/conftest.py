@@ -0,0 +1,36 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as backend
+
+
+@pytest.fixture
+def client():
+    """A TestClient on the app with an empty store."""
+    with TestClient(backend.app) as client:
+        client.post("/clear-data/")
+        yield client
+
+
+def zipped(members, compression: int = zipfile.ZIP_DEFLATED) -> bytes:
+    """ZIP archive of (name, data) members."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tarred(members) -> bytes:
+    """Gzipped tar archive of (name, data) members."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
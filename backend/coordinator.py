@@ -0,0 +1,510 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+
+from app import (
+    S3SiteRequest,
+    finalize_flowchart,
+    format_raw_log_content,
+    forwarded_headers,
+    merge_flowchart_partials,
+    parse_time_bound,
+    proxy_request,
+    session_duration_stats,
+    test_results_response,
+)
+from compression import CompressionMiddleware
+from log_columns import merge_timelines
+
+
+# Base URLs of the shard nodes (each one a regular backend), comma separated
+SHARD_URLS = [url.strip().rstrip("/") for url in os.environ.get("SHARD_URLS", "").split(",") if url.strip()]
+# How long an /ingest/{ingest_id} subscriber may wait for the ingest to be assigned to a shard
+INGEST_ASSIGN_TIMEOUT_SECONDS = 30.0
+
+
+class ShardRouter:
+    """
+    Assigns ingests to shards and fans read requests out to all of them.
+
+    Ingests are serialized: each one is sent to the least loaded shard together
+    with the next free log id / session id, and the shard reports where its
+    numbering ended. Ids are therefore unique and increase in ingest order
+    across all shards, which lets readers merge shard results on id.
+
+    Only the numbering needs ingest_lock. Resumable uploads are parsed while their
+    chunks arrive and get their ids when finalized, so their chunks go to the
+    shards unlocked (uploads to different shards run in parallel) and only the
+    finalize step holds the lock.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.urls = urls
+        self.client = httpx.AsyncClient(timeout=None)
+        self.ingest_lock = asyncio.Lock()
+        self.next_log_id = 1
+        self.last_session_id = 0
+        self.shard_logs: Dict[str, int] = {url: 0 for url in urls}
+        self.ingest_shards: Dict[str, str] = {}
+        self.upload_shards: Dict[str, str] = {}
+
+    def reset(self):
+        self.next_log_id = 1
+        self.last_session_id = 0
+        self.shard_logs = {url: 0 for url in self.urls}
+
+    def pick_shard(self) -> str:
+        return min(self.urls, key=lambda url: self.shard_logs[url])
+
+    def record_ingest(self, shard: str, result: dict):
+        """Continue the numbering after an ingest the shard completed."""
+        self.next_log_id = max(self.next_log_id, result["next_log_id"])
+        self.last_session_id = max(self.last_session_id, result["last_session_id"])
+        self.shard_logs[shard] = result["total_logs"]
+
+    async def request_all(self, method: str, path: str, params: Optional[dict] = None, json: Any = None) -> List[httpx.Response]:
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        try:
+            return await asyncio.gather(*(
+                self.client.request(method, url + path, params=params, json=json) for url in self.urls
+            ))
+        except httpx.TransportError as e:
+            raise HTTPException(status_code=503, detail=f"Shard unavailable: {e}")
+
+    async def get_all(self, path: str, params: Optional[dict] = None) -> List[Any]:
+        """GET path on every shard (in shard order) and return the JSON bodies."""
+        return self._json_bodies(await self.request_all("GET", path, params))
+
+    async def post_all(self, path: str, json: Any = None, params: Optional[dict] = None) -> List[Any]:
+        return self._json_bodies(await self.request_all("POST", path, params, json))
+
+    def _json_bodies(self, responses: List[httpx.Response]) -> List[Any]:
+        for response in responses:
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail=f"Shard {response.request.url} returned {response.status_code}: {response.text[:300]}")
+        return [response.json() for response in responses]
+
+    async def wait_for_ingest(self, ingest_id: str) -> str:
+        deadline = time.time() + INGEST_ASSIGN_TIMEOUT_SECONDS
+        while ingest_id not in self.ingest_shards:
+            if time.time() > deadline:
+                raise HTTPException(status_code=404, detail="Ingest not found")
+            await asyncio.sleep(0.2)
+        return self.ingest_shards[ingest_id]
+
+
+router = ShardRouter(SHARD_URLS)
+
+app = FastAPI()
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(CompressionMiddleware)
+
+
+def merge_by_id(shard_logs: List[List[dict]]):
+    """k-way merge of per-shard log lists that are each sorted by id."""
+    return heapq.merge(*shard_logs, key=lambda log: log["id"])
+
+
+# ----------------- Ingest -----------------
+async def ingest_on_shard(request: Request) -> Response:
+    """
+    Forward an upload / S3 ingest to the least loaded shard, continuing the global id numbering.
+    """
+    ingest_id = request.query_params.get("ingest_id") or uuid.uuid4().hex
+    async with router.ingest_lock:
+        shard = router.pick_shard()
+        router.ingest_shards[ingest_id] = shard
+        params = {
+            **request.query_params,
+            "ingest_id": ingest_id,
+            "log_id_start": router.next_log_id,
+            "session_id_start": router.last_session_id,
+        }
+        try:
+            response = await router.client.request(
+                request.method, shard + request.url.path, params=params,
+                headers=forwarded_headers(request), content=request.stream(),
+            )
+        except httpx.TransportError as e:
+            raise HTTPException(status_code=503, detail=f"Shard unavailable: {e}")
+        if response.status_code == 200:
+            router.record_ingest(shard, response.json())
+    return Response(content=response.content, status_code=response.status_code, media_type="application/json")
+
+
+@app.post("/read-log/")
+async def read_log(request: Request):
+    return await ingest_on_shard(request)
+
+
+@app.post("/read-logs/")
+async def read_logs(request: Request):
+    return await ingest_on_shard(request)
+
+
+@app.post("/s3/process-selected-files")
+async def process_selected_files(request: Request):
+    return await ingest_on_shard(request)
+
+
+@app.post("/admin/local-ingest")
+async def ingest_local_files(request: Request):
+    """
+    Ingest server-local files on the least loaded shard; the path must be readable there
+    (e.g. on storage shared by all shards). A shard numbers follow-up polls on its own,
+    which would clash with the global ids, so follow is only available on a shard directly.
+    """
+    body = await request.json()
+    if isinstance(body, dict) and body.get("follow"):
+        raise HTTPException(status_code=400, detail="follow is not supported through the coordinator")
+    return await ingest_on_shard(request)
+
+
+@app.get("/admin/local-ingest/follows")
+async def list_local_follows(request: Request):
+    responses = await asyncio.gather(*(
+        router.client.get(url + "/admin/local-ingest/follows", headers=forwarded_headers(request)) for url in router.urls
+    ))
+    return {"follows": [follow for body in router._json_bodies(responses) for follow in body["follows"]]}
+
+
+@app.delete("/admin/local-ingest/follows/{follow_id}")
+async def stop_local_follow(follow_id: str, request: Request):
+    for url in router.urls:
+        response = await router.client.delete(f"{url}/admin/local-ingest/follows/{follow_id}", headers=forwarded_headers(request))
+        if response.status_code != 404:
+            return Response(content=response.content, status_code=response.status_code, media_type="application/json")
+    raise HTTPException(status_code=404, detail="Follow not found")
+
+
+# ----------------- Resumable Uploads -----------------
+def upload_shard(upload_id: str) -> str:
+    shard = router.upload_shards.get(upload_id)
+    if shard is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return shard
+
+
+@app.post("/uploads")
+async def create_upload(request: Request):
+    """Start the upload on the least loaded shard; its chunks and finalize go to the same shard."""
+    shard = router.pick_shard()
+    ingest_id = request.query_params.get("ingest_id") or uuid.uuid4().hex
+    params = {**request.query_params, "ingest_id": ingest_id}
+    try:
+        response = await router.client.post(
+            shard + "/uploads", params=params, headers=forwarded_headers(request), content=await request.body()
+        )
+    except httpx.TransportError as e:
+        raise HTTPException(status_code=503, detail=f"Shard unavailable: {e}")
+    if response.status_code == 200:
+        router.upload_shards[response.json()["upload_id"]] = shard
+        router.ingest_shards[ingest_id] = shard
+    return Response(content=response.content, status_code=response.status_code, media_type="application/json")
+
+
+@app.api_route("/uploads/{upload_id}", methods=["GET", "PUT"])
+async def upload_passthrough(upload_id: str, request: Request):
+    url = f"{upload_shard(upload_id)}/uploads/{upload_id}" + (f"?{request.url.query}" if request.url.query else "")
+    return await proxy_request(router.client, request, url, "Shard")
+
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str, request: Request):
+    shard = upload_shard(upload_id)
+    router.upload_shards.pop(upload_id, None)
+    return await proxy_request(router.client, request, f"{shard}/uploads/{upload_id}", "Shard")
+
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: Request):
+    """The rows were parsed as the chunks arrived; only this step assigns ids, under the ingest lock."""
+    shard = upload_shard(upload_id)
+    async with router.ingest_lock:
+        params = {**request.query_params, "log_id_start": router.next_log_id, "session_id_start": router.last_session_id}
+        try:
+            response = await router.client.post(f"{shard}/uploads/{upload_id}/finalize", params=params, headers=forwarded_headers(request))
+        except httpx.TransportError as e:
+            raise HTTPException(status_code=503, detail=f"Shard unavailable: {e}")
+        if response.status_code == 200:
+            router.record_ingest(shard, response.json())
+            router.upload_shards.pop(upload_id, None)
+    return Response(content=response.content, status_code=response.status_code, media_type="application/json")
+
+
+@app.get("/ingest/{ingest_id}/events")
+async def stream_ingest_events(ingest_id: str, request: Request):
+    shard = await router.wait_for_ingest(ingest_id)
+    return await proxy_request(router.client, request, f"{shard}/ingest/{ingest_id}/events", "Shard")
+
+
+@app.get("/ingest/{ingest_id}")
+async def get_ingest_status(ingest_id: str, request: Request):
+    shard = router.ingest_shards.get(ingest_id)
+    if shard is None:
+        raise HTTPException(status_code=404, detail="Ingest not found")
+    return await proxy_request(router.client, request, f"{shard}/ingest/{ingest_id}", "Shard")
+
+
+# ----------------- Clear Data -----------------
+@app.post("/clear-data/")
+async def clear_data():
+    async with router.ingest_lock:
+        await router.post_all("/clear-data/")
+        router.reset()
+    return {"message": "All data cleared successfully"}
+
+
+@app.get("/clear-file-data/")
+async def clear_file_data(filename: str = Query(...)):
+    async with router.ingest_lock:
+        results = await router.get_all("/clear-file-data/", {"filename": filename})
+        for url, result in zip(router.urls, results):
+            router.shard_logs[url] = result["remaining_logs"]
+    return {
+        "message": f"Data cleared for file: {filename}",
+        "remaining_logs": sum(result["remaining_logs"] for result in results),
+        "remaining_sessions": sum(result["remaining_sessions"] for result in results),
+    }
+
+
+# ----------------- Logs -----------------
+def time_range_params(time_from: Optional[str], time_to: Optional[str]) -> dict:
+    """time_from/time_to checked here (400 instead of a shard error) and sent on in ms."""
+    return {"time_from": parse_time_bound(time_from, "time_from"), "time_to": parse_time_bound(time_to, "time_to")}
+
+
+@app.get("/logs")
+async def get_logs(device_id: str = None, time_from: str = None, time_to: str = None):
+    results = await router.get_all("/shard/logs", {"device_id": device_id, **time_range_params(time_from, time_to)})
+    return {"logs": list(merge_by_id([result["logs"] for result in results]))}
+
+
+@app.get("/logs/paginated")
+async def get_paginated_logs(
+    page: int = Query(1, ge=1),
+    per_page: int = Query(250, ge=1, le=1000),
+    device_id: str = None,
+    session_id: int = None,
+    time_from: str = None,
+    time_to: str = None,
+):
+    """
+    Each shard returns its first page*per_page matching logs; the merged page is cut from their k-way merge on id.
+    """
+    start = (page - 1) * per_page
+    end = start + per_page
+    results = await router.get_all(
+        "/shard/logs",
+        {"offset": 0, "limit": end, "device_id": device_id, "session_id": session_id, **time_range_params(time_from, time_to)},
+    )
+    total = sum(result["total"] for result in results)
+    paginated_logs = list(itertools.islice(merge_by_id([result["logs"] for result in results]), start, end))
+    return {
+        "metadata": {
+            "total_logs": total,
+            "page": page,
+            "per_page": per_page,
+            "total_pages": (total + per_page - 1) // per_page,
+        },
+        "logs": paginated_logs,
+    }
+
+
+@app.get("/logs/files")
+async def get_log_files():
+    results = await router.get_all("/logs/files")
+    unique_files = set(itertools.chain.from_iterable(result["files"] for result in results))
+    return {"files": sorted(unique_files), "total_files": len(unique_files)}
+
+
+@app.get("/logs/raw/file")
+async def get_raw_log_file_by_filename(filename: str = Query(..., description="Name of the log file")):
+    results = await router.get_all("/shard/logs", {"filename": filename})
+    filtered_logs = list(merge_by_id([result["logs"] for result in results]))
+    if not filtered_logs:
+        raise HTTPException(status_code=404, detail=f"No logs found for file: {filename}")
+    return {"content": format_raw_log_content(filtered_logs), "total_logs": len(filtered_logs), "filename": filename}
+
+
+@app.get("/logs/raw")
+async def get_raw_log_file(session_id: int = None):
+    results = await router.get_all("/shard/logs", {"session_id": session_id})
+    filtered_logs = list(merge_by_id([result["logs"] for result in results]))
+    return {"content": format_raw_log_content(filtered_logs), "total_logs": len(filtered_logs)}
+
+
+@app.get("/logs/{log_id}")
+async def get_log(log_id: int):
+    for response in await router.request_all("GET", f"/logs/{log_id}"):
+        if response.status_code == 200:
+            return response.json()
+    raise HTTPException(status_code=404, detail="Log not found")
+
+
+# ----------------- Sessions -----------------
+async def merged_sessions(device_id: Optional[str], time_from: Optional[str] = None, time_to: Optional[str] = None) -> List[dict]:
+    results = await router.get_all("/sessions", {"device_id": device_id, **time_range_params(time_from, time_to)})
+    sessions = list(itertools.chain.from_iterable(result["sessions"] for result in results))
+    # Session ids are handed out in ingest order across shards
+    sessions.sort(key=lambda s: s["session_id"])
+    return sessions
+
+
+@app.get("/sessions")
+async def get_sessions(device_id: str = None, time_from: str = None, time_to: str = None):
+    sessions = await merged_sessions(device_id, time_from, time_to)
+    return {"sessions": sessions, "duration": session_duration_stats(sessions)}
+
+
+@app.get("/sessions/paginated")
+async def get_sessions_paginated(
+    page: int = Query(1, ge=1),
+    per_page: int = Query(10, ge=1, le=100),
+    device_id: str = None,
+    time_from: str = None,
+    time_to: str = None,
+):
+    sessions = await merged_sessions(device_id, time_from, time_to)
+    total = len(sessions)
+    start = (page - 1) * per_page
+    return {
+        "metadata": {
+            "total_sessions": total,
+            "page": page,
+            "per_page": per_page,
+            "total_pages": (total + per_page - 1) // per_page,
+        },
+        "sessions": sessions[start:start + per_page],
+    }
+
+
+# ----------------- Statistics -----------------
+@app.get("/stats/devices")
+async def get_device_stats():
+    """Per-device counters are summed across shards."""
+    device_stats: Dict[str, dict] = {}
+    for result in await router.get_all("/stats/devices"):
+        for device in result["devices"]:
+            merged = device_stats.get(device["device_id"])
+            if merged is None:
+                device_stats[device["device_id"]] = dict(device)
+                continue
+            for key in ("total_logs", "error_count", "warning_count", "info_count"):
+                merged[key] += device[key]
+    return {"devices": list(device_stats.values())}
+
+
+@app.get("/stats/timeline")
+async def get_timeline(
+    bucket_ms: int = Query(60000, ge=1),
+    group_by: str = None,
+    device_id: str = None,
+    filename: str = None,
+    time_from: str = None,
+    time_to: str = None,
+):
+    """Shard timelines are aligned to multiples of bucket_ms, so they are added bucket by bucket."""
+    params = {"bucket_ms": bucket_ms, "group_by": group_by, "device_id": device_id, "filename": filename}
+    results = await router.get_all("/stats/timeline", {**params, **time_range_params(time_from, time_to)})
+    return merge_timelines(results, bucket_ms)
+
+
+@app.post("/test-results")
+async def test_results(body: Optional[S3SiteRequest] = None):
+    """Per-file test counts are summed across shards."""
+    results = await router.post_all("/shard/test-results", json=body.model_dump() if body else None)
+    partials = [result["test_results"] for result in results if result["test_results"] is not None]
+    if not partials:
+        return test_results_response(None)
+
+    test_info: Dict[str, Dict[str, int]] = {}
+    for partial in partials:
+        for key, counts in partial["testInfo"].items():
+            merged = test_info.setdefault(key, {})
+            for name, value in counts.items():
+                merged[name] = merged.get(name, 0) + value
+    return test_results_response({"testInfo": test_info})
+
+
+# ----------------- Flowchart -----------------
+@app.get("/flowchart")
+async def get_flowchart_data(device_id: str = None, session_id: int = None):
+    """Transition matrices of the shards are merged before computing edge statistics."""
+    partials = await router.get_all("/shard/flowchart", {"device_id": device_id, "session_id": session_id})
+    return finalize_flowchart(merge_flowchart_partials(partials))
+
+
+@app.get("/flowchart/events")
+async def get_flowchart_events(
+    from_state: str = Query(..., description="Source state (login, home, site, node)"),
+    to_state: str = Query(..., description="Target state (home, site, node, logout)"),
+    device_id: str = None,
+    session_id: int = None,
+    occurrence: int = Query(0, ge=0, description="Which occurrence of the edge to return (0 = first)"),
+):
+    """Occurrences are numbered shard by shard (in SHARD_URLS order)."""
+    params = {"from_state": from_state, "to_state": to_state, "device_id": device_id, "session_id": session_id}
+    firsts = await router.get_all("/flowchart/events", {**params, "occurrence": 0})
+    total = sum(first["total_occurrences"] for first in firsts)
+    offset = 0
+    for url, first in zip(router.urls, firsts):
+        count = first["total_occurrences"]
+        if occurrence < offset + count:
+            local = occurrence - offset
+            result = first
+            if local > 0:
+                response = await router.client.get(url + "/flowchart/events", params={
+                    **{k: v for k, v in params.items() if v is not None}, "occurrence": local,
+                })
+                result = response.json()
+            return {**result, "occurrence": occurrence, "total_occurrences": total, "has_next": occurrence + 1 < total}
+        offset += count
+    return {"events": [], "occurrence": occurrence, "total_occurrences": total, "session_id": None, "has_next": False}
+
+
+@app.get("/debug/login")
+async def debug_login(session_id: int = None):
+    results = await router.get_all("/debug/login", {"session_id": session_id})
+    login_found = sorted(
+        itertools.chain.from_iterable(result["login_found"] for result in results),
+        key=lambda login: login["session_id"],
+    )
+    return {
+        "login_pattern": results[0]["login_pattern"] if results else None,
+        "login_found": login_found,
+        "total_logs_checked": sum(result["total_logs_checked"] for result in results),
+    }
+
+
+# ----------------- S3 (stateless, served by any shard) -----------------
+@app.api_route("/s3/{path:path}", methods=["GET", "POST"])
+async def s3_passthrough(path: str, request: Request):
+    url = f"{router.urls[0]}/s3/{path}" + (f"?{request.url.query}" if request.url.query else "")
+    return await proxy_request(router.client, request, url, "Shard")
+
+
+# ----------------- Health Check -----------------
+@app.get("/health")
+async def health_check():
+    results = await router.get_all("/health")
+    return {
+        "status": "healthy",
+        "total_logs": sum(result["total_logs"] for result in results),
+        "shards": [{"url": url, "total_logs": result["total_logs"]} for url, result in zip(router.urls, results)],
+    }
@@ -1,31 +1,35 @@
-from Crypto.Cipher import AES
-from hashlib import md5
+"""
+Synthetic log corpus generator.
+
+Produces encrypted (CryptoJS-compatible) log files shaped like real device logs:
+several devices, App Version session boundaries, logins, NAVIGATE-TO screen walks,
+TESTING-INFO lifecycles (completed, aborted, stopped, deleted, never finished)
+and noise, including lines that fail to decrypt. Files are generated in
+chunks on a process pool, so large corpora are quick to produce.
+
+    python generate_test_logs.py               # the small fixed sample_encrypted_logs.log
+    python generate_test_logs.py --lines 1000000 --files 4 --devices 8 --out corpus/
+"""
+import argparse
 import base64
+import json
+import multiprocessing
 import os
+import random
+import sys
+import time
+from hashlib import md5
+from typing import List, Optional
 
-def cryptojs_encrypt(passphrase: str, plaintext: str) -> str:
-    """Encrypt text using CryptoJS-compatible AES encryption"""
-    salt = os.urandom(8)
-    d = d_i = b""
-    while len(d) < 32 + 16:  # key=32, iv=16
-        d_i = md5(d_i + passphrase.encode() + salt).digest()
-        d += d_i
-    key = d[:32]
-    iv = d[32:48]
-    
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    plaintext_bytes = plaintext.encode('utf-8')
-    
-    # PKCS7 padding
-    pad_len = 16 - (len(plaintext_bytes) % 16)
-    padded = plaintext_bytes + bytes([pad_len] * pad_len)
-    
-    ciphertext = cipher.encrypt(padded)
-    return base64.b64encode(b"Salted__" + salt + ciphertext).decode('utf-8')
-
-# Generate sample encrypted logs
-passphrase = "ecsite"
-sample_logs = [
+from Crypto.Cipher import AES
+
+PASSPHRASE = "ecsite"
+# Lines per unit of parallel work
+CHUNK_LINES = 20000
+# Placeholder for a line that should not decrypt
+CORRUPT_LINE = "\x00corrupt"
+
+SAMPLE_LOGS = [
     "DEVICE ID DEVICE-001",
     "2024-01-15 10:30:15 INFO Application started successfully",
     "2024-01-15 10:30:16 INFO Database connection established",
@@ -33,7 +37,7 @@ sample_logs = [
     "2024-01-15 10:30:18 INFO User authentication successful",
     "2024-01-15 10:30:19 ERROR Failed to connect to external API",
     "2024-01-15 10:30:20 INFO Retrying connection in 5 seconds",
-    "DEVICE ID DEVICE-002", 
+    "DEVICE ID DEVICE-002",
     "2024-01-15 10:31:15 INFO Device initialized",
     "2024-01-15 10:31:16 INFO Sensor calibration completed",
     "2024-01-15 10:31:17 ERROR Sensor reading failed",
@@ -41,9 +45,227 @@ sample_logs = [
     "2024-01-15 10:31:19 INFO Data transmission successful"
 ]
 
-with open('sample_encrypted_logs.log', 'w') as f:
-    for log in sample_logs:
-        encrypted = cryptojs_encrypt(passphrase, log)
-        f.write(encrypted + '\n')
+# Screen walk: screen -> possible next screens
+SCREEN_GRAPH = {
+    "siteList": ["nodeList", "nodeList", "settings", "siteDetails"],
+    "siteDetails": ["nodeList", "siteList"],
+    "nodeList": ["testList", "testList", "nodeDetails", "siteList"],
+    "nodeDetails": ["testList", "nodeList", "photoGallery"],
+    "photoGallery": ["nodeDetails", "nodeList"],
+    "testList": ["testRunner", "testRunner", "nodeList", "testResults"],
+    "testRunner": ["testList", "testResults"],
+    "testResults": ["testList", "nodeList", "siteList"],
+    "settings": ["siteList"],
+}
+NOISE_MESSAGES = [
+    "INFO : Sync started",
+    "INFO : Sync finished in {n} ms",
+    "DEBUG : cache hit for key node_{n}",
+    "INFO : API GET /sites/{n} 200",
+    "WARNING : Slow response from server ({n} ms)",
+    "WARN : Battery level {n}%",
+    "ERROR : Request timed out after {n} ms",
+    "Exception : NullPointerException in TestAdapter line {n}",
+    "INFO : Bluetooth device connected (rssi -{n})",
+]
+TEST_OUTCOMES = [("Test Completed", 0.6), ("Test Aborted", 0.1), ("Test Stopped", 0.1), ("Test Deleted", 0.1), (None, 0.1)]
+
+
+def cryptojs_encrypt(passphrase: str, plaintext: str) -> str:
+    """Encrypt text using CryptoJS-compatible AES encryption"""
+    return _Encryptor(passphrase, os.urandom(8)).encrypt(plaintext)
+
+
+class _Encryptor:
+    """CryptoJS-compatible AES with one salt (so one key derivation) for many lines."""
+
+    def __init__(self, passphrase: str, salt: bytes):
+        d = d_i = b""
+        while len(d) < 32 + 16:  # key=32, iv=16
+            d_i = md5(d_i + passphrase.encode() + salt).digest()
+            d += d_i
+        self.key = d[:32]
+        self.iv = d[32:48]
+        self.prefix = b"Salted__" + salt
+
+    def encrypt(self, plaintext: str) -> str:
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        plaintext_bytes = plaintext.encode("utf-8")
+        # PKCS7 padding
+        pad_len = 16 - (len(plaintext_bytes) % 16)
+        padded = plaintext_bytes + bytes([pad_len] * pad_len)
+        return base64.b64encode(self.prefix + cipher.encrypt(padded)).decode("utf-8")
+
+
+class _LogWriter:
+    """Plain log lines with a running HH:MM:SS:mmm clock that wraps at midnight."""
+
+    def __init__(self, rnd: random.Random, start_ms: int):
+        self.rnd = rnd
+        self.clock_ms = start_ms
+        self.lines: List[str] = []
+
+    def raw(self, line: str):
+        self.lines.append(line)
+
+    def log(self, message: str, max_step_ms: int = 1500):
+        self.clock_ms = (self.clock_ms + self.rnd.randint(1, max_step_ms)) % (24 * 3600 * 1000)
+        seconds, ms = divmod(self.clock_ms, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        self.lines.append(f"{hours:02d}:{minutes:02d}:{seconds:02d}:{ms:03d} | {message}")
+
+    def noise(self, count: int):
+        for _ in range(count):
+            self.log(self.rnd.choice(NOISE_MESSAGES).format(n=self.rnd.randint(1, 5000)))
+
+
+def generate_plain_lines(n_lines: int, seed: int, devices: int = 4, corrupt_rate: float = 0.001) -> List[str]:
+    """
+    About n_lines plaintext log lines (whole sessions; the last one is cut at n_lines).
+    """
+    rnd = random.Random(seed)
+    out = _LogWriter(rnd, rnd.randint(0, 24 * 3600 * 1000 - 1))
+    device = rnd.randrange(devices)
+    out.raw(f"DEVICE ID DEV-{device:04d}")
+    test_ids = [f"tp-{seed}-{i}" for i in range(20)]
+
+    while len(out.lines) < n_lines:
+        # A device switch is announced before the session starts
+        if rnd.random() < 0.2:
+            device = rnd.randrange(devices)
+            out.raw(f"DEVICE ID DEV-{device:04d}")
+        out.log(f"LOG-APP: App Version: 4.{rnd.randint(0, 9)}.{rnd.randint(0, 30)} (build {rnd.randint(1000, 9999)})")
+        out.noise(rnd.randint(0, 3))
+        if rnd.random() < 0.85:
+            out.log(f"LOG-APP: Model Name: {rnd.choice(['Pixel 7', 'Galaxy S23', 'iPad Pro', 'TC52'])}, OS: {rnd.randint(11, 14)}")
+            out.noise(rnd.randint(1, 4))
+
+        screen = "siteList"
+        for _ in range(rnd.randint(3, 25)):
+            out.log(f"ECS-ACTIVITY: NAVIGATE-TO : {{ screen : {screen} }}")
+            out.noise(rnd.randint(1, 8))
+            if screen == "testRunner":
+                _test_lifecycle(out, rnd, rnd.choice(test_ids))
+            screen = rnd.choice(SCREEN_GRAPH[screen])
+            if len(out.lines) >= n_lines:
+                break
+
+        # Idle time between sessions
+        out.log("INFO : App moved to background", max_step_ms=600000)
+
+    lines = out.lines[:n_lines]
+    if corrupt_rate:
+        for index in range(1, len(lines)):
+            if rnd.random() < corrupt_rate:
+                lines[index] = CORRUPT_LINE
+    return lines
+
+
+def _test_lifecycle(out: _LogWriter, rnd: random.Random, test_id: str):
+    info = json.dumps({"testProfileTestItemId": test_id, "testType": rnd.choice(["PIM", "Sweep", "Fiber"])})
+    out.log(f"ECS-ACTIVITY: TESTING-INFO : {{ details : Test Started , info : {info} }}")
+    out.noise(rnd.randint(1, 10))
+    r = rnd.random()
+    for outcome, probability in TEST_OUTCOMES:
+        if r < probability:
+            break
+        r -= probability
+    if outcome is None:
+        return  # never finished
+    if outcome == "Test Aborted":
+        # An aborted event only counts when "INFO : Aborted" precedes it
+        out.log("INFO : Aborted")
+    out.log(f"ECS-ACTIVITY: TESTING-INFO : {{ details : {outcome} , info : {info} }}")
+
+
+def render_lines(n_lines: int, seed: int = 0, devices: int = 4, encrypt: bool = True) -> str:
+    """Render n_lines generated lines as file contents, encrypted unless encrypt is False."""
+    lines = generate_plain_lines(n_lines, seed, devices)
+    if not encrypt:
+        return "\n".join(line for line in lines if line != CORRUPT_LINE) + "\n"
+    encryptor = _Encryptor(PASSPHRASE, random.Random(seed).randbytes(8))
+    rendered = []
+    for line in lines:
+        if line == CORRUPT_LINE:
+            # Ciphertext that is not a whole number of AES blocks fails to decrypt
+            rendered.append(base64.b64encode(b"Salted__" + os.urandom(20)).decode())
+        else:
+            rendered.append(encryptor.encrypt(line))
+    return "\n".join(rendered) + "\n"
+
+
+def _render_chunk(args) -> str:
+    return render_lines(*args)
+
+
+def generate_file(path: str, n_lines: int, seed: int = 0, devices: int = 4, encrypt: bool = True, pool=None) -> str:
+    """Write one corpus file of n_lines lines, rendering chunks in parallel when a pool is given."""
+    chunks = []
+    remaining = n_lines
+    index = 0
+    while remaining > 0:
+        size = min(CHUNK_LINES, remaining)
+        chunks.append((size, seed * 1_000_003 + index, devices, encrypt))
+        remaining -= size
+        index += 1
+    rendered = pool.imap(_render_chunk, chunks) if pool is not None else map(_render_chunk, chunks)
+    with open(path, "w") as f:
+        for text in rendered:
+            f.write(text)
+    return path
+
+
+def generate_corpus(
+    out_dir: str,
+    files: int = 1,
+    lines: int = 10000,
+    devices: int = 4,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    encrypt: bool = True,
+) -> List[str]:
+    """Generate `files` files of `lines` lines each in out_dir and return their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    paths = []
+    with multiprocessing.Pool(workers) as pool:
+        for index in range(files):
+            path = os.path.join(out_dir, f"corpus-{seed}-{index:03d}.log")
+            paths.append(generate_file(path, lines, seed + index, devices, encrypt, pool))
+    return paths
+
+
+def write_sample(path: str = "sample_encrypted_logs.log"):
+    with open(path, "w") as f:
+        for log in SAMPLE_LOGS:
+            f.write(cryptojs_encrypt(PASSPHRASE, log) + "\n")
+    print(f"Sample encrypted log file created: {path}")
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", action="store_true", help="write the fixed 13-line sample_encrypted_logs.log (the default without arguments)")
+    parser.add_argument("--out", default="corpus", help="output directory")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--lines", type=int, default=10000, help="lines per file")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--plain", action="store_true", help="write decrypted lines (like decryptedLogs.zip members)")
+    args = parser.parse_args(argv)
+
+    if args.sample or not argv:
+        write_sample()
+        return
+
+    started = time.time()
+    paths = generate_corpus(args.out, args.files, args.lines, args.devices, args.seed, args.workers, not args.plain)
+    elapsed = time.time() - started
+    total = args.files * args.lines
+    print(f"Wrote {len(paths)} file(s), {total} lines in {elapsed:.1f}s ({total / elapsed:.0f} lines/s) to {args.out}/")
+
 
-print("Sample encrypted log file created: sample_encrypted_logs.log")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+# How often (at most) a running ingest publishes a progress event
+PROGRESS_INTERVAL_SECONDS = 0.25
+# Number of finished ingests kept around for late subscribers
+MAX_TRACKED_INGESTS = 100
+# How long an event stream opened before its ingest waits for the ingest to start
+START_WAIT_SECONDS = 30.0
+
+
+class IngestProgress:
+    """
+    Thread-safe progress tracker for a single ingest.
+    The ingest loop updates counters from a worker thread; subscribers
+    read the list of published events (progress..., then summary or error).
+    """
+
+    def __init__(self, ingest_id: str, on_done: Optional[Callable[["IngestProgress"], None]] = None):
+        self.ingest_id = ingest_id
+        self.on_done = on_done
+        self.kind: Optional[str] = None
+        self.filenames: List[str] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.status = "pending"
+        self.counters = {
+            "bytes_read": 0,
+            "lines_read": 0,
+            "lines_decrypted": 0,
+            "decrypt_failures": 0,
+            "logs_stored": 0,
+            "sessions_closed": 0,
+        }
+        self.current_file: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+
+    # ---- updates from the ingest loop ----
+    def begin(self, kind: str, filenames: List[str]):
+        with self._lock:
+            if self.done:
+                # The id is reused for a new ingest: drop the finished run's counters and events
+                self.counters = dict.fromkeys(self.counters, 0)
+                self.events = []
+                self.current_file = None
+                self.finished_at = None
+            self.kind = kind
+            self.filenames = list(filenames)
+            self.started_at = time.time()
+            self.status = "running"
+            self._append_event("started")
+
+    def set_file(self, filename: str):
+        with self._lock:
+            self.current_file = filename
+
+    def add(self, **deltas: int):
+        # Called from the threadpool and the store writer while subscribers read
+        with self._lock:
+            for key, value in deltas.items():
+                self.counters[key] += value
+            if time.time() - self._last_publish >= PROGRESS_INTERVAL_SECONDS:
+                self._append_event("progress")
+
+    def finish(self, result: Dict[str, Any]):
+        with self._lock:
+            self.status = "completed"
+            self.finished_at = time.time()
+            self._append_event("summary", result=result)
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def fail(self, error: str):
+        with self._lock:
+            self.status = "failed"
+            self.finished_at = time.time()
+            self._append_event("error", error=error)
+        if self.on_done is not None:
+            self.on_done(self)
+
+    # ---- reads from subscribers ----
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._snapshot()
+
+    def events_since(self, index: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.events[index:]
+
+    # ---- internals (self._lock held) ----
+    def _snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        counters = dict(self.counters)
+        return {
+            "ingest_id": self.ingest_id,
+            "kind": self.kind,
+            "status": self.status,
+            "filenames": list(self.filenames),
+            "current_file": self.current_file,
+            **counters,
+            "elapsed_seconds": round(elapsed, 3),
+            "lines_per_second": round(counters["lines_read"] / elapsed, 1) if elapsed > 0 else 0.0,
+            "bytes_per_second": round(counters["bytes_read"] / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    def _append_event(self, event: str, **extra: Any):
+        self.events.append({"event": event, **self._snapshot(), **extra})
+        self._last_publish = time.time()
+
+
+class IngestProgressRegistry:
+    """Keeps the most recent ingests addressable by ingest id."""
+
+    def __init__(self, max_tracked: int = MAX_TRACKED_INGESTS, on_done: Optional[Callable[[IngestProgress], None]] = None):
+        self.max_tracked = max_tracked
+        # Called with the tracker when an ingest completes or fails (e.g. to record metrics)
+        self.on_done = on_done
+        self._ingests: "OrderedDict[str, IngestProgress]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, ingest_id: Optional[str] = None) -> IngestProgress:
+        """
+        Return the tracker for ingest_id, creating it if needed.
+        Used by the ingest side; subscribers look trackers up with get().
+        """
+        ingest_id = ingest_id or uuid.uuid4().hex
+        with self._lock:
+            progress = self._ingests.get(ingest_id)
+            if progress is None:
+                progress = IngestProgress(ingest_id, self.on_done)
+                self._ingests[ingest_id] = progress
+                while len(self._ingests) > self.max_tracked:
+                    self._ingests.popitem(last=False)
+            return progress
+
+    def get(self, ingest_id: str) -> Optional[IngestProgress]:
+        with self._lock:
+            return self._ingests.get(ingest_id)
+
+
+def format_sse(payload: Dict[str, Any]) -> str:
+    """Format one server-sent event."""
+    return f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
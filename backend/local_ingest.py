@@ -0,0 +1,242 @@
+import glob
+import mmap
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from compression import detect_upload_encoding, open_decompressed
+from log_parser import LogFileParser, ParsedFile, iter_mapped_lines, iter_text_lines
+
+
+# Directories the admin local-ingest endpoint may read, comma separated (unset = endpoint disabled)
+LOCAL_INGEST_ROOTS = [os.path.realpath(path.strip()) for path in os.environ.get("LOCAL_INGEST_ROOTS", "").split(",") if path.strip()]
+# How often followed files are checked for appended lines
+LOCAL_FOLLOW_INTERVAL_SECONDS = float(os.environ.get("LOCAL_FOLLOW_INTERVAL_SECONDS", "1.0"))
+# Appended lines extend a followed file's last segment up to this many rows before a new one is started
+LOCAL_FOLLOW_SEGMENT_ROWS = int(os.environ.get("LOCAL_FOLLOW_SEGMENT_ROWS", "20000"))
+# Base64 of "Salted__": every CryptoJS ciphertext line starts with it
+_ENCRYPTED_PREFIX = b"U2FsdGVkX1"
+# Bytes looked at to tell encrypted from already decrypted files
+_SNIFF_SIZE = 4096
+
+
+class LocalIngestError(Exception):
+    """A local ingest request that cannot be served (status_code is the HTTP status)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def resolve_local_paths(pattern: str, roots: Optional[List[str]] = None) -> List[str]:
+    """
+    Files matching an absolute path or glob ("**" recurses), sorted. Every match
+    must resolve (symlinks included) to a file under one of LOCAL_INGEST_ROOTS.
+    """
+    roots = LOCAL_INGEST_ROOTS if roots is None else roots
+    if not roots:
+        raise LocalIngestError(403, "Local ingest is disabled (set LOCAL_INGEST_ROOTS)")
+    if not os.path.isabs(pattern):
+        raise LocalIngestError(400, "path must be absolute")
+    files = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        real = os.path.realpath(path)
+        if not os.path.isfile(real):
+            continue
+        if not any(real == root or real.startswith(root + os.sep) for root in roots):
+            raise LocalIngestError(403, f"{path} is outside LOCAL_INGEST_ROOTS")
+        if real not in files:
+            files.append(real)
+    if not files:
+        raise LocalIngestError(404, f"No files match {pattern}")
+    return files
+
+
+class TailedFile:
+    """
+    A local log file parsed from a byte offset onwards.
+
+    The file is memory-mapped and only the bytes after the offset are decoded.
+    The parser lives as long as the file is followed, so lines appended later
+    continue the session (and device) they belong to. Until the final read, a
+    trailing line without newline waits for the rest of it and the current
+    session stays open. A truncated or replaced (rotated) file closes out what
+    was read and is parsed again from the start. gzip/zstd files are read once
+    as a stream.
+    """
+
+    def __init__(self, path: str, encrypted: Optional[bool] = None, progress=None):
+        self.path = path
+        self.encrypted = encrypted
+        self.progress = progress
+        self.offset = 0
+        self.inode: Optional[int] = None
+        self.encoding: Optional[str] = None
+        self.logs_added = 0
+        self.finished = False
+        self.parser: Optional[LogFileParser] = None
+
+    def read_new(self, log_id_start: int, session_id_start: int, final: bool = False) -> List[ParsedFile]:
+        """
+        Parse what was appended since the last call. Rows get ids from log_id_start
+        on and new sessions ids above session_id_start.
+        """
+        if self.finished:
+            return []
+        parsed = []
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if self.parser is not None and (stat is None or stat.st_ino != self.inode or stat.st_size < self.offset):
+            parsed.append(self.parser.finish())
+            self.parser = None
+            self.offset = 0
+        if stat is None:
+            self.finished = True
+            return self._count(parsed)
+        if self.parser is None:
+            if stat.st_size == 0:
+                return self._count(parsed)
+            self._open(stat, log_id_start, session_id_start)
+        else:
+            self.parser.continue_at(log_id_start, session_id_start)
+
+        if self.encoding is not None:
+            with open(self.path, "rb") as f:
+                self.parser.feed_lines(iter_text_lines(open_decompressed(f, self.encoding), self.progress, errors="replace"))
+            self.offset = stat.st_size
+            final = True
+        elif stat.st_size > self.offset:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = len(mm)  # the file may have grown since the stat
+                if not final:
+                    end = mm.rfind(b"\n", self.offset, end) + 1 or self.offset
+                if end > self.offset:
+                    self.parser.feed_lines(iter_mapped_lines(mm, self.offset, end, self.progress, errors="replace"))
+                    self.offset = end
+        if final:
+            parsed.append(self.parser.finish())
+            self.finished = True
+        else:
+            parsed.append(self.parser.drain())
+        return self._count(parsed)
+
+    def status(self) -> Dict:
+        return {"path": self.path, "offset": self.offset, "logs_added": self.logs_added, "finished": self.finished}
+
+    def _open(self, stat: os.stat_result, log_id_start: int, session_id_start: int):
+        self.inode = stat.st_ino
+        with open(self.path, "rb") as f:
+            self.encoding = detect_upload_encoding(f)
+            if self.encrypted is None:
+                self.encrypted = open_decompressed(f, self.encoding).read(_SNIFF_SIZE).lstrip().startswith(_ENCRYPTED_PREFIX)
+        self.parser = LogFileParser(
+            self.path,
+            decrypt=self.encrypted,
+            log_id_start=log_id_start,
+            session_id_start=session_id_start,
+            progress=self.progress,
+        )
+
+    def _count(self, parsed: List[ParsedFile]) -> List[ParsedFile]:
+        self.logs_added += sum(len(item.logs) for item in parsed)
+        return parsed
+
+
+class LocalFollow:
+    """A followed path or glob; files that start matching it later are followed too."""
+
+    def __init__(self, pattern: str, files: List[TailedFile], encrypted: Optional[bool] = None):
+        self.follow_id = uuid.uuid4().hex
+        self.pattern = pattern
+        self.encrypted = encrypted
+        self.files: Dict[str, TailedFile] = {tailed.path: tailed for tailed in files}
+        self.created_at = time.time()
+        self.last_poll: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def refresh(self) -> List[TailedFile]:
+        """Files to read on this poll, including new matches of the pattern."""
+        try:
+            paths = resolve_local_paths(self.pattern)
+        except LocalIngestError:
+            paths = []
+        for path in paths:
+            if path not in self.files:
+                self.files[path] = TailedFile(path, self.encrypted)
+        return [tailed for tailed in self.files.values() if not tailed.finished]
+
+    def status(self) -> Dict:
+        return {
+            "follow_id": self.follow_id,
+            "pattern": self.pattern,
+            "created_at": self.created_at,
+            "last_poll": self.last_poll,
+            "error": self.error,
+            "files": [tailed.status() for tailed in self.files.values()],
+        }
+
+
+class LocalFollowRegistry:
+    """
+    Active follows, polled every LOCAL_FOLLOW_INTERVAL_SECONDS by one background
+    thread (polling rather than inotify, so it works on any filesystem and OS).
+    `poll` reads and publishes the new lines of one follow.
+    """
+
+    def __init__(self, poll: Callable[[LocalFollow], None], interval: float = LOCAL_FOLLOW_INTERVAL_SECONDS):
+        self.poll = poll
+        self.interval = interval
+        self._follows: Dict[str, LocalFollow] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, follow: LocalFollow):
+        with self._lock:
+            self._follows[follow.follow_id] = follow
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="local-follow", daemon=True)
+                self._thread.start()
+
+    def get(self, follow_id: str) -> Optional[LocalFollow]:
+        with self._lock:
+            return self._follows.get(follow_id)
+
+    def remove(self, follow_id: str) -> Optional[LocalFollow]:
+        with self._lock:
+            return self._follows.pop(follow_id, None)
+
+    def list(self) -> List[LocalFollow]:
+        with self._lock:
+            return list(self._follows.values())
+
+    def clear(self) -> List[LocalFollow]:
+        """Stop all follows (their queued polls become no-ops)."""
+        with self._lock:
+            follows = list(self._follows.values())
+            self._follows.clear()
+            return follows
+
+    def stop_files(self, paths: List[str]):
+        """Stop tailing these files in every follow; the glob does not pick them up again."""
+        for follow in self.list():
+            for path in paths:
+                tailed = follow.files.get(path)
+                if tailed is not None:
+                    tailed.finished = True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            for follow in self.list():
+                try:
+                    self.poll(follow)
+                    follow.error = None
+                except Exception as e:
+                    follow.error = str(e)
+                    print(f"Polling {follow.pattern} failed: {e}")
+                follow.last_poll = time.time()
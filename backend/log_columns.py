@@ -0,0 +1,270 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from log_lexer import DEBUG, ERROR, INFO, WARNING, lex_message
+
+
+# Most buckets one /stats/timeline response may have (per series)
+TIMELINE_MAX_BUCKETS = int(os.environ.get("TIMELINE_MAX_BUCKETS", "20000"))
+
+# Level columns; rows without a level keyword count as INFO (as in the raw export)
+LEVELS = (ERROR, WARNING, INFO, DEBUG)
+_LEVEL_CODES = {ERROR: 0, WARNING: 1, INFO: 2, DEBUG: 3, None: 2}
+# Fields a timeline can be split by, and the series key each one is reported under
+TIMELINE_GROUPS = {"device": "device_id", "file": "filename"}
+
+
+class SegmentColumns:
+    """
+    Per-row arrays of one segment for vectorized aggregation: time_ms (0 where
+    has_time is False), level code (index into LEVELS) and device code (index
+    into devices, in order of first appearance). About 14 bytes per row; built
+    on first use and kept when the rows are spilled.
+    """
+
+    __slots__ = ("time_ms", "has_time", "level", "device", "devices")
+
+    def __init__(self, logs: List[dict]):
+        count = len(logs)
+        times = [row["time_ms"] for row in logs]
+        self.has_time = np.fromiter((time_ms is not None for time_ms in times), dtype=bool, count=count)
+        self.time_ms = np.fromiter((time_ms or 0 for time_ms in times), dtype=np.int64, count=count)
+        self.level = np.fromiter((_LEVEL_CODES[lex_message(row["message"]).level] for row in logs), dtype=np.int8, count=count)
+        device_codes: Dict[str, int] = {}
+        self.device = np.fromiter(
+            (device_codes.setdefault(row["device_id"], len(device_codes)) for row in logs), dtype=np.int32, count=count
+        )
+        self.devices = list(device_codes)
+
+
+def device_level_counts(segments: Sequence) -> Dict[str, np.ndarray]:
+    """device_id -> row count per level (in LEVELS order), devices in order of first appearance."""
+    counts: Dict[str, np.ndarray] = {}
+    for segment in segments:
+        columns = segment.columns
+        if not columns.devices:
+            continue
+        per_device = np.bincount(
+            columns.device.astype(np.int64) * len(LEVELS) + columns.level, minlength=len(columns.devices) * len(LEVELS)
+        ).reshape(len(columns.devices), len(LEVELS))
+        for device_id, row in zip(columns.devices, per_device):
+            if device_id in counts:
+                counts[device_id] += row
+            else:
+                counts[device_id] = row.copy()
+    return counts
+
+
+def compute_timeline(
+    segments: Sequence,
+    bucket_ms: int,
+    group_by: Sequence[str] = (),
+    device_id: Optional[str] = None,
+    time_from: Optional[int] = None,
+    time_to: Optional[int] = None,
+) -> dict:
+    """
+    Row counts per time bucket and level, one series per group (device and/or file).
+
+    Buckets are aligned to multiples of bucket_ms and dense from the first to the
+    last non-empty one, so results of different shards line up. time_ms is
+    relative to each file, so rows of files from different days with the same
+    time of day share a bucket. Rows without a time are left out. Raises
+    ValueError when the range needs more than TIMELINE_MAX_BUCKETS buckets.
+    """
+    times, levels, groups = [], [], []
+    group_keys: Dict[tuple, int] = {}
+    for segment in segments:
+        columns = segment.columns
+        mask = columns.has_time
+        if time_from is not None:
+            mask = mask & (columns.time_ms >= time_from)
+        if time_to is not None:
+            mask = mask & (columns.time_ms <= time_to)
+        if device_id is not None:
+            if device_id not in columns.devices:
+                continue
+            mask = mask & (columns.device == columns.devices.index(device_id))
+        if not mask.any():
+            continue
+        # Segment-local group codes, mapped to codes shared by all segments
+        if "device" in group_by:
+            local = columns.device[mask]
+            mapping = np.zeros(len(columns.devices), dtype=np.int64)
+            for device in np.unique(local).tolist():
+                key = _group_key(group_by, columns.devices[device], segment.filename)
+                mapping[device] = group_keys.setdefault(key, len(group_keys))
+            groups.append(mapping[local])
+        else:
+            code = group_keys.setdefault(_group_key(group_by, None, segment.filename), len(group_keys))
+            groups.append(np.full(int(mask.sum()), code, dtype=np.int64))
+        times.append(columns.time_ms[mask])
+        levels.append(columns.level[mask])
+
+    if not times:
+        return {"bucket_ms": bucket_ms, "levels": list(LEVELS), "buckets": [], "series": []}
+
+    bucket = np.concatenate(times) // bucket_ms
+    first, last = int(bucket.min()), int(bucket.max())
+    bucket_count = last - first + 1
+    if bucket_count > TIMELINE_MAX_BUCKETS:
+        raise ValueError(f"{bucket_count} buckets exceed the limit of {TIMELINE_MAX_BUCKETS}; use a wider bucket or a time range")
+
+    # One flat bincount over (group, level, bucket)
+    flat = (np.concatenate(groups) * len(LEVELS) + np.concatenate(levels)) * bucket_count + (bucket - first)
+    counts = np.bincount(flat, minlength=len(group_keys) * len(LEVELS) * bucket_count)
+    counts = counts.reshape(len(group_keys), len(LEVELS), bucket_count)
+
+    series = []
+    for key, code in group_keys.items():
+        entry = dict(zip((TIMELINE_GROUPS[name] for name in group_by), key))
+        entry["counts"] = {level: counts[code, index].tolist() for index, level in enumerate(LEVELS)}
+        entry["total"] = counts[code].sum(axis=0).tolist()
+        series.append(entry)
+    return {
+        "bucket_ms": bucket_ms,
+        "levels": list(LEVELS),
+        "buckets": list(range(first * bucket_ms, (last + 1) * bucket_ms, bucket_ms)),
+        "series": series,
+    }
+
+
+def _group_key(group_by: Sequence[str], device_id: Optional[str], filename: str) -> tuple:
+    return tuple(device_id if name == "device" else filename for name in group_by)
+
+
+def merge_timelines(timelines: List[dict], bucket_ms: int) -> dict:
+    """Add up timelines of disjoint rows (e.g. of several shards) with the same bucket_ms and grouping."""
+    timelines = [timeline for timeline in timelines if timeline["buckets"]]
+    if not timelines:
+        return {"bucket_ms": bucket_ms, "levels": list(LEVELS), "buckets": [], "series": []}
+    first = min(timeline["buckets"][0] for timeline in timelines)
+    last = max(timeline["buckets"][-1] for timeline in timelines)
+    bucket_count = (last - first) // bucket_ms + 1
+    merged: Dict[tuple, dict] = {}
+    for timeline in timelines:
+        offset = (timeline["buckets"][0] - first) // bucket_ms
+        for entry in timeline["series"]:
+            key = tuple((name, value) for name, value in entry.items() if name not in ("counts", "total"))
+            target = merged.get(key)
+            if target is None:
+                target = merged[key] = dict(key)
+                target["counts"] = {level: [0] * bucket_count for level in LEVELS}
+                target["total"] = [0] * bucket_count
+            for level, values in entry["counts"].items():
+                column = target["counts"][level]
+                for index, value in enumerate(values, offset):
+                    column[index] += value
+            for index, value in enumerate(entry["total"], offset):
+                target["total"][index] += value
+    return {
+        "bucket_ms": bucket_ms,
+        "levels": list(LEVELS),
+        "buckets": list(range(first, last + 1, bucket_ms)),
+        "series": list(merged.values()),
+    }
+
+
+def duration_stats(durations: Sequence[int]) -> Optional[dict]:
+    """count, mean, p50, p95 and max of durations in ms (None when there are none)."""
+    if not len(durations):
+        return None
+    values = np.asarray(durations, dtype=np.float64)
+    p50, p95 = np.percentile(values, (50, 95))
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 1),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "max_ms": int(values.max()),
+    }
+
+
+def compute_dwell(
+    sessions: Sequence[int],
+    times: Sequence[Optional[int]],
+    navigations: Sequence[tuple],
+    logins: Dict[int, int],
+) -> dict:
+    """
+    Dwell times of a run of log rows, given per row its session id and time_ms,
+    the (row, screen) of every NAVIGATE-TO and the row of each session's first login.
+
+    The dwell of a navigation is the time until the next navigation of its session,
+    or until the session's last timed row; it counts for its screen and for the edge
+    to the next screen. login -> first screen edges get the time from the login to
+    the first navigation after it. Navigations without a time, and negative times
+    (out-of-order lines), give no sample.
+
+    Returns samples in ms: {"screens": {screen: [...]}, "transitions": {(from, to): [...]},
+    "session_durations": {session_id: last - first timed row}}.
+    """
+    session_ids, row_session = np.unique(np.asarray(sessions, dtype=np.int64), return_inverse=True)
+    row_time = np.fromiter((np.nan if time_ms is None else time_ms for time_ms in times), dtype=np.float64, count=len(times))
+    timed = ~np.isnan(row_time)
+    starts = np.full(len(session_ids), np.inf)
+    ends = np.full(len(session_ids), -np.inf)
+    np.minimum.at(starts, row_session[timed], row_time[timed])
+    np.maximum.at(ends, row_session[timed], row_time[timed])
+    has_times = np.isfinite(starts)
+    result = {
+        "screens": {},
+        "transitions": {},
+        "session_durations": dict(zip(session_ids[has_times].tolist(), (ends - starts)[has_times].astype(np.int64).tolist())),
+    }
+    if not navigations:
+        return result
+
+    # Navigations grouped by session, in row order within each session
+    nav_row = np.fromiter((row for row, _ in navigations), dtype=np.int64, count=len(navigations))
+    screen_names, nav_screen = np.unique(np.asarray([screen for _, screen in navigations], dtype=object), return_inverse=True)
+    order = np.argsort(row_session[nav_row], kind="stable")
+    nav_row, nav_screen = nav_row[order], nav_screen[order]
+    nav_session = row_session[nav_row]
+    nav_time = row_time[nav_row]
+
+    has_next = np.zeros(len(nav_row), dtype=bool)
+    has_next[:-1] = nav_session[1:] == nav_session[:-1]
+    leave = ends[nav_session]
+    leave[:-1] = np.where(has_next[:-1], nav_time[1:], leave[:-1])
+    dwell = leave - nav_time
+    valid = np.isfinite(dwell) & (dwell >= 0)
+    result["screens"] = _group_samples(nav_screen[valid], dwell[valid], lambda code: screen_names[code])
+
+    # Edge of each navigation to the next one in its session, coded from * screens + to
+    edge = (has_next & valid)[:-1]
+    edge_codes = nav_screen[:-1][edge] * len(screen_names) + nav_screen[1:][edge]
+    result["transitions"] = _group_samples(
+        edge_codes, dwell[:-1][edge], lambda code: (screen_names[code // len(screen_names)], screen_names[code % len(screen_names)])
+    )
+
+    if logins:
+        # First navigation after each session's first login
+        login_row = np.full(len(session_ids), np.iinfo(np.int64).max)
+        login_sessions = np.searchsorted(session_ids, np.fromiter(logins, dtype=np.int64, count=len(logins)))
+        login_row[login_sessions] = np.fromiter(logins.values(), dtype=np.int64, count=len(logins))
+        after = np.flatnonzero(nav_row > login_row[nav_session])
+        _, first = np.unique(nav_session[after], return_index=True)
+        firsts = after[first]
+        login_dwell = nav_time[firsts] - row_time[login_row[nav_session[firsts]]]
+        ok = np.isfinite(login_dwell) & (login_dwell >= 0)
+        login_samples = _group_samples(nav_screen[firsts][ok], login_dwell[ok], lambda code: ("login", screen_names[code]))
+        # A screen named "login" has the same edges; add to them like the transition matrix does
+        for key, samples in login_samples.items():
+            result["transitions"].setdefault(key, []).extend(samples)
+    return result
+
+
+def _group_samples(codes: np.ndarray, values: np.ndarray, name_of: Callable[[int], Any]) -> dict:
+    """name_of(code) -> the values (as ints) with that code."""
+    if not len(codes):
+        return {}
+    order = np.argsort(codes, kind="stable")
+    codes, values = codes[order], values[order].astype(np.int64)
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    return {
+        name_of(int(group[0])): samples.tolist()
+        for group, samples in zip(np.split(codes, boundaries), np.split(values, boundaries))
+    }
@@ -0,0 +1,164 @@
+import functools
+import os
+import re
+from typing import Optional
+
+
+# Distinct stored messages whose tokens are kept for queries (0 = no caching)
+LEX_CACHE_SIZE = int(os.environ.get("LEX_CACHE_SIZE", "65536"))
+
+# ----------------- Token Kinds -----------------
+DEVICE = "device"              # "DEVICE ID <id>" marker: switches the current device (not stored as a row)
+ENTRY = "entry"                # "LOG-APP ... App Version": starts a session
+LOGIN = "login"                # "LOG-APP ... Model Name"
+NAVIGATE = "navigate"          # "NAVIGATE-TO ... screen : <name>"
+TESTING_INFO = "testing-info"  # "ECS-ACTIVITY ... TESTING-INFO" test lifecycle event
+BACKGROUND = "background"      # the app moved to the background
+ACTIVE = "active"              # the app came back to the foreground
+ACTIVITY = "activity"          # any other ECS-ACTIVITY event
+MESSAGE = "message"            # everything else
+
+# ----------------- Levels -----------------
+ERROR = "ERROR"
+WARNING = "WARNING"
+INFO = "INFO"
+DEBUG = "DEBUG"
+
+# Every keyword the lexer looks for, as one alternation of literals run over the
+# upper-cased line: a single regex scan per line. Keywords sharing a first letter are
+# grouped so the engine tries few branches per position (about twice as fast as a
+# flat list). Captures (time, device id, screen) are only run on the original line
+# when their keyword is present.
+_KEYWORDS = re.compile(
+    "DE(?:VICE ID|BUG)"
+    "|LOG-APP"
+    "|APP VERSION"
+    "|MODEL NAME"
+    "|MOVED TO (?:BACK|FORE)GROUND"
+    "|E(?:CS-ACTIVITY|RROR|XCEPTION|NTERED (?:BACK|FORE)GROUND)"
+    "|NAVIGATE-TO"
+    "|TESTING-INFO"
+    "|DID (?:ENTER BACKGROUND|BECOME ACTIVE)"
+    "|BECAME ACTIVE"
+    "|WARN"
+    "|INFO"
+)
+_DEVICE_KW, _LOGAPP_KW, _VERSION_KW, _MODEL_KW, _ACTIVITY_KW, _NAVIGATE_KW, _TESTING_KW = (1 << bit for bit in range(7))
+_BACKGROUND_KW, _ACTIVE_KW, _ERROR_KW, _WARNING_KW, _INFO_KW, _DEBUG_KW, _ENTRY_KW, _LOGIN_KW = (1 << bit for bit in range(7, 15))
+_KEYWORD_BITS = {
+    "DEVICE ID": _DEVICE_KW,
+    "LOG-APP": _LOGAPP_KW,
+    "APP VERSION": _VERSION_KW,
+    "MODEL NAME": _MODEL_KW,
+    "ECS-ACTIVITY": _ACTIVITY_KW,
+    "NAVIGATE-TO": _NAVIGATE_KW,
+    "TESTING-INFO": _TESTING_KW | _INFO_KW,  # the INFO inside TESTING-INFO counts as a level keyword
+    "MOVED TO BACKGROUND": _BACKGROUND_KW,
+    "ENTERED BACKGROUND": _BACKGROUND_KW,
+    "DID ENTER BACKGROUND": _BACKGROUND_KW,
+    "MOVED TO FOREGROUND": _ACTIVE_KW,
+    "ENTERED FOREGROUND": _ACTIVE_KW,
+    "BECAME ACTIVE": _ACTIVE_KW,
+    "DID BECOME ACTIVE": _ACTIVE_KW,
+    "ERROR": _ERROR_KW,
+    "EXCEPTION": _ERROR_KW,
+    "WARN": _WARNING_KW,
+    "INFO": _INFO_KW,
+    "DEBUG": _DEBUG_KW,
+}
+_TIME = re.compile(r"(\d{2}:\d{2}:\d{2}:\d{2,3})")
+_DEVICE = re.compile(r"DEVICE ID\s+([A-Z0-9\-]+)")
+_SCREEN = re.compile(r"NAVIGATE-TO.*screen\s*:\s*([^}\s,]+)")
+
+
+class Token:
+    """
+    One log line, classified.
+
+    kind       one of the token kinds above
+    time       leading "HH:MM:SS:MMM" (or ":MM") time, if any
+    level      ERROR / WARNING / INFO / DEBUG keyword found in the line, if any
+    screen     target screen of a NAVIGATE token
+    device_id  id of a DEVICE token
+    message    the line without its time prefix and the " | " after it
+    """
+
+    __slots__ = ("kind", "time", "level", "screen", "device_id", "message")
+
+    def __init__(self, kind: str, time: Optional[str], level: Optional[str], screen: Optional[str], device_id: Optional[str], message: str):
+        self.kind = kind
+        self.time = time
+        self.level = level
+        self.screen = screen
+        self.device_id = device_id
+        self.message = message
+
+    def __repr__(self):
+        return f"Token({self.kind!r}, time={self.time!r}, level={self.level!r}, screen={self.screen!r})"
+
+
+def lex(line: str) -> Token:
+    """Classify a decrypted log line (or a stored message)."""
+    seen = 0
+    for keyword in _KEYWORDS.findall(line.upper()):
+        bit = _KEYWORD_BITS[keyword]
+        # "App Version" / "Model Name" only count after LOG-APP
+        if bit == _VERSION_KW and seen & _LOGAPP_KW:
+            bit = _ENTRY_KW
+        elif bit == _MODEL_KW and seen & _LOGAPP_KW:
+            bit = _LOGIN_KW
+        seen |= bit
+
+    time = device_id = screen = None
+    message = line
+    if line[:1].isdigit():
+        time_match = _TIME.match(line)
+        if time_match:
+            time = time_match.group(1)
+            message = line[time_match.end():].lstrip(" |")
+    if seen & _DEVICE_KW:
+        device_match = _DEVICE.search(line)
+        if device_match:
+            device_id = device_match.group(1)
+    if seen & _NAVIGATE_KW:
+        screen_match = _SCREEN.search(line)
+        if screen_match:
+            screen = screen_match.group(1)
+
+    if device_id is not None:
+        kind = DEVICE
+    elif seen & _ENTRY_KW:
+        kind = ENTRY
+    elif seen & _LOGIN_KW:
+        kind = LOGIN
+    elif screen is not None:
+        kind = NAVIGATE
+    elif seen & _TESTING_KW and seen & _ACTIVITY_KW:
+        kind = TESTING_INFO
+    elif seen & _BACKGROUND_KW:
+        kind = BACKGROUND
+    elif seen & _ACTIVE_KW:
+        kind = ACTIVE
+    elif seen & _ACTIVITY_KW:
+        kind = ACTIVITY
+    else:
+        kind = MESSAGE
+
+    if seen & _ERROR_KW:
+        level = ERROR
+    elif seen & _WARNING_KW:
+        level = WARNING
+    elif seen & _INFO_KW:
+        level = INFO
+    elif seen & _DEBUG_KW:
+        level = DEBUG
+    else:
+        level = None
+    return Token(kind, time, level, screen, device_id, message)
+
+
+# Queries lex stored messages (without time prefix) over and over, and the same
+# message text recurs across rows and sessions; their tokens are memoized. Tokens
+# are shared, so callers must not modify them. Ingest calls lex() directly: its
+# lines carry a time prefix and are nearly all distinct.
+lex_message = functools.lru_cache(maxsize=LEX_CACHE_SIZE)(lex) if LEX_CACHE_SIZE > 0 else lex
@@ -0,0 +1,365 @@
+import base64
+import codecs
+from hashlib import md5
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+from Crypto.Cipher import AES
+
+from log_lexer import DEVICE, ENTRY, NAVIGATE, lex
+from stage_timings import timed_stage
+
+
+PASS_PHRASE = "ecsite"
+
+# Lines per batch in LogFileParser.feed_lines (stages are timed once per batch, not per line)
+FEED_BATCH_LINES = 4096
+# Files are read in chunks of this size instead of all at once
+READ_CHUNK_SIZE = 1024 * 1024
+MS_PER_DAY = 24 * 3600 * 1000
+# A device's clock going back by more than this is taken as a midnight rollover,
+# smaller steps back as out-of-order lines of the same day
+ROLLOVER_GAP_MS = 12 * 3600 * 1000
+
+
+# ----------------- AES Decrypt -----------------
+def cryptojs_decrypt(passphrase: str, ciphertext: str) -> str:
+    ct = base64.b64decode(ciphertext)
+    if ct[:8] != b"Salted__":
+        raise ValueError("Not a valid salted CryptoJS ciphertext")
+    salt = ct[8:16]
+    ciphertext_bytes = ct[16:]
+
+    d = d_i = b""
+    while len(d) < 32 + 16:  # key=32, iv=16
+        d_i = md5(d_i + passphrase.encode() + salt).digest()
+        d += d_i
+    key = d[:32]
+    iv = d[32:48]
+
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    decrypted = cipher.decrypt(ciphertext_bytes)
+    pad_len = decrypted[-1]
+    return decrypted[:-pad_len].decode("utf-8", errors="ignore")
+
+
+# ----------------- Log Times -----------------
+def time_to_ms(value: str) -> Optional[int]:
+    """
+    Milliseconds since midnight of an "HH:MM:SS:MMM" time. Fractions with fewer
+    digits are read as decimals ("HH:MM:SS:MM" is in hundredths); seconds and the
+    fraction may be left out. None if the value is not such a time.
+    """
+    parts = value.split(":")
+    if not 2 <= len(parts) <= 4 or not all(part.isdigit() for part in parts):
+        return None
+    hours, minutes = int(parts[0]), int(parts[1])
+    seconds = int(parts[2]) if len(parts) > 2 else 0
+    millis = int(parts[3][:3].ljust(3, "0")) if len(parts) > 3 else 0
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return None
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + millis
+
+
+# ----------------- Chunked Line Reader -----------------
+def iter_text_lines(fileobj, progress=None, errors: str = "strict"):
+    """
+    Read a binary file object in READ_CHUNK_SIZE chunks and yield decoded lines.
+    Only one chunk (plus a partial line) is held in memory at a time.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors=errors)
+    pending = ""
+    while True:
+        chunk = fileobj.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if progress is not None:
+            progress.add(bytes_read=len(chunk))
+        text = pending + decoder.decode(chunk)
+        lines = text.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_mapped_lines(buffer, start: int, end: int, progress=None, errors: str = "strict"):
+    """
+    Yield the decoded lines of buffer[start:end] (typically an mmap), which must end
+    on a line boundary. Text is decoded straight from the mapping, READ_CHUNK_SIZE
+    bytes at a time cut at the last newline, so the file is never read into an
+    intermediate bytes buffer.
+    """
+    with memoryview(buffer) as view:
+        position = start
+        while position < end:
+            cut = min(position + READ_CHUNK_SIZE, end)
+            if cut < end:
+                newline = buffer.rfind(b"\n", position, cut)
+                cut = newline + 1 if newline >= 0 else (buffer.find(b"\n", cut, end) + 1 or end)
+            if progress is not None:
+                progress.add(bytes_read=cut - position)
+            yield from str(view[position:cut], "utf-8", errors).split("\n")
+            position = cut
+
+
+# ----------------- Line Parsing -----------------
+class ParsedFile:
+    """Log rows and session summaries produced from one file."""
+
+    def __init__(
+        self,
+        filename: str,
+        logs: List[dict],
+        sessions: List[dict],
+        last_session_id: int,
+        session_id_start: int = 0,
+        leading_logs: int = 0,
+    ):
+        self.filename = filename
+        self.logs = logs
+        self.sessions = sessions
+        # Highest session id handed out while parsing (may have no rows/summary)
+        self.last_session_id = last_session_id
+        # Last session id before this file, and how many rows (at the start) belong to it
+        self.session_id_start = session_id_start
+        self.leading_logs = leading_logs
+
+    @property
+    def next_log_id(self) -> Optional[int]:
+        return self.logs[-1]["id"] + 1 if self.logs else None
+
+    def renumber(self, log_id_start: int, session_id_start: int):
+        """
+        Move the file's log and session ids as if it had been parsed with these starts
+        (for files parsed ahead of time, before their place in the store was known).
+        """
+        if self.logs and self.logs[0]["id"] != log_id_start:
+            for log_id, log in enumerate(self.logs, log_id_start):
+                log["id"] = log_id
+        shift = session_id_start - self.session_id_start
+        if shift:
+            leading_session_id = session_id_start if session_id_start > 0 else 1
+            for index, log in enumerate(self.logs):
+                log["session_id"] = leading_session_id if index < self.leading_logs else log["session_id"] + shift
+            for session in self.sessions:
+                session["session_id"] += shift
+            self.last_session_id += shift
+            self.session_id_start = session_id_start
+
+
+class LogFileParser:
+    """
+    Turns the lines of one log file into log rows and session summaries.
+    Lines are fed one at a time so files never need to be held in memory.
+
+    Session boundaries:
+    1) Entry log point: "LOG-APP: App Version:" starts/renews a session
+    2) Logs before the first entry of the file stay in the last existing session
+    A session summary covers the rows of the device that was current when the
+    session closed.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        decrypt: bool = True,
+        log_id_start: int = 1,
+        session_id_start: int = 0,
+        progress=None,
+    ):
+        self.filename = filename
+        self.decrypt = decrypt
+        self.progress = progress
+        self.logs: List[dict] = []
+        self.sessions: List[dict] = []
+
+        self.device_counters: Dict[str, int] = {}
+        self.current_device_id: Optional[str] = None
+        self.next_log_id = log_id_start
+        # Sessions started in this file get ids above the existing ones
+        self.first_session_id = session_id_start + 1
+        # Rows before the first session entry of the file (they stay in the last existing session)
+        self.leading_logs = 0
+        self.current_session_id = session_id_start
+        # New sessions get ids above this one (see continue_at)
+        self.session_id_floor = 0
+        self.current_session_screens: List[str] = []
+        # device_id -> [start_time, end_time, entries_count, start_time_ms, end_time_ms] for the current session
+        self.current_session_devices: Dict[str, list] = {}
+        # device_id -> [day offset in ms, last time of day in ms] (see absolute_time_ms)
+        self.device_clocks: Dict[str, list] = {}
+
+    def feed(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        self.feed_decrypted(self.decrypt_line(line), line)
+
+    def feed_lines(self, lines: Iterable[str]):
+        """
+        Feed many lines. They are handled in batches so the read, decrypt and
+        classify stages can be timed separately (see stage_timings).
+        """
+        lines = iter(lines)
+        while True:
+            with timed_stage("read"):
+                batch = [line for line in (raw.strip() for raw in islice(lines, FEED_BATCH_LINES)) if line]
+                if not batch:
+                    return
+            with timed_stage("decrypt"):
+                decrypted = [self.decrypt_line(line) for line in batch]
+            with timed_stage("classify"):
+                for text, line in zip(decrypted, batch):
+                    self.feed_decrypted(text, line)
+
+    def decrypt_line(self, line: str) -> str:
+        """Plain text of a stripped, non-empty line (an "ERROR: ..." text if it does not decrypt)."""
+        if self.decrypt:
+            try:
+                decrypted = cryptojs_decrypt(PASS_PHRASE, line)
+                if self.progress is not None:
+                    self.progress.add(lines_read=1, lines_decrypted=1)
+            except Exception as e:
+                decrypted = f"ERROR: {str(e)}"
+                if self.progress is not None:
+                    self.progress.add(lines_read=1, decrypt_failures=1)
+        else:
+            # Already decrypted (e.g. members of decryptedLogs.zip)
+            decrypted = line
+            if self.progress is not None:
+                self.progress.add(lines_read=1, lines_decrypted=1)
+        return decrypted
+
+    def feed_decrypted(self, decrypted: str, raw: str):
+        token = lex(decrypted)
+        if token.kind == DEVICE:
+            self.current_device_id = token.device_id
+            if self.current_device_id not in self.device_counters:
+                self.device_counters[self.current_device_id] = 1
+            return
+
+        if token.kind == ENTRY:
+            # Close the previous session (only if it started in this file) and start a new one
+            if self.current_device_id and self.current_session_id >= self.first_session_id:
+                self._close_session()
+            self.current_session_id = max(self.current_session_id, self.session_id_floor) + 1
+            self.current_session_screens = []
+            self.current_session_devices = {}
+
+        # Only log if device is known
+        if not self.current_device_id:
+            return
+
+        # Time at the beginning of the decrypted message (HH:MM:SS:MMM or HH:MM:SS:MM),
+        # removed from the message together with the " |" after it
+        extracted_time = token.time
+        cleaned_message = token.message
+
+        device_id = self.current_device_id
+        time_ms = self.absolute_time_ms(device_id, extracted_time)
+        self.logs.append({
+            "id": self.next_log_id,  # unique across all logs
+            "device_log_id": self.device_counters[device_id],  # per-device counter
+            "device_id": device_id,
+            "time": extracted_time,  # optional precise time from decrypted line
+            "time_ms": time_ms,  # the time in ms from midnight of the device's first day in the file
+            "message": cleaned_message,
+            "session_id": self.current_session_id if self.current_session_id > 0 else 1,
+            "raw": raw,
+            "filename": self.filename,  # track which file this log came from
+        })
+        if self.progress is not None:
+            self.progress.add(logs_stored=1)
+        if self.current_session_id < self.first_session_id:
+            self.leading_logs += 1
+
+        # Update session tracking metadata
+        stats = self.current_session_devices.get(device_id)
+        if stats is None:
+            self.current_session_devices[device_id] = [extracted_time, extracted_time, 1, time_ms, time_ms]
+        else:
+            stats[1] = extracted_time
+            stats[2] += 1
+            if time_ms is not None:
+                if stats[3] is None:
+                    stats[3] = time_ms
+                stats[4] = time_ms
+        if token.kind == NAVIGATE:
+            # capture screen transitions, e.g., NAVIGATE-TO : { screen : siteList }
+            self.current_session_screens.append(token.screen)
+
+        # Increment counters
+        self.device_counters[device_id] += 1
+        self.next_log_id += 1
+
+    def absolute_time_ms(self, device_id: str, time: Optional[str]) -> Optional[int]:
+        """
+        Time of a row in ms, counting days from the device's first row in the file:
+        each time the device's clock goes back past midnight a day is added.
+        Lines carry no date, so day 0 is the device's first day in this file and
+        times of different files are not on a common date.
+        """
+        if time is None:
+            return None
+        time_of_day = time_to_ms(time)
+        if time_of_day is None:
+            return None
+        clock = self.device_clocks.get(device_id)
+        if clock is None:
+            clock = self.device_clocks[device_id] = [0, time_of_day]
+        elif time_of_day + ROLLOVER_GAP_MS < clock[1]:
+            clock[0] += MS_PER_DAY
+        clock[1] = time_of_day
+        return clock[0] + time_of_day
+
+    def _close_session(self):
+        stats = self.current_session_devices.get(self.current_device_id)
+        if not stats:
+            return
+        with timed_stage("session-build"):
+            self.sessions.append({
+                "device_id": self.current_device_id,
+                "session_id": self.current_session_id,
+                "start_time": stats[0],
+                "end_time": stats[1],
+                "start_time_ms": stats[3],
+                "end_time_ms": stats[4],
+                "duration_ms": stats[4] - stats[3] if stats[3] is not None else None,
+                "entries_count": stats[2],
+                "screens": self.current_session_screens,
+                "filename": self.filename,  # track which file this session came from
+            })
+            if self.progress is not None:
+                self.progress.add(sessions_closed=1)
+
+    def continue_at(self, log_id_start: int, session_id_start: int):
+        """
+        Keep parsing a growing file after other files were stored: further rows get
+        ids from log_id_start on and new sessions ids above session_id_start.
+        The open session keeps its id.
+        """
+        self.next_log_id = max(self.next_log_id, log_id_start)
+        self.session_id_floor = max(self.session_id_floor, session_id_start)
+
+    def drain(self) -> ParsedFile:
+        """
+        Rows and closed sessions parsed since the last drain; the current session
+        stays open so more lines can be fed.
+        """
+        parsed = ParsedFile(self.filename, self.logs, self.sessions, self.current_session_id)
+        self.logs = []
+        self.sessions = []
+        return parsed
+
+    def finish(self) -> ParsedFile:
+        # Finalize last session summary
+        with timed_stage("session-build"):
+            if self.current_device_id and self.current_session_id >= self.first_session_id:
+                self._close_session()
+            return ParsedFile(
+                self.filename, self.logs, self.sessions, self.current_session_id,
+                session_id_start=self.first_session_id - 1, leading_logs=self.leading_logs,
+            )
@@ -0,0 +1,567 @@
+import asyncio
+import atexit
+import bisect
+import contextvars
+import itertools
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from log_columns import SegmentColumns
+from request_stats import add_rows_scanned
+from stage_timings import StageLaps
+
+
+# Memory budget for log rows; above it the least recently queried segments are spilled to disk (0 = no limit)
+LOG_STORE_MEMORY_BUDGET_MB = float(os.environ.get("LOG_STORE_MEMORY_BUDGET_MB", "0"))
+# Directory for spilled segments (a private subdirectory is created per process)
+LOG_STORE_SPILL_DIR = os.environ.get("LOG_STORE_SPILL_DIR", "") or tempfile.gettempdir()
+
+# Row fields whose values are shared between rows and not counted per row
+_SHARED_FIELDS = ("device_id", "filename")
+
+
+def estimate_rows_size(logs: List[dict]) -> int:
+    """Approximate memory held by a list of log rows."""
+    size = sys.getsizeof(logs)
+    for row in logs:
+        size += sys.getsizeof(row)
+        for key, value in row.items():
+            if key not in _SHARED_FIELDS:
+                size += sys.getsizeof(value)
+    return size
+
+
+class TimeIndex:
+    """
+    Rows and sessions of a segment sorted by time_ms, so time ranges are found by
+    binary search. Rows without a time are left out. positions is None when the
+    rows already are in time order (the usual case for a single-device file).
+    """
+
+    __slots__ = ("keys", "positions", "session_starts", "session_positions")
+
+    def __init__(self, logs: List[dict], sessions: List[dict]):
+        timed = [(row["time_ms"], position) for position, row in enumerate(logs) if row.get("time_ms") is not None]
+        in_order = len(timed) == len(logs) and all(timed[i][0] <= timed[i + 1][0] for i in range(len(timed) - 1))
+        if not in_order:
+            timed.sort()
+        self.keys = [time_ms for time_ms, _ in timed]
+        self.positions = None if in_order else [position for _, position in timed]
+        started = sorted(
+            (session["start_time_ms"], position)
+            for position, session in enumerate(sessions)
+            if session.get("start_time_ms") is not None
+        )
+        self.session_starts = [start for start, _ in started]
+        self.session_positions = [position for _, position in started]
+
+    def rows_between(self, time_from: Optional[int], time_to: Optional[int]) -> List[int]:
+        """Positions (ascending) of the rows with time_from <= time_ms <= time_to; a bound may be None."""
+        left = 0 if time_from is None else bisect.bisect_left(self.keys, time_from)
+        right = len(self.keys) if time_to is None else bisect.bisect_right(self.keys, time_to)
+        if left >= right:
+            return []
+        if self.positions is None:
+            return list(range(left, right))
+        return sorted(self.positions[left:right])
+
+    def sessions_between(self, sessions: List[dict], time_from: Optional[int], time_to: Optional[int]) -> List[int]:
+        """Positions (ascending) of the sessions overlapping [time_from, time_to]."""
+        right = len(self.session_starts) if time_to is None else bisect.bisect_right(self.session_starts, time_to)
+        return sorted(
+            position for position in self.session_positions[:right]
+            if time_from is None or sessions[position]["end_time_ms"] >= time_from
+        )
+
+
+class Segment:
+    """
+    Logs and session summaries of one ingested file.
+    Segments are immutable once added to the store; dropping a file
+    just removes its segments from the catalog.
+
+    The rows of a segment may be spilled to disk by SegmentResidency;
+    reading .logs pages them back in transparently. The time index and the
+    columns (see log_columns) are built on first use and stay in memory when the
+    rows are spilled.
+    """
+
+    __slots__ = (
+        "segment_id", "filename", "sessions", "first_log_id", "last_log_id", "row_count", "nbytes",
+        "last_access", "_logs", "_residency", "_spill_path", "_spill_bytes", "_dropped", "_time_index",
+        "_columns",
+    )
+
+    def __init__(self, segment_id: int, filename: str, logs: List[dict], sessions: List[dict]):
+        self.segment_id = segment_id
+        self.filename = filename
+        self.sessions = sessions
+        self.first_log_id = logs[0]["id"] if logs else None
+        self.last_log_id = logs[-1]["id"] if logs else None
+        self.row_count = len(logs)
+        self.nbytes = 0
+        self.last_access = time.time()
+        self._logs: Optional[List[dict]] = logs
+        self._residency: Optional["SegmentResidency"] = None
+        self._spill_path: Optional[str] = None
+        self._spill_bytes = 0
+        self._dropped = False
+        self._time_index: Optional[TimeIndex] = None
+        self._columns: Optional[SegmentColumns] = None
+
+    @property
+    def logs(self) -> List[dict]:
+        logs = self._logs
+        if self._residency is None:
+            return logs
+        if logs is None:
+            return self._residency.page_in(self)
+        self._residency.touch(self)
+        return logs
+
+    @property
+    def time_index(self) -> TimeIndex:
+        index = self._time_index
+        if index is None:
+            index = self._time_index = TimeIndex(self.logs, self.sessions)
+        return index
+
+    @property
+    def columns(self) -> SegmentColumns:
+        columns = self._columns
+        if columns is None:
+            columns = self._columns = SegmentColumns(self.logs)
+        return columns
+
+    @property
+    def resident(self) -> bool:
+        return self._logs is not None
+
+    def __len__(self):
+        return self.row_count
+
+    def __del__(self):
+        # Spill files live as long as some snapshot can still reach the segment
+        path = getattr(self, "_spill_path", None)
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class SegmentResidency:
+    """
+    Keeps the rows of the most recently queried segments in memory within a byte budget.
+    Colder segments are written once to a compressed pickle file and dropped from
+    memory; they are read back on the next access (and may push others out).
+    """
+
+    def __init__(self, budget_bytes: int, spill_dir: str):
+        self.budget_bytes = budget_bytes
+        self.spill_root = spill_dir
+        self.spill_dir: Optional[str] = None
+        self.resident_bytes = 0
+        self.spills = 0
+        self.page_ins = 0
+        self._resident: "OrderedDict[int, Segment]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def track(self, segment: Segment):
+        """Start managing a newly added (resident) segment."""
+        segment._residency = self
+        with self._lock:
+            self._resident[segment.segment_id] = segment
+            self.resident_bytes += segment.nbytes
+            self._enforce_budget(keep=segment)
+
+    def forget(self, segment: Segment):
+        """Stop managing a segment removed from the store (old snapshots may still read it)."""
+        with self._lock:
+            segment._dropped = True
+            if self._resident.pop(segment.segment_id, None) is not None:
+                self.resident_bytes -= segment.nbytes
+
+    def touch(self, segment: Segment):
+        segment.last_access = time.time()
+        with self._lock:
+            if segment.segment_id in self._resident:
+                self._resident.move_to_end(segment.segment_id)
+
+    def page_in(self, segment: Segment) -> List[dict]:
+        segment.last_access = time.time()
+        # Decompress outside the lock so other segments stay readable meanwhile
+        with open(segment._spill_path, "rb") as f:
+            logs = pickle.loads(zlib.decompress(f.read()))
+        with self._lock:
+            if segment._logs is not None:
+                # Paged in by another reader in the meantime
+                return segment._logs
+            if segment._dropped:
+                return logs
+            segment._logs = logs
+            self._resident[segment.segment_id] = segment
+            self.resident_bytes += segment.nbytes
+            self.page_ins += 1
+            self._enforce_budget(keep=segment)
+        return logs
+
+    def _enforce_budget(self, keep: Segment):
+        """Spill least recently used segments until under budget (never the one being used)."""
+        while self.resident_bytes > self.budget_bytes and len(self._resident) > 1:
+            segment_id, segment = next(iter(self._resident.items()))
+            if segment is keep:
+                self._resident.move_to_end(segment_id)
+                continue
+            self._spill(segment)
+
+    def _spill(self, segment: Segment):
+        if segment._spill_path is None:
+            # Rows never change, so a segment is written at most once
+            if self.spill_dir is None:
+                os.makedirs(self.spill_root, exist_ok=True)
+                self.spill_dir = tempfile.mkdtemp(prefix="log_store_", dir=self.spill_root)
+                atexit.register(self.close)
+            path = os.path.join(self.spill_dir, f"segment-{segment.segment_id}.bin")
+            data = zlib.compress(pickle.dumps(segment._logs, protocol=pickle.HIGHEST_PROTOCOL), 3)
+            with open(path, "wb") as f:
+                f.write(data)
+            segment._spill_path = path
+            segment._spill_bytes = len(data)
+        del self._resident[segment.segment_id]
+        segment._logs = None
+        self.resident_bytes -= segment.nbytes
+        self.spills += 1
+
+    def close(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class StoreSnapshot:
+    """
+    Immutable view of the store at one generation.
+    Readers take a snapshot once per request and never see a half-published ingest
+    or a file disappearing mid-computation.
+    """
+
+    __slots__ = ("generation", "_segments", "_by_filename")
+
+    def __init__(self, generation: int, segments: Tuple[Segment, ...], by_filename: Dict[str, Tuple[Segment, ...]]):
+        self.generation = generation
+        self._segments = segments
+        self._by_filename = by_filename
+
+    def segments(self, filename: Optional[str] = None) -> Tuple[Segment, ...]:
+        if filename is not None:
+            return self._by_filename.get(filename, ())
+        return self._segments
+
+    def filenames(self) -> List[str]:
+        return list(self._by_filename)
+
+    def iter_logs(self, filename: Optional[str] = None) -> Iterator[dict]:
+        """Logs in ingest order (of one file if given); rows are counted as scanned per segment read."""
+        return itertools.chain.from_iterable(_scanned(segment) for segment in self.segments(filename))
+
+    def iter_logs_in_time(
+        self, time_from: Optional[int], time_to: Optional[int], filename: Optional[str] = None
+    ) -> Iterator[dict]:
+        """
+        Logs with time_from <= time_ms <= time_to in ingest order (of one file if given).
+        Each segment's time index gives the matching rows directly; segments with
+        none are skipped without reading (or paging in) their rows.
+        """
+        if time_from is None and time_to is None:
+            yield from self.iter_logs(filename)
+            return
+        for segment in self.segments(filename):
+            positions = segment.time_index.rows_between(time_from, time_to)
+            if not positions:
+                continue
+            add_rows_scanned(len(positions))
+            logs = segment.logs
+            for position in positions:
+                yield logs[position]
+
+    def logs(self, filename: Optional[str] = None) -> List[dict]:
+        """All logs (of one file if given) in ingest order (a new list; the rows themselves are shared)."""
+        return list(self.iter_logs(filename))
+
+    def slice_logs(self, start: int, end: int) -> List[dict]:
+        """Logs [start:end] in ingest order, skipping whole segments before start."""
+        result: List[dict] = []
+        offset = 0
+        for segment in self._segments:
+            size = len(segment)
+            if offset + size > start and offset < end:
+                result.extend(segment.logs[max(0, start - offset):end - offset])
+            offset += size
+            if offset >= end:
+                break
+        add_rows_scanned(len(result))
+        return result
+
+    def sessions(self) -> List[dict]:
+        sessions = list(itertools.chain.from_iterable(segment.sessions for segment in self._segments))
+        add_rows_scanned(len(sessions))
+        return sessions
+
+    def sessions_in_time(self, time_from: Optional[int], time_to: Optional[int]) -> List[dict]:
+        """Sessions whose [start_time_ms, end_time_ms] overlaps [time_from, time_to]."""
+        if time_from is None and time_to is None:
+            return self.sessions()
+        sessions = []
+        for segment in self._segments:
+            positions = segment.time_index.sessions_between(segment.sessions, time_from, time_to)
+            sessions.extend(segment.sessions[position] for position in positions)
+        add_rows_scanned(len(sessions))
+        return sessions
+
+    def log_count(self) -> int:
+        return sum(len(segment) for segment in self._segments)
+
+    def session_count(self) -> int:
+        return sum(len(segment.sessions) for segment in self._segments)
+
+    def get_log(self, log_id: int) -> Optional[dict]:
+        """Look up a log by id (ids are increasing within a segment)."""
+        for segment in self._segments:
+            if segment.first_log_id is None or not segment.first_log_id <= log_id <= segment.last_log_id:
+                continue
+            logs = segment.logs
+            index = bisect.bisect_left(_SegmentIds(logs), log_id)
+            add_rows_scanned(1)
+            if index < len(logs) and logs[index]["id"] == log_id:
+                return logs[index]
+        return None
+
+
+def _scanned(segment: Segment) -> List[dict]:
+    add_rows_scanned(len(segment))
+    return segment.logs
+
+
+class LogStore:
+    """
+    Segmented in-memory log store.
+
+    - One segment per ingested file, kept in ingest order
+    - Catalog from filename to its segments, so a file is dropped without scanning rows
+    - Persistent log id / session id counters, so starting an ingest costs nothing
+    - A generation number bumped on every change (used for ETags and caches)
+
+    Writes are copy-on-write: every change builds a new StoreSnapshot and swaps it in
+    with a single assignment, so readers holding an older snapshot are unaffected.
+    Writes are expected to come from the StoreWriter thread only.
+
+    With a memory budget, rows of cold segments are spilled to spill_dir
+    (see SegmentResidency); this is invisible to readers.
+    """
+
+    def __init__(self, memory_budget_bytes: int = 0, spill_dir: str = LOG_STORE_SPILL_DIR):
+        self._snapshot = StoreSnapshot(0, (), {})
+        self.residency = SegmentResidency(memory_budget_bytes, spill_dir) if memory_budget_bytes > 0 else None
+        self._next_segment_id = 1
+        self.next_log_id = 1
+        self.last_session_id = 0
+        self._listeners: List[Callable[[int], None]] = []
+        self._lock = threading.Lock()
+
+    # ---- change notification ----
+    def add_listener(self, callback: Callable[[int], None]):
+        """Register a callback invoked with the new generation after every change."""
+        self._listeners.append(callback)
+
+    def _publish(self, segments: Tuple[Segment, ...], by_filename: Dict[str, Tuple[Segment, ...]]):
+        self._snapshot = StoreSnapshot(self._snapshot.generation + 1, segments, by_filename)
+        for callback in self._listeners:
+            callback(self._snapshot.generation)
+
+    # ---- writes ----
+    def add_segment(self, filename: str, logs: List[dict], sessions: List[dict], last_session_id: int = 0) -> Segment:
+        """Publish the parsed rows of one file and advance the id counters past them."""
+        return self.add_segments([(filename, logs, sessions, last_session_id)])[0]
+
+    def add_segments(self, files: List[Tuple[str, List[dict], List[dict], int]], merge_rows: int = 0) -> List[Segment]:
+        """
+        Publish several files, given as (filename, logs, sessions, last_session_id),
+        as one change: readers see either none or all of them.
+
+        With merge_rows, rows of a file whose segment is the last one in the store
+        replace that segment by one holding both, as long as it stays within merge_rows
+        rows (followed files would otherwise add a small segment on every poll).
+        Only the last segment can grow, so segments stay in id order.
+        """
+        if not files:
+            return []
+        laps = StageLaps()
+        with self._lock:
+            current = self._snapshot
+            segments = list(current._segments)
+            by_filename = dict(current._by_filename)
+            added = []
+            merged = []
+            for filename, logs, sessions, last_session_id in files:
+                tail = segments[-1] if segments else None
+                nbytes = estimate_rows_size(logs)
+                if merge_rows and tail is not None and tail.filename == filename and tail.row_count + len(logs) <= merge_rows:
+                    segments.pop()
+                    by_filename[filename] = by_filename[filename][:-1]
+                    merged.append(tail)
+                    if tail in added:
+                        added.remove(tail)
+                    logs, sessions, nbytes = tail.logs + logs, tail.sessions + sessions, tail.nbytes + nbytes
+                segment = Segment(self._next_segment_id, filename, logs, sessions)
+                segment.nbytes = nbytes
+                self._next_segment_id += 1
+                segments.append(segment)
+                by_filename[filename] = by_filename.get(filename, ()) + (segment,)
+                if segment.last_log_id is not None:
+                    self.next_log_id = max(self.next_log_id, segment.last_log_id + 1)
+                self.last_session_id = max(self.last_session_id, last_session_id)
+                added.append(segment)
+            laps.lap("index")
+            self._publish(tuple(segments), by_filename)
+        if self.residency is not None:
+            for segment in merged:
+                self.residency.forget(segment)
+            for segment in added:
+                self.residency.track(segment)
+        laps.lap("publish")
+        return added
+
+    def remove_file(self, filename: str) -> List[str]:
+        """
+        Drop all segments of a file. Exact filename match first; otherwise every file
+        whose name ends with the given name (S3 files are stored with full paths while
+        the frontend may send the short name) or that is a member of the given archive
+        upload ("<archive>/<member>"). Returns the removed filenames.
+        """
+        with self._lock:
+            current = self._snapshot
+            if filename in current._by_filename:
+                removed = [filename]
+            else:
+                removed = [
+                    name for name in current._by_filename
+                    if name.endswith(filename) or name.startswith(f"{filename}/")
+                ]
+            if not removed:
+                return []
+            by_filename = dict(current._by_filename)
+            dropped = set()
+            for name in removed:
+                dropped.update(id(segment) for segment in by_filename.pop(name))
+            self._publish(tuple(s for s in current._segments if id(s) not in dropped), by_filename)
+        if self.residency is not None:
+            for segment in current._segments:
+                if id(segment) in dropped:
+                    self.residency.forget(segment)
+        return removed
+
+    def clear(self):
+        """Drop everything. Id numbering restarts from 1."""
+        with self._lock:
+            current = self._snapshot
+            self.next_log_id = 1
+            self.last_session_id = 0
+            self._publish((), {})
+        if self.residency is not None:
+            for segment in current._segments:
+                self.residency.forget(segment)
+
+    def replace_snapshot(self, snapshot: StoreSnapshot):
+        """Install a snapshot built elsewhere (worker processes mirroring the store process)."""
+        with self._lock:
+            self._snapshot = snapshot
+            for callback in self._listeners:
+                callback(snapshot.generation)
+
+    # ---- reads ----
+    def snapshot(self) -> StoreSnapshot:
+        return self._snapshot
+
+    @property
+    def generation(self) -> int:
+        return self._snapshot.generation
+
+    def log_count(self) -> int:
+        return self._snapshot.log_count()
+
+    def session_count(self) -> int:
+        return self._snapshot.session_count()
+
+    def residency_stats(self) -> Dict[str, Any]:
+        """Memory budget usage plus, per file, how many rows/bytes are in memory or spilled."""
+        residency = self.residency
+        files = {}
+        for segment in self._snapshot.segments():
+            entry = files.setdefault(segment.filename, {
+                "filename": segment.filename,
+                "segments": 0,
+                "rows": 0,
+                "resident_segments": 0,
+                "resident_bytes": 0,
+                "spilled_segments": 0,
+                "spilled_bytes_on_disk": 0,
+                "last_access": 0.0,
+            })
+            entry["segments"] += 1
+            entry["rows"] += len(segment)
+            if segment.resident:
+                entry["resident_segments"] += 1
+                entry["resident_bytes"] += segment.nbytes
+            else:
+                entry["spilled_segments"] += 1
+                entry["spilled_bytes_on_disk"] += segment._spill_bytes
+            entry["last_access"] = max(entry["last_access"], segment.last_access)
+        return {
+            "memory_budget_bytes": residency.budget_bytes if residency else None,
+            "resident_bytes": residency.resident_bytes if residency else sum(f["resident_bytes"] for f in files.values()),
+            "spills": residency.spills if residency else 0,
+            "page_ins": residency.page_ins if residency else 0,
+            "spill_dir": residency.spill_dir if residency else None,
+            "files": list(files.values()),
+        }
+
+
+class StoreWriter:
+    """
+    Single writer for the log store. Ingests and clears are queued and run one at a
+    time on a dedicated thread, so id allocation never races and each ingest
+    publishes its segments in one step when it completes.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-writer")
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        # Run in a copy of the caller's context (like run_in_threadpool), e.g. for its stage timer
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Queue fn on the writer thread and wait for its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+
+class _SegmentIds:
+    """Sequence view of the ids of a segment's logs, for bisect."""
+
+    def __init__(self, logs: List[dict]):
+        self.logs = logs
+
+    def __len__(self):
+        return len(self.logs)
+
+    def __getitem__(self, index: int) -> int:
+        return self.logs[index]["id"]
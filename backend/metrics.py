@@ -0,0 +1,365 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.routing import Match
+
+
+# Seconds between event loop lag probes
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# Histogram buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+INGEST_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total, count = child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process in the Prometheus text format.
+    Collectors are called on every scrape to refresh gauges whose values are
+    cheaper to read on demand (store size, cache stats) than to keep updated.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], None]):
+        self._collectors.append(collect)
+
+    def _register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time to handle a request, by route template", ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("http_requests_in_flight", "Requests currently being handled")
+
+INGESTS = registry.counter("ingests_total", "Finished ingests", ("kind", "status"))
+INGEST_DURATION = registry.histogram("ingest_duration_seconds", "Wall time of an ingest", ("kind",), INGEST_BUCKETS)
+INGEST_LINES = registry.counter("ingest_lines_total", "Lines read by ingests", ("kind",))
+INGEST_BYTES = registry.counter("ingest_bytes_total", "Bytes read by ingests", ("kind",))
+INGEST_DECRYPT_FAILURES = registry.counter("ingest_decrypt_failures_total", "Lines that failed to decrypt", ("kind",))
+INGEST_LINES_PER_SECOND = registry.gauge("ingest_last_lines_per_second", "Throughput of the most recent ingest", ("kind",))
+
+UPSTREAM_DURATION = registry.histogram(
+    "upstream_request_duration_seconds", "Latency of calls to the cloud API (GraphQL, auth, S3 downloads)", ("service",)
+)
+UPSTREAM_ERRORS = registry.counter(
+    "upstream_request_errors_total", "Upstream calls that raised or returned an error status", ("service",)
+)
+
+EVENT_LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds", "Delay of a timer on the event loop beyond its deadline",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_LAG_LAST = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag probe")
+
+STORE_ROWS = registry.gauge("log_store_rows", "Log rows in the store")
+STORE_SESSIONS = registry.gauge("log_store_sessions", "Session summaries in the store")
+STORE_FILES = registry.gauge("log_store_files", "Ingested files in the store")
+STORE_SEGMENTS = registry.gauge("log_store_segments", "Segments in the store")
+STORE_BYTES = registry.gauge("log_store_bytes", "Estimated row bytes (resident) or compressed bytes on disk (spilled)", ("state",))
+STORE_GENERATION = registry.gauge("log_store_generation", "Store generation (increases on every ingest or clear)")
+
+RESULT_CACHE_HITS = registry.counter("result_cache_hits_total", "Analytic result cache hits")
+RESULT_CACHE_MISSES = registry.counter("result_cache_misses_total", "Analytic result cache misses")
+RESULT_CACHE_HIT_RATIO = registry.gauge("result_cache_hit_ratio", "Hits / lookups of the analytic result cache")
+RESULT_CACHE_BYTES = registry.gauge("result_cache_bytes", "Estimated size of the cached results")
+
+
+def collect_store_metrics(log_store):
+    snapshot = log_store.snapshot()
+    resident_bytes = spilled_bytes = 0
+    segments = snapshot.segments()
+    for segment in segments:
+        if segment.resident:
+            resident_bytes += segment.nbytes
+        else:
+            spilled_bytes += segment._spill_bytes
+    STORE_ROWS.set(snapshot.log_count())
+    STORE_SESSIONS.set(snapshot.session_count())
+    STORE_FILES.set(len(snapshot.filenames()))
+    STORE_SEGMENTS.set(len(segments))
+    STORE_BYTES.labels("resident").set(resident_bytes)
+    STORE_BYTES.labels("spilled").set(spilled_bytes)
+    STORE_GENERATION.set(snapshot.generation)
+
+
+def collect_result_cache_metrics(result_cache):
+    stats = result_cache.stats()
+    RESULT_CACHE_HITS.labels().set(stats["hits"])
+    RESULT_CACHE_MISSES.labels().set(stats["misses"])
+    RESULT_CACHE_HIT_RATIO.set(stats["hit_ratio"])
+    RESULT_CACHE_BYTES.set(stats["bytes"])
+
+
+def record_ingest(progress):
+    """Add a finished (or failed) ingest's counters; called once per ingest."""
+    snapshot = progress.snapshot()
+    kind = snapshot["kind"] or "unknown"
+    INGESTS.labels(kind, snapshot["status"]).inc()
+    INGEST_DURATION.labels(kind).observe(snapshot["elapsed_seconds"])
+    INGEST_LINES.labels(kind).inc(snapshot["lines_read"])
+    INGEST_BYTES.labels(kind).inc(snapshot["bytes_read"])
+    INGEST_DECRYPT_FAILURES.labels(kind).inc(snapshot["decrypt_failures"])
+    INGEST_LINES_PER_SECOND.labels(kind).set(snapshot["lines_per_second"])
+
+
+class UpstreamCall:
+    """
+    Times one upstream call; use as a context manager around the request
+    (and the body download, for streamed responses):
+
+        with UpstreamCall("s3") as call:
+            resp = call.record(requests.get(url, stream=True))
+            data = resp.content
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self.status: Optional[int] = None
+
+    def record(self, response):
+        self.status = response.status_code
+        return response
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        UPSTREAM_DURATION.labels(self.service).observe(time.perf_counter() - self._started)
+        if exc_type is not None or (self.status is not None and self.status >= 400):
+            UPSTREAM_ERRORS.labels(self.service).inc()
+        return False
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    """Sleep `interval` in a loop; any extra delay is time the loop was busy with other work."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+def route_template(scope, router=None) -> Optional[str]:
+    """
+    Route template of a request (/logs/{log_id}, not /logs/37), or None if no route matches.
+    Before routing (or when a middleware answered, e.g. with a 304) the router is asked.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if router is not None:
+        for candidate in router.routes:
+            if candidate.matches(scope)[0] == Match.FULL:
+                return getattr(candidate, "path", None)
+    return None
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records request latency per route template
+    (/logs/{log_id}, not /logs/37) and starts the event loop lag probe.
+    Requests that match no route are grouped under "unmatched".
+    """
+
+    def __init__(self, app, router=None):
+        self.app = app
+        self.router = router
+        self._lag_task: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.get_running_loop().create_task(monitor_event_loop_lag())
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.labels().inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.labels().inc(-1)
+            HTTP_REQUEST_DURATION.labels(scope["method"], self._route_template(scope), status).observe(
+                time.perf_counter() - started
+            )
+
+    def _route_template(self, scope) -> str:
+        return route_template(scope, self.router) or "unmatched"
@@ -0,0 +1,298 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import route_template
+
+
+# Seconds between stack samples while a capture is running
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+# Finished captures kept for download
+PROFILE_MAX_CAPTURES = int(os.environ.get("PROFILE_MAX_CAPTURES", "20"))
+# Allocation sites listed in a tracemalloc diff
+PROFILE_TOP_ALLOCATIONS = 30
+
+# Innermost frames of threads that are waiting for work, not running it
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+# (function, file, first line) of one stack frame
+Frame = Tuple[str, str, int]
+
+
+class ProfileCapture:
+    """CPU samples (and optionally an allocation diff) of one profiled request."""
+
+    def __init__(self, capture_id: int, method: str, path: str, query: str, route: str, allocations: bool, interval: float):
+        self.capture_id = capture_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.route = route
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.samples: Counter = Counter()
+        # Milliseconds per stack: samples are weighted by the actual time since the previous one,
+        # which stretches beyond the interval while CPU-bound threads hold the GIL
+        self.weights: Counter = Counter()
+        self.allocations = allocations
+        self.allocation_diff: Optional[List[Dict[str, Any]]] = None
+        self.allocation_peak_bytes: Optional[int] = None
+        self._before: Optional[tracemalloc.Snapshot] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "capture_id": self.capture_id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": sum(self.samples.values()),
+            "interval_ms": self.interval * 1000,
+            "allocations": self.allocations,
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stacks: 'root;caller;callee count' per line (flamegraph.pl, speedscope)."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            lines.append(";".join(_frame_name(frame) for frame in stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Sampled profile in the speedscope file format (https://www.speedscope.app)."""
+        frame_index: Dict[Frame, int] = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, weight in self.weights.items():
+            indices = []
+            for frame in stack:
+                index = frame_index.get(frame)
+                if index is None:
+                    index = frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(index)
+            samples.append(indices)
+            weights.append(round(weight, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": f"{self.method} {self.path} ({self.capture_id})",
+            "exporter": "log-dashboard",
+        }
+
+
+def _frame_name(frame: Frame) -> str:
+    return f"{frame[0]} ({os.path.basename(frame[1])}:{frame[2]})"
+
+
+class RequestProfiler:
+    """
+    On-demand sampling profiler for live requests.
+
+    While at least one capture runs, a background thread samples the stacks of
+    all busy threads (the event loop, the store writer, threadpool workers) every
+    PROFILE_SAMPLE_INTERVAL seconds and adds them to every running capture, so
+    requests that overlap a profiled one show up in its profile too.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, max_captures: int = PROFILE_MAX_CAPTURES):
+        self.interval = interval
+        self.captures: "deque[ProfileCapture]" = deque(maxlen=max_captures)
+        self._running: List[ProfileCapture] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._tracemalloc_users = 0
+        # Whether tracemalloc was started here (tracing started elsewhere is left running)
+        self._started_tracemalloc = False
+        # Armed profiling of the next N requests (optionally only for one route)
+        self.armed_requests = 0
+        self.armed_route: Optional[str] = None
+        self.armed_allocations = False
+
+    # ---- arming ----
+    def arm(self, requests: int, route: Optional[str] = None, allocations: bool = False):
+        with self._lock:
+            self.armed_requests = requests
+            self.armed_route = route
+            self.armed_allocations = allocations
+
+    def disarm(self):
+        self.arm(0)
+
+    def arm_state(self) -> Dict[str, Any]:
+        return {"requests": self.armed_requests, "route": self.armed_route, "allocations": self.armed_allocations}
+
+    def take_armed(self, route: str, path: str) -> Optional[bool]:
+        """If armed for this request, use up one request and return whether to trace allocations."""
+        if self.armed_requests <= 0:
+            return None
+        with self._lock:
+            if self.armed_requests <= 0 or (self.armed_route and self.armed_route not in (route, path)):
+                return None
+            self.armed_requests -= 1
+            return self.armed_allocations
+
+    # ---- captures ----
+    def start(self, method: str, path: str, query: str, route: str, allocations: bool = False) -> ProfileCapture:
+        capture = ProfileCapture(next(self._ids), method, path, query, route, allocations, self.interval)
+        if allocations:
+            with self._lock:
+                if self._tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracemalloc = True
+                self._tracemalloc_users += 1
+            tracemalloc.reset_peak()
+            capture._before = tracemalloc.take_snapshot()
+        with self._lock:
+            self._running.append(capture)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return capture
+
+    def stop(self, capture: ProfileCapture, status: Optional[int]):
+        capture.duration_ms = round((time.time() - capture.started_at) * 1000, 3)
+        capture.status = status
+        with self._lock:
+            self._running.remove(capture)
+        if capture.allocations:
+            after = tracemalloc.take_snapshot()
+            capture.allocation_peak_bytes = tracemalloc.get_traced_memory()[1]
+            stats = after.compare_to(capture._before, "lineno")[:PROFILE_TOP_ALLOCATIONS]
+            capture.allocation_diff = [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                }
+                for stat in stats
+            ]
+            capture._before = None
+            with self._lock:
+                self._tracemalloc_users -= 1
+                if self._tracemalloc_users == 0 and self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+        self.captures.append(capture)
+
+    def get(self, capture_id: int) -> Optional[ProfileCapture]:
+        for capture in self.captures:
+            if capture.capture_id == capture_id:
+                return capture
+        return None
+
+    # ---- sampling ----
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                running = list(self._running)
+                if not running:
+                    self._sampler = None
+                    return
+            now = time.perf_counter()
+            weight = (now - last) * 1000
+            last = now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append((f"thread:{names.get(thread_id, thread_id)}", "", 0))
+                stack = tuple(reversed(stack))
+                for capture in running:
+                    capture.samples[stack] += 1
+                    capture.weights[stack] += weight
+            time.sleep(self.interval)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests armed on the RequestProfiler, or any
+    request sent with "X-Profile: cpu" (or "alloc" for an allocation diff as well)
+    plus a valid X-Admin-Token. Profiled responses carry X-Profile-Id.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler, admin_token: str = "", router=None):
+        self.app = app
+        self.profiler = profiler
+        self.admin_token = admin_token
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        allocations = None
+        if self.admin_token:
+            headers = dict(scope.get("headers", []))
+            mode = headers.get(b"x-profile", b"").strip().lower()
+            token = headers.get(b"x-admin-token", b"")
+            if mode in (b"cpu", b"alloc") and hmac.compare_digest(token, self.admin_token.encode()):
+                allocations = mode == b"alloc"
+        route = None
+        if allocations is None and self.profiler.armed_requests > 0:
+            route = self._route_template(scope)
+            allocations = self.profiler.take_armed(route, scope["path"])
+        if allocations is None:
+            await self.app(scope, receive, send)
+            return
+
+        capture = self.profiler.start(
+            scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+            route or self._route_template(scope), allocations,
+        )
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", str(capture.capture_id).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.stop(capture, status)
+
+    def _route_template(self, scope) -> str:
+        return route_template(scope, self.router) or scope["path"]
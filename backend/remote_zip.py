@@ -0,0 +1,367 @@
+import bz2
+import io
+import os
+import re
+import struct
+import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import UpstreamCall
+
+
+# Bytes read from the end of the archive first. Holds the end of central directory
+# record and, for archives of a few dozen device logs, the whole central directory.
+REMOTE_ZIP_TAIL_BYTES = int(os.environ.get("REMOTE_ZIP_TAIL_BYTES", str(16 * 1024)))
+# Selected members downloaded at the same time (one pooled connection each)
+REMOTE_ZIP_FETCH_WORKERS = int(os.environ.get("REMOTE_ZIP_FETCH_WORKERS", "4"))
+# Compressed bytes inflated per read of a member
+REMOTE_ZIP_INFLATE_CHUNK = 64 * 1024
+# Room requested for a member's local extra field, which may differ from the central one
+_LOCAL_EXTRA_SLACK = 1024
+
+# Record layouts (see APPNOTE.TXT and CPython's zipfile)
+_EOCD = struct.Struct("<4s4H2LH")
+_EOCD_SIGNATURE = b"PK\x05\x06"
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+_ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
+_CENTRAL_DIR = struct.Struct("<4s4B4HL2L5H2L")
+_CENTRAL_DIR_SIGNATURE = b"PK\x01\x02"
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+# Largest EOCD search window: the record plus the longest possible archive comment
+_MAX_EOCD_SEARCH = _EOCD.size + 0xFFFF
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class RemoteZipError(Exception):
+    """The archive could not be fetched (status_code is the upstream HTTP status)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RemoteZipMember:
+    """One central directory entry: where a member lives in the archive and how big it is."""
+
+    __slots__ = ("name", "compress_type", "compress_size", "file_size", "header_offset", "crc", "flag_bits", "date_time")
+
+    def __init__(self, name: str, compress_type: int, compress_size: int, file_size: int,
+                 header_offset: int, crc: int, flag_bits: int, date_time: Tuple[int, ...]):
+        self.name = name
+        self.compress_type = compress_type
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.header_offset = header_offset
+        self.crc = crc
+        self.flag_bits = flag_bits
+        self.date_time = date_time
+
+    @classmethod
+    def from_zipinfo(cls, info: zipfile.ZipInfo) -> "RemoteZipMember":
+        return cls(info.filename, info.compress_type, info.compress_size, info.file_size,
+                   info.header_offset, info.CRC, info.flag_bits, info.date_time)
+
+    def is_dir(self) -> bool:
+        return self.name.endswith("/")
+
+    def modified(self) -> Optional[str]:
+        try:
+            return datetime(*self.date_time).isoformat()
+        except ValueError:
+            return None  # DOS timestamp 0 (no date recorded)
+
+    def as_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "size": self.file_size,
+            "compressed_size": self.compress_size,
+            "modified": self.modified(),
+        }
+
+
+class RemoteZip:
+    """
+    Reads a ZIP archive over HTTP with range requests.
+
+    members() fetches only the tail of the archive (end of central directory,
+    ZIP64 records and the central directory itself), usually a single request of
+    a few KB. fetch_members() then downloads just the compressed data of the
+    chosen members, several at a time. Servers that ignore Range get a full
+    download instead, kept in memory for later reads of the same archive.
+    """
+
+    def __init__(self, url: str, session: Optional[requests.Session] = None, service: str = "s3"):
+        self.url = url
+        if session is None:
+            # Keep a connection per download worker alive between range requests
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(REMOTE_ZIP_FETCH_WORKERS, 1))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.service = service
+        self.size: Optional[int] = None
+        self.bytes_fetched = 0
+        # Whole archive, when the server did not honour a range request
+        self.archive: Optional[bytes] = None
+        self._members: Optional[List[RemoteZipMember]] = None
+
+    @property
+    def ranges_supported(self) -> bool:
+        return self.archive is None
+
+    # ---- HTTP ----
+    def _get(self, range_header: str) -> Tuple[bytes, Optional[int], Optional[int]]:
+        """GET a byte range: (data, absolute start, archive size); start is None for a full 200 response."""
+        with UpstreamCall(self.service) as call:
+            resp = call.record(self.session.get(self.url, headers={"Range": range_header}, allow_redirects=True))
+            if resp.status_code == 416:
+                # Empty or tiny archive: fall back to a plain download
+                resp = call.record(self.session.get(self.url, allow_redirects=True))
+            if resp.status_code not in (200, 206):
+                raise RemoteZipError(resp.status_code, f"Failed to fetch zip: {resp.text[:300]}")
+            data = resp.content
+        self.bytes_fetched += len(data)
+        if resp.status_code == 200:
+            self.archive = data
+            self.size = len(data)
+            return data, None, self.size
+        match = _CONTENT_RANGE.match(resp.headers.get("Content-Range", ""))
+        if not match:
+            raise RemoteZipError(502, "Range response without a usable Content-Range header")
+        total = None if match.group(3) == "*" else int(match.group(3))
+        if total is not None:
+            self.size = total
+        return data, int(match.group(1)), total
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Bytes [start, end) of the archive."""
+        if self.archive is not None:
+            return self.archive[start:end]
+        data, offset, _ = self._get(f"bytes={start}-{end - 1}")
+        if offset is None:  # server stopped honouring ranges
+            return data[start:end]
+        return data
+
+    def _read_tail(self, length: int) -> Tuple[bytes, int]:
+        """The last `length` bytes of the archive and their absolute offset."""
+        if self.archive is not None:
+            start = max(0, len(self.archive) - length)
+            return self.archive[start:], start
+        data, offset, total = self._get(f"bytes=-{length}")
+        if offset is None:
+            start = max(0, len(data) - length)
+            return data[start:], start
+        if total is None:
+            raise RemoteZipError(502, "Range response without the archive size")
+        return data, offset
+
+    # ---- central directory ----
+    def members(self) -> List[RemoteZipMember]:
+        if self._members is None:
+            self._members = self._read_members()
+        return self._members
+
+    def _read_members(self) -> List[RemoteZipMember]:
+        tail, tail_start = self._read_tail(REMOTE_ZIP_TAIL_BYTES)
+        if self.archive is not None:
+            return _members_from_archive(self.archive)
+
+        eocd_index = tail.rfind(_EOCD_SIGNATURE)
+        if eocd_index < 0 and tail_start > 0:
+            # A long archive comment pushed the record out of the first window
+            tail, tail_start = self._read_tail(_MAX_EOCD_SEARCH + _ZIP64_LOCATOR.size)
+            eocd_index = tail.rfind(_EOCD_SIGNATURE)
+        if eocd_index < 0 or len(tail) - eocd_index < _EOCD.size:
+            raise zipfile.BadZipFile("End of central directory record not found")
+        eocd_offset = tail_start + eocd_index
+        (_, _, _, _, entries, cd_size, cd_offset, _) = _EOCD.unpack_from(tail, eocd_index)
+
+        # A ZIP64 locator right before the record means the real values are in the ZIP64 record
+        # (writers may emit one even when the classic fields are not saturated)
+        directory_end = eocd_offset
+        locator = b""
+        if eocd_index >= _ZIP64_LOCATOR.size:
+            locator = tail[eocd_index - _ZIP64_LOCATOR.size:eocd_index]
+        elif eocd_offset >= _ZIP64_LOCATOR.size:
+            locator = self.read_range(eocd_offset - _ZIP64_LOCATOR.size, eocd_offset)
+        if locator[:4] == _ZIP64_LOCATOR_SIGNATURE:
+            # The record sits right before the locator (its recorded offset ignores prepended data)
+            directory_end = eocd_offset - _ZIP64_LOCATOR.size - _ZIP64_EOCD.size
+            fields = _ZIP64_EOCD.unpack(self._slice(tail, tail_start, directory_end, directory_end + _ZIP64_EOCD.size))
+            if fields[0] != _ZIP64_EOCD_SIGNATURE:
+                raise zipfile.BadZipFile("ZIP64 end of central directory record not found")
+            entries, cd_size, cd_offset = fields[7], fields[8], fields[9]
+
+        # Data prepended to the archive (e.g. a self-extractor stub) shifts every offset
+        concat = directory_end - cd_size - cd_offset
+        if concat < 0:
+            raise zipfile.BadZipFile("Central directory offset is out of range")
+        directory = self._slice(tail, tail_start, cd_offset + concat, cd_offset + concat + cd_size)
+        return _parse_central_directory(directory, entries, concat)
+
+    def _slice(self, tail: bytes, tail_start: int, start: int, end: int) -> bytes:
+        """Bytes [start, end) from the tail already read, or from a new range request."""
+        if start >= tail_start:
+            return tail[start - tail_start:end - tail_start]
+        return self.read_range(start, end)
+
+    # ---- members ----
+    def read_member_data(self, member: RemoteZipMember) -> bytes:
+        """Compressed data of one member; its local header and data come in one range request."""
+        start = member.header_offset
+        end = start + _LOCAL_HEADER.size + len(member.name.encode("utf-8")) + _LOCAL_EXTRA_SLACK + member.compress_size
+        if self.size is not None:
+            end = min(end, self.size)
+        data = self.read_range(start, end)
+        if len(data) < _LOCAL_HEADER.size or data[:4] != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for {member.name}")
+        header = _LOCAL_HEADER.unpack_from(data)
+        data_start = _LOCAL_HEADER.size + header[10] + header[11]
+        data_end = data_start + member.compress_size
+        if data_end > len(data):
+            # Local extra field longer than the slack
+            data += self.read_range(start + len(data), start + data_end)
+        return data[data_start:data_end]
+
+    def fetch_members(self, members: List[RemoteZipMember], workers: int = REMOTE_ZIP_FETCH_WORKERS) -> List["Future[bytes]"]:
+        """
+        Start downloading the compressed data of `members`, `workers` at a time.
+        Returns one future per member, in order, so the caller can parse the
+        first member while the others are still downloading.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="remote-zip")
+        futures = [executor.submit(self.read_member_data, member) for member in members]
+        executor.shutdown(wait=False)
+        return futures
+
+
+class MemberReader(io.RawIOBase):
+    """
+    Binary file object over a member's compressed data. Inflates
+    REMOTE_ZIP_INFLATE_CHUNK bytes at a time as it is read and checks the CRC at the end.
+    Stored, deflated, bzip2 and LZMA members are supported, like zipfile.
+    """
+
+    def __init__(self, member: RemoteZipMember, compressed: bytes):
+        super().__init__()
+        if member.flag_bits & 0x1:
+            raise zipfile.BadZipFile(f"{member.name} is encrypted")
+        if member.compress_type == zipfile.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-15)
+        elif member.compress_type == zipfile.ZIP_BZIP2:
+            self._decompressor = bz2.BZ2Decompressor()
+        elif member.compress_type == zipfile.ZIP_LZMA:
+            # Reads the LZMA properties header zipfile writes before the stream
+            self._decompressor = zipfile.LZMADecompressor()
+        elif member.compress_type == zipfile.ZIP_STORED:
+            self._decompressor = None
+        else:
+            raise zipfile.BadZipFile(f"Compression method {member.compress_type} of {member.name} is not supported")
+        self.member = member
+        self._compressed = memoryview(compressed)
+        self._position = 0
+        self._buffer = b""
+        self._crc = 0
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(REMOTE_ZIP_INFLATE_CHUNK)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        while not self._buffer and not self._eof:
+            self._inflate_next()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _inflate_next(self):
+        chunk = self._compressed[self._position:self._position + REMOTE_ZIP_INFLATE_CHUNK]
+        self._position += len(chunk)
+        if self._decompressor is None:
+            data = bytes(chunk)
+        elif chunk:
+            data = self._decompressor.decompress(chunk)
+        else:
+            # Only zlib keeps output back until the end; bz2 and LZMA have no flush
+            flush = getattr(self._decompressor, "flush", None)
+            data = flush() if flush is not None else b""
+        if not chunk:
+            self._eof = True
+        self._crc = zlib.crc32(data, self._crc)
+        self._buffer = data
+        if self._eof and self._crc != self.member.crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {self.member.name!r}")
+
+
+def _parse_central_directory(directory: bytes, entries: int, concat: int) -> List[RemoteZipMember]:
+    members = []
+    position = 0
+    while position + _CENTRAL_DIR.size <= len(directory):
+        fields = _CENTRAL_DIR.unpack_from(directory, position)
+        if fields[0] != _CENTRAL_DIR_SIGNATURE:
+            raise zipfile.BadZipFile("Bad central directory entry")
+        flag_bits, compress_type, dos_time, dos_date, crc = fields[5], fields[6], fields[7], fields[8], fields[9]
+        compress_size, file_size = fields[10], fields[11]
+        name_length, extra_length, comment_length = fields[12], fields[13], fields[14]
+        header_offset = fields[18]
+        position += _CENTRAL_DIR.size
+        raw_name = directory[position:position + name_length]
+        extra = directory[position + name_length:position + name_length + extra_length]
+        position += name_length + extra_length + comment_length
+
+        name = raw_name.decode("utf-8" if flag_bits & 0x800 else "cp437")
+        file_size, compress_size, header_offset = _apply_zip64_extra(extra, file_size, compress_size, header_offset)
+        date_time = ((dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                     dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2)
+        members.append(RemoteZipMember(name, compress_type, compress_size, file_size,
+                                       header_offset + concat, crc, flag_bits, date_time))
+    if len(members) != entries:
+        raise zipfile.BadZipFile(f"Central directory has {len(members)} entries, expected {entries}")
+    return members
+
+
+def _apply_zip64_extra(extra: bytes, file_size: int, compress_size: int, header_offset: int) -> Tuple[int, int, int]:
+    """Replace 0xFFFFFFFF sizes/offset with their values from the ZIP64 extra field."""
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = struct.unpack_from("<2H", extra, position)
+        position += 4
+        if tag == 0x0001:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, position))
+            if file_size == 0xFFFFFFFF:
+                file_size = next(values)
+            if compress_size == 0xFFFFFFFF:
+                compress_size = next(values)
+            if header_offset == 0xFFFFFFFF:
+                header_offset = next(values)
+            break
+        position += length
+    return file_size, compress_size, header_offset
+
+
+def _members_from_archive(archive: bytes) -> List[RemoteZipMember]:
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        return [RemoteZipMember.from_zipinfo(info) for info in zf.infolist()]
@@ -0,0 +1,185 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from starlette.concurrency import run_in_threadpool
+
+from metrics import route_template
+
+logger = logging.getLogger("request_stats")
+
+# Requests slower than this are recorded (0 records every request)
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+# Slow requests kept in memory for /admin/slow-requests
+SLOW_REQUEST_LOG_SIZE = int(os.environ.get("SLOW_REQUEST_LOG_SIZE", "200"))
+# Optional JSONL file every slow request is appended to
+SLOW_REQUEST_LOG_FILE = os.environ.get("SLOW_REQUEST_LOG_FILE", "")
+# JSON request bodies up to this size are kept with the record (e.g. /test-results filters)
+SLOW_REQUEST_MAX_BODY = 4096
+
+
+class RequestStats:
+    """Work done for one request, filled in by the store and the endpoints while it runs."""
+
+    __slots__ = ("rows_scanned", "rows_returned", "timings")
+
+    def __init__(self):
+        self.rows_scanned = 0
+        self.rows_returned: Optional[int] = None
+        self.timings: Optional[Dict[str, Any]] = None
+
+
+_current_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_stats.get()
+
+
+def add_rows_scanned(count: int):
+    """Count rows read from the store for the current request (no-op outside a request)."""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.rows_scanned += count
+
+
+def set_rows_returned(count: int):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.rows_returned = count
+
+
+def set_request_timings(timings: Dict[str, Any]):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.timings = timings
+
+
+class SlowRequestLog:
+    """Bounded ring of slow requests, optionally mirrored to a JSONL file."""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS, size: int = SLOW_REQUEST_LOG_SIZE, path: str = SLOW_REQUEST_LOG_FILE):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self.recorded = 0
+        self._entries: "deque[Dict[str, Any]]" = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def append_to_file(self, entry: Dict[str, Any]):
+        """Append entry to the JSONL file, if one is configured. Blocks, so keep it off the event loop."""
+        if not self.path:
+            return
+        line = json.dumps(entry) + "\n"
+        with self._file_lock:
+            try:
+                with open(self.path, "a") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("Could not append to slow request log %s: %s", self.path, e)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SlowRequestMiddleware:
+    """
+    ASGI middleware that gives every request a RequestStats and records requests
+    slower than the log's threshold with their route, parameters, rows scanned
+    and returned, store generation/size and stage timings.
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog, store_info: Callable[[], Dict[str, Any]], router=None):
+        self.app = app
+        self.slow_log = slow_log
+        self.store_info = store_info
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        store_before = self.store_info()
+        status = None
+        body = bytearray()
+        capture_body = scope["method"] in ("POST", "PUT") and _is_json(scope.get("headers", []))
+
+        async def receive_with_body():
+            message = await receive()
+            if capture_body and message["type"] == "http.request" and len(body) <= SLOW_REQUEST_MAX_BODY:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_with_body if capture_body else receive, send_with_status)
+        finally:
+            _current_stats.reset(token)
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms >= self.slow_log.threshold_ms:
+                entry = self._entry(scope, status, duration_ms, stats, store_before, bytes(body))
+                self.slow_log.record(entry)
+                if self.slow_log.path:
+                    await run_in_threadpool(self.slow_log.append_to_file, entry)
+
+    def _entry(self, scope, status, duration_ms, stats: RequestStats, store_before, body: bytes) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        for key, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True):
+            if key not in params:
+                params[key] = value
+            elif isinstance(params[key], list):
+                params[key].append(value)
+            else:
+                params[key] = [params[key], value]
+        entry = {
+            "time": time.time(),
+            "method": scope["method"],
+            "route": route_template(scope, self.router) or "unmatched",
+            "path": scope["path"],
+            "params": params,
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "rows_scanned": stats.rows_scanned,
+            "rows_returned": stats.rows_returned,
+            "store": store_before,
+            "timings": stats.timings,
+        }
+        if body and len(body) <= SLOW_REQUEST_MAX_BODY:
+            try:
+                entry["body"] = json.loads(body)
+            except ValueError:
+                pass
+        return entry
+
+
+def _is_json(headers) -> bool:
+    """Whether the content-type is application/json, in any case and with any parameters (e.g. charset)."""
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            return value.split(b";", 1)[0].strip().lower() == b"application/json"
+    return False
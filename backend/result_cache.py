@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "64"))
+
+
+def estimate_size(obj: Any, _seen: set = None) -> int:
+    """
+    Rough recursive estimate of the memory held by a JSON-like result
+    (dicts, lists, tuples, sets, strings and numbers).
+    """
+    if _seen is None:
+        _seen = set()
+    obj_id = id(obj)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    return size
+
+
+def normalize_args(args: Dict[str, Any]) -> Tuple:
+    """Turn keyword arguments into a hashable, order-independent key."""
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        return value
+    return tuple(sorted((k, freeze(v)) for k, v in args.items() if v is not None))
+
+
+class ResultCache:
+    """
+    Memory-bounded LRU cache for results of pure analytic functions.
+    Keys are (endpoint, normalized args, store generation), so an entry
+    can never be served for data it was not computed from.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        # Newest store generation seen by invalidate(); older results are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, endpoint: str, args: Dict[str, Any], generation: int, compute: Callable[[], Any]) -> Any:
+        key = (endpoint, normalize_args(args), generation)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        result = compute()
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            # Too large to cache - just return it
+            return result
+
+        with self._lock:
+            # Computed from a snapshot that has since been replaced: its key can never be hit
+            if generation < self.generation:
+                return result
+            if key not in self._entries:
+                self._entries[key] = (result, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes and self._entries:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted_size
+                    self.evictions += 1
+        return result
+
+    def invalidate(self, generation: Optional[int] = None):
+        """Drop all entries (called with the new generation when the stored logs change)."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            if generation is not None:
+                self.generation = max(self.generation, generation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
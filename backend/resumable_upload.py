@@ -0,0 +1,215 @@
+import codecs
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from log_parser import LogFileParser, ParsedFile
+
+
+# Largest chunk accepted by one PUT
+UPLOAD_MAX_CHUNK_MB = float(os.environ.get("UPLOAD_MAX_CHUNK_MB", "64"))
+# Unfinished uploads idle for longer than this are dropped
+UPLOAD_TTL_SECONDS = float(os.environ.get("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+# Directory for chunks that arrive ahead of the parse position (a private subdirectory is created per upload)
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", "") or tempfile.gettempdir()
+# Bytes read back from the spool file per parse step
+_SPOOL_READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that does not fit the upload (status_code is the HTTP status)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Add [start, end) to sorted, non-overlapping ranges."""
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start or range_start > end:
+            merged.append([range_start, range_end])
+        else:
+            start, end = min(start, range_start), max(end, range_end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+class ResumableUpload:
+    """
+    One file uploaded in chunks at byte offsets, parsed as it arrives.
+
+    Bytes that continue the parsed prefix go straight into the parser; chunks
+    that arrive early are written to a spool file at their offset and parsed
+    once the gap before them is filled. The parser state, the incremental
+    UTF-8 decoder and the trailing partial line are the checkpoint, so a
+    dropped connection only loses the chunk in flight and finalizing only has
+    to close the last session.
+
+    Rows get provisional ids; they are renumbered when the file is published.
+    """
+
+    def __init__(self, upload_id: str, filename: str, size: Optional[int], progress=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.progress = progress
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.received: List[List[int]] = []
+        self.parsed_offset = 0
+        self.finalized = False
+        self.lock = threading.Lock()
+        self._parser = LogFileParser(filename, decrypt=True, progress=progress)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._pending = ""
+        self._spool_dir: Optional[str] = None
+        self._spool = None
+
+    def write(self, offset: int, data: bytes):
+        """Store the chunk at offset and parse whatever is now contiguous. Chunks may be resent."""
+        with self.lock:
+            if self.finalized:
+                raise UploadError(409, "Upload is already finalized")
+            end = offset + len(data)
+            if offset < 0 or (self.size is not None and end > self.size):
+                raise UploadError(416, f"Chunk {offset}-{end} is outside the upload size {self.size}")
+            self.updated_at = time.time()
+            if not data:
+                return
+            self.received = _merge_range(self.received, offset, end)
+            if offset <= self.parsed_offset < end:
+                # Continues the parsed prefix: no need to keep the bytes
+                self._parse(data[self.parsed_offset - offset:])
+            elif offset > self.parsed_offset:
+                self._spool_write(offset, data)
+            self._parse_spooled()
+
+    def missing_ranges(self) -> List[List[int]]:
+        gaps = []
+        position = 0
+        for start, end in self.received:
+            if start > position:
+                gaps.append([position, start])
+            position = max(position, end)
+        if self.size is not None and position < self.size:
+            gaps.append([position, self.size])
+        return gaps
+
+    def complete(self) -> bool:
+        if self.size is None:
+            return len(self.received) == 1 and self.received[0][0] == 0
+        return self.received == [[0, self.size]] or self.size == 0
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Consistent view of the upload, taken under the lock. Waits for a chunk being
+        parsed, so call it off the event loop.
+        """
+        with self.lock:
+            return {
+                "upload_id": self.upload_id,
+                "filename": self.filename,
+                "size": self.size,
+                "received": [list(received) for received in self.received],
+                "missing": self.missing_ranges(),
+                "parsed_offset": self.parsed_offset,
+                "logs_parsed": len(self._parser.logs),
+                "complete": self.complete(),
+                "finalized": self.finalized,
+            }
+
+    def finalize(self) -> ParsedFile:
+        """Parse the trailing partial line and close the last session (ids still provisional)."""
+        with self.lock:
+            if self.finalized:
+                raise UploadError(409, "Upload is already finalized")
+            if not self.complete():
+                raise UploadError(409, f"Upload is incomplete, missing {self.missing_ranges()}")
+            self._pending += self._decoder.decode(b"", final=True)
+            if self._pending:
+                self._parser.feed_lines([self._pending])
+                self._pending = ""
+            self.finalized = True
+            self.close()
+            return self._parser.finish()
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self._spool_dir is not None:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+            self._spool_dir = None
+
+    # ---- parsing ----
+    def _parse(self, data: bytes):
+        if self.progress is not None:
+            self.progress.add(bytes_read=len(data))
+        text = self._pending + self._decoder.decode(data)
+        lines = text.split("\n")
+        self._pending = lines.pop()
+        self._parser.feed_lines(lines)
+        self.parsed_offset += len(data)
+
+    def _parse_spooled(self):
+        """Parse spooled bytes that now follow the parsed prefix."""
+        if self._spool is None:
+            return
+        contiguous_end = self.received[0][1] if self.received and self.received[0][0] == 0 else 0
+        while self.parsed_offset < contiguous_end:
+            self._spool.seek(self.parsed_offset)
+            self._parse(self._spool.read(min(_SPOOL_READ_SIZE, contiguous_end - self.parsed_offset)))
+
+    def _spool_write(self, offset: int, data: bytes):
+        if self._spool is None:
+            os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+            self._spool_dir = tempfile.mkdtemp(prefix="upload_", dir=UPLOAD_SPOOL_DIR)
+            self._spool = open(os.path.join(self._spool_dir, "chunks.bin"), "w+b")
+        self._spool.seek(offset)
+        self._spool.write(data)
+
+
+class UploadRegistry:
+    """Resumable uploads by id; idle unfinished uploads expire after UPLOAD_TTL_SECONDS."""
+
+    def __init__(self, ttl: float = UPLOAD_TTL_SECONDS, on_expire: Optional[Callable[[ResumableUpload], None]] = None):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._uploads: "OrderedDict[str, ResumableUpload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, filename: str, size: Optional[int], progress=None) -> ResumableUpload:
+        self.expire()
+        upload = ResumableUpload(uuid.uuid4().hex, filename, size, progress)
+        with self._lock:
+            self._uploads[upload.upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[ResumableUpload]:
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def remove(self, upload_id: str) -> Optional[ResumableUpload]:
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is not None:
+            upload.close()
+        return upload
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [upload for upload in self._uploads.values() if now - upload.updated_at > self.ttl]
+        for upload in expired:
+            self.remove(upload.upload_id)
+            if self.on_expire is not None:
+                self.on_expire(upload)
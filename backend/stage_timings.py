@@ -0,0 +1,131 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+# The stage breakdown of every ingest / analytic computation is logged as one JSON
+# message at INFO on the "stage_timings" logger (off unless logging enables it).
+# STAGE_TIMINGS_LOG=1 enables it and writes the lines to stdout.
+STAGE_TIMINGS_LOG = os.environ.get("STAGE_TIMINGS_LOG", "0").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("stage_timings")
+if STAGE_TIMINGS_LOG:
+    logger.setLevel(logging.INFO)
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+
+_active_timer: contextvars.ContextVar[Optional["StageTimer"]] = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Wall and CPU time per named stage of one operation (an ingest, a flowchart...).
+
+    Stages may nest; a parent stage is charged only for the time not spent in
+    its children, so the stage times add up. CPU time is the time of the thread
+    that ran the stage (time.thread_time), so concurrent requests do not skew it.
+    """
+
+    def __init__(self, operation: str, **context: Any):
+        self.operation = operation
+        self.context = context
+        # stage -> [wall seconds, cpu seconds, calls]
+        self.stages: Dict[str, List[float]] = {}
+        self._stack: List[List[float]] = []
+        self._started = time.perf_counter()
+        self._finished: Optional[float] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        frame = [time.perf_counter(), time.thread_time(), 0.0, 0.0]  # start wall/cpu, time in child stages
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.add(name, time.perf_counter() - frame[0] - frame[2], time.thread_time() - frame[1] - frame[3])
+            if self._stack:
+                self._stack[-1][2] += time.perf_counter() - frame[0]
+                self._stack[-1][3] += time.thread_time() - frame[1]
+
+    def add(self, name: str, wall: float, cpu: float):
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = [0.0, 0.0, 0]
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += 1
+
+    @contextmanager
+    def activate(self):
+        """Make this the timer that timed_stage() records into (in the current thread/task)."""
+        token = _active_timer.set(self)
+        try:
+            yield self
+        finally:
+            _active_timer.reset(token)
+
+    def finish(self) -> "StageTimer":
+        if self._finished is None:
+            self._finished = time.perf_counter()
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return {
+            # Includes time between stages (e.g. waiting for the store writer)
+            "total_wall_ms": round((end - self._started) * 1000, 3),
+            "total_cpu_ms": round(sum(totals[1] for totals in self.stages.values()) * 1000, 3),
+            "stages": {
+                name: {"wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3), "calls": int(calls)}
+                for name, (wall, cpu, calls) in self.stages.items()
+            },
+        }
+
+    def log(self):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": "stage_timings", "operation": self.operation, **self.context, **self.as_dict()}))
+
+
+def active_timer() -> Optional[StageTimer]:
+    return _active_timer.get()
+
+
+@contextmanager
+def timed_stage(name: str):
+    """Time a block as `name` on the active timer; does nothing when no timer is active."""
+    timer = _active_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+class StageLaps:
+    """
+    Splits a long function into stages without re-indenting it:
+    each lap(name) charges the time since the previous lap to `name`.
+    Does nothing when no timer is active.
+    """
+
+    def __init__(self):
+        self.timer = _active_timer.get()
+        self._last = (time.perf_counter(), time.thread_time())
+
+    def lap(self, name: str):
+        if self.timer is None:
+            return
+        now = (time.perf_counter(), time.thread_time())
+        self.timer.add(name, now[0] - self._last[0], now[1] - self._last[1])
+        if self.timer._stack:
+            parent = self.timer._stack[-1]
+            parent[2] += now[0] - self._last[0]
+            parent[3] += now[1] - self._last[1]
+        self._last = now
@@ -0,0 +1,149 @@
+import json
+import os
+import pickle
+import tempfile
+import threading
+import zlib
+from typing import Dict, Optional
+
+from log_store import Segment, SegmentResidency, StoreSnapshot, estimate_rows_size
+
+
+# Directory shared by the store process (writer) and the HTTP workers (readers)
+STORE_CATALOG_DIR = os.environ.get("STORE_CATALOG_DIR", "") or os.path.join(tempfile.gettempdir(), "log_dashboard_catalog")
+
+CATALOG_FILE = "catalog.json"
+
+
+def _segment_file(segment_id: int) -> str:
+    return f"segment-{segment_id}.bin"
+
+
+class CatalogWriter:
+    """
+    Publishes store snapshots to a directory for worker processes.
+
+    Every segment is written once (segments never change) as a compressed pickle;
+    catalog.json lists the live segments of the latest generation and is replaced
+    atomically, so a reader sees either the old or the new catalog.
+    """
+
+    def __init__(self, directory: str = STORE_CATALOG_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._written: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        # Start from an empty catalog: files of a previous store process are stale
+        for name in os.listdir(directory):
+            if name.startswith("segment-") or name == CATALOG_FILE:
+                os.remove(os.path.join(directory, name))
+
+    def publish(self, snapshot: StoreSnapshot):
+        with self._lock:
+            entries = []
+            for segment in snapshot.segments():
+                name = self._written.get(segment.segment_id)
+                if name is None:
+                    name = _segment_file(segment.segment_id)
+                    payload = {"logs": segment.logs, "sessions": segment.sessions}
+                    self._write_atomic(name, zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 1))
+                    self._written[segment.segment_id] = name
+                entries.append({"segment_id": segment.segment_id, "filename": segment.filename, "file": name})
+
+            catalog = {"generation": snapshot.generation, "segments": entries}
+            self._write_atomic(CATALOG_FILE, json.dumps(catalog).encode())
+
+            # Segments no longer listed can go; workers retry if they lose the race
+            live = {entry["segment_id"] for entry in entries}
+            for segment_id in [sid for sid in self._written if sid not in live]:
+                try:
+                    os.remove(os.path.join(self.directory, self._written.pop(segment_id)))
+                except OSError:
+                    pass
+
+    def _write_atomic(self, name: str, data: bytes):
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class CatalogReader:
+    """
+    Builds StoreSnapshots from the catalog directory inside a worker process.
+    Segments already loaded are reused, so a refresh only reads new segments.
+
+    With a residency (the worker's own LOG_STORE_MEMORY_BUDGET_MB), loaded segments
+    are tracked like those of the store process, so each worker keeps at most the
+    budget of rows in memory and spills the rest.
+    """
+
+    def __init__(self, directory: str = STORE_CATALOG_DIR, residency: Optional[SegmentResidency] = None):
+        self.directory = directory
+        self.residency = residency
+        self._catalog_version: Optional[tuple] = None
+        self._segments: Dict[int, Segment] = {}
+        self._lock = threading.Lock()
+
+    def _version(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(os.path.join(self.directory, CATALOG_FILE))
+        except FileNotFoundError:
+            return None
+        # catalog.json is replaced (new inode) on every publish
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def changed(self) -> bool:
+        """Cheap check (one stat call) whether a newer catalog has been published."""
+        version = self._version()
+        return version is not None and version != self._catalog_version
+
+    def refresh(self) -> Optional[StoreSnapshot]:
+        """Return a new snapshot if the catalog changed since the last call, else None."""
+        version = self._version()
+        if version is None or version == self._catalog_version:
+            return None
+
+        with self._lock:
+            if version == self._catalog_version:
+                return None
+            for _ in range(3):
+                try:
+                    snapshot = self._load()
+                    break
+                except FileNotFoundError:
+                    # A segment was removed by a newer generation while loading; read the catalog again
+                    continue
+            else:
+                return None
+            self._catalog_version = version
+            return snapshot
+
+    def _load(self) -> StoreSnapshot:
+        with open(os.path.join(self.directory, CATALOG_FILE), "rb") as f:
+            catalog = json.loads(f.read())
+
+        segments = []
+        loaded = []
+        by_filename: Dict[str, tuple] = {}
+        for entry in catalog["segments"]:
+            segment = self._segments.get(entry["segment_id"])
+            if segment is None:
+                with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+                    payload = pickle.loads(zlib.decompress(f.read()))
+                segment = Segment(entry["segment_id"], entry["filename"], payload["logs"], payload["sessions"])
+                segment.nbytes = estimate_rows_size(payload["logs"])
+                loaded.append(segment)
+            segments.append(segment)
+            by_filename[segment.filename] = by_filename.get(segment.filename, ()) + (segment,)
+
+        live = {segment.segment_id: segment for segment in segments}
+        if self.residency is not None:
+            for segment_id, segment in self._segments.items():
+                if segment_id not in live:
+                    self.residency.forget(segment)
+            for segment in loaded:
+                self.residency.track(segment)
+        self._segments = live
+        return StoreSnapshot(catalog["generation"], tuple(segments), by_filename)
@@ -0,0 +1,40 @@
+import gzip
+
+from conftest import tarred, zipped
+from generate_test_logs import render_lines
+
+PAYLOADS = [render_lines(n, 30 + i, 2, True).encode() for i, n in enumerate((1500, 400, 2500, 900))]
+
+
+def stored(client):
+    return client.get("/logs").json()["logs"], client.get("/sessions").json()["sessions"]
+
+
+def test_batch_matches_sequential_uploads(client):
+    # Archive members are stored under "<archive>/<member>"
+    names = ["a.log", "b.log", "bundle.zip/c.log", "bundle.zip/d.log", "more.tar.gz/e.log"]
+    contents = PAYLOADS + [PAYLOADS[0]]
+    # Something already stored: the batch continues its numbering
+    client.post("/read-log/", files={"file": ("first.log", PAYLOADS[1])})
+    for name, data in zip(names, contents):
+        client.post("/read-log/", files={"file": (name, data)})
+    expected = stored(client)
+    client.post("/clear-data/")
+
+    client.post("/read-log/", files={"file": ("first.log", PAYLOADS[1])})
+    parts = [
+        ("files", ("a.log", PAYLOADS[0])),
+        ("files", ("b.log", gzip.compress(PAYLOADS[1]))),  # compression is detected from the bytes
+        ("files", ("bundle.zip", zipped([("c.log", PAYLOADS[2]), ("d.log", PAYLOADS[3])]))),
+        ("files", ("broken.gz", gzip.compress(PAYLOADS[2])[:-50])),
+        ("files", ("more.tar.gz", tarred([("e.log", PAYLOADS[0])]))),
+    ]
+    response = client.post("/read-logs/", files=parts)
+    assert response.status_code == 200, response.text
+    result = response.json()
+
+    assert [entry["filename"] for entry in result["files"]] == names[:4] + ["broken.gz", names[4]]
+    assert result["failed_files"] == 1 and "error" in result["files"][4]
+    # The unreadable part is skipped; everything else is numbered as if uploaded one by one
+    assert stored(client) == expected
+    assert result["next_log_id"] == expected[0][-1]["id"] + 1
@@ -0,0 +1,47 @@
+import gzip
+
+import compression as backend_compression
+from conftest import zipped
+from generate_test_logs import render_lines
+
+PAYLOAD = render_lines(2000, 21, 2, True).encode()
+
+
+def upload(client, data):
+    response = client.post("/read-log/", files={"file": ("device.log", data)})
+    assert response.status_code == 200, response.text
+    return [{k: v for k, v in log.items() if k != "filename"} for log in client.get("/logs").json()["logs"]]
+
+
+def test_compressed_uploads_match_plain(client):
+    plain = upload(client, PAYLOAD)
+    assert plain
+    # Two gzip members back to back (as written by `cat a.gz b.gz`) decode as one stream
+    half = PAYLOAD.rfind(b"\n", 0, len(PAYLOAD) // 2) + 1
+    uploads = [
+        gzip.compress(PAYLOAD),
+        gzip.compress(PAYLOAD[:half]) + gzip.compress(PAYLOAD[half:]),
+        zipped([("device.log", PAYLOAD)]),
+    ]
+    if backend_compression.zstandard is not None:
+        uploads.append(backend_compression.zstandard.ZstdCompressor().compress(PAYLOAD))
+    for data in uploads:
+        client.post("/clear-data/")
+        assert upload(client, data) == plain
+
+
+def test_zip_upload_ingests_each_member(client):
+    client.post("/read-log/", files={"file": ("bundle.zip", zipped([("a.log", PAYLOAD), ("b/c.log", PAYLOAD)]))})
+    client.post("/read-log/", files={"file": ("other.log", PAYLOAD)})
+    assert client.get("/logs/files").json()["files"] == ["bundle.zip/a.log", "bundle.zip/b/c.log", "other.log"]
+    # Clearing the upload drops all of its members
+    client.get("/clear-file-data/", params={"filename": "bundle.zip"})
+    assert client.get("/logs/files").json()["files"] == ["other.log"]
+
+
+def test_corrupt_upload_is_rejected(client):
+    response = client.post("/read-log/", files={"file": ("device.log.gz", gzip.compress(PAYLOAD)[:-100])})
+    assert response.status_code == 400
+    # Declared encoding is used when the bytes do not tell
+    response = client.post("/read-log/", files={"file": ("device.log", b"not gzip at all", "application/gzip")})
+    assert response.status_code == 400
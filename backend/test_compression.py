@@ -0,0 +1,64 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, available_encodings, negotiate_encoding
+
+BIG = "x" * 4000
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+
+@app.get("/big")
+def big():
+    return PlainTextResponse(BIG, headers={"Vary": "Origin"})
+
+
+@app.get("/small")
+def small():
+    return JSONResponse({"ok": True}, headers={"Vary": "Origin"})
+
+
+@app.get("/binary")
+def binary():
+    return Response(b"\0" * 4000, media_type="application/octet-stream")
+
+
+client = TestClient(app)
+
+
+def test_negotiation():
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0, deflate") is None
+    # The wildcard covers the other encodings, not the one disabled with q=0
+    assert negotiate_encoding("*;q=0.5, gzip;q=0") == next((e for e in available_encodings() if e != "gzip"), None)
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+    # Higher q beats server preference
+    assert negotiate_encoding("gzip;q=1, zstd;q=0.1, br;q=0.1") == "gzip"
+
+
+def test_large_body_is_compressed():
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BIG
+    assert response.headers["vary"] == "Origin, Accept-Encoding"
+
+    with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert len(raw) < len(BIG) and gzip.decompress(raw) == BIG.encode()
+
+
+def test_passthrough_keeps_vary():
+    # Below the size threshold, with q=0 or without Accept-Encoding: sent as is, still marked as varying
+    for path, accept in (("/small", "gzip"), ("/big", "gzip;q=0"), ("/big", "")):
+        response = client.get(path, headers={"Accept-Encoding": accept})
+        assert "content-encoding" not in response.headers, (path, accept)
+        assert response.headers["vary"] == "Origin, Accept-Encoding", (path, accept)
+
+    # Bodies that are never compressed do not vary
+    response = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers and "vary" not in response.headers
@@ -0,0 +1,85 @@
+import threading
+from collections import Counter
+
+from generate_test_logs import render_lines
+from log_parser import LogFileParser
+
+UPLOADS = 8
+# Every upload is the same generated file, so each stores the same number of rows and sessions
+PAYLOAD = render_lines(400, 9, 2, True).encode()
+
+
+def parse_payload():
+    parser = LogFileParser("reference.log")
+    parser.feed_lines(PAYLOAD.decode().splitlines())
+    return parser.finish()
+
+
+REFERENCE = parse_payload()
+ROWS_PER_FILE = len(REFERENCE.logs)
+SESSIONS_PER_FILE = len(REFERENCE.sessions)
+
+
+def check_snapshot_logs(logs):
+    """A reader must never see duplicate ids or a partially published file."""
+    ids = [log["id"] for log in logs]
+    assert len(ids) == len(set(ids)), "duplicate log ids"
+    per_file = Counter(log["filename"] for log in logs)
+    for filename, count in per_file.items():
+        assert count == ROWS_PER_FILE, f"{filename} is half-published ({count} rows)"
+
+
+def test_concurrent_uploads_with_readers(client):
+    errors = []
+    uploads_done = threading.Event()
+
+    def upload(index):
+        try:
+            response = client.post("/read-log/", files={"file": (f"device-{index}.log", PAYLOAD)})
+            assert response.status_code == 200, response.text
+        except Exception as e:  # surfaced in the main thread
+            errors.append(e)
+
+    def read():
+        try:
+            while not uploads_done.is_set():
+                check_snapshot_logs(client.get("/logs").json()["logs"])
+                sessions = client.get("/sessions").json()["sessions"]
+                assert len(sessions) % SESSIONS_PER_FILE == 0, "session summaries of a file are half-published"
+                page = client.get("/logs/paginated", params={"per_page": 1000}).json()
+                assert page["metadata"]["total_logs"] % ROWS_PER_FILE == 0
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    writers = [threading.Thread(target=upload, args=(i,)) for i in range(UPLOADS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    uploads_done.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors, errors
+
+    logs = client.get("/logs").json()["logs"]
+    sessions = client.get("/sessions").json()["sessions"]
+
+    # Every row stored exactly once with unique, gap-free ids
+    assert len(logs) == UPLOADS * ROWS_PER_FILE
+    check_snapshot_logs(logs)
+    assert sorted(log["id"] for log in logs) == list(range(1, len(logs) + 1))
+
+    # Rows of one upload are never interleaved with another upload
+    for filename in {log["filename"] for log in logs}:
+        ids = [log["id"] for log in logs if log["filename"] == filename]
+        assert ids == list(range(ids[0], ids[0] + ROWS_PER_FILE))
+
+    # Session ids are unique and each summary matches the rows of its session
+    assert len(sessions) == UPLOADS * SESSIONS_PER_FILE
+    assert len({s["session_id"] for s in sessions}) == len(sessions)
+    rows_per_session = Counter((log["session_id"], log["device_id"], log["filename"]) for log in logs)
+    for summary in sessions:
+        key = (summary["session_id"], summary["device_id"], summary["filename"])
+        assert summary["entries_count"] == rows_per_session[key]
@@ -0,0 +1,41 @@
+import pytest
+
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt
+
+PAYLOAD = "\n".join(
+    cryptojs_encrypt(PASSPHRASE, line)
+    for line in ["DEVICE ID DEV-0001", "10:00:00:000 | LOG-APP: App Version: 4.1.0", "10:00:01:000 | INFO : hello"]
+).encode()
+
+
+@pytest.fixture
+def client(client):
+    client.post("/read-log/", files={"file": ("etag.log", PAYLOAD)})
+    return client
+
+
+def test_matching_etag_gets_304(client):
+    response = client.get("/logs", params={"device_id": "DEV-0001"})
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"g') and response.headers["cache-control"] == "no-cache"
+
+    revalidated = client.get("/logs", params={"device_id": "DEV-0001"}, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+    # Also within a list of tags; other arguments have their own tag
+    assert client.get("/logs", params={"device_id": "DEV-0001"}, headers={"If-None-Match": f'W/"other", {etag}'}).status_code == 304
+    assert client.get("/logs", headers={"If-None-Match": etag}).status_code == 200
+
+    # POST /test-results is tagged on its body
+    body = {"siteId": "a"}
+    etag = client.post("/test-results", json=body).headers["etag"]
+    assert client.post("/test-results", json=body, headers={"If-None-Match": etag}).status_code == 304
+    assert client.post("/test-results", json={"siteId": "b"}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_etag_changes_with_the_store(client):
+    etag = client.get("/sessions").headers["etag"]
+    client.post("/read-log/", files={"file": ("more.log", PAYLOAD)})
+    response = client.get("/sessions", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert len(response.json()["sessions"]) == 2
@@ -0,0 +1,70 @@
+import numpy as np
+
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt, render_lines
+from log_columns import compute_dwell
+from log_lexer import NAVIGATE, lex
+
+LINES = [
+    "DEVICE ID DEV-0001",
+    "10:00:00:000 | LOG-APP: App Version: 4.1.0",
+    "10:00:01:000 | LOG-APP: Model Name: Pixel 7",
+    "10:00:03:000 | ECS-ACTIVITY: NAVIGATE-TO : { screen : siteList }",
+    "10:00:04:000 | INFO : loading",
+    "10:00:08:000 | ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeList }",
+    "10:00:09:500 | ECS-ACTIVITY: NAVIGATE-TO : { screen : siteList }",
+    "10:00:10:000 | INFO : idle",
+    "23:59:59:000 | LOG-APP: App Version: 4.1.0",
+    "00:00:01:000 | ECS-ACTIVITY: NAVIGATE-TO : { screen : siteList }",  # after midnight
+    "00:00:05:000 | ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeList }",
+]
+
+
+def test_dwell_times(client):
+    payload = "\n".join(cryptojs_encrypt(PASSPHRASE, line) for line in LINES).encode()
+    client.post("/read-log/", files={"file": ("dwell.log", payload)})
+    flowchart = client.get("/flowchart").json()
+    nodes = {node["id"]: node["dwell"] for node in flowchart["nodes"]}
+    edges = {(edge["from"], edge["to"]): edge["dwell"] for edge in flowchart["edges"]}
+
+    # siteList: 5000 (to nodeList), 500 (to the session end), 4000 (to nodeList, across midnight)
+    assert nodes["siteList"] == {"count": 3, "mean_ms": 3166.7, "p50_ms": 4000.0, "p95_ms": 4900.0, "max_ms": 5000}
+    # nodeList: 1500, then 0 as the last row of its session
+    assert nodes["nodeList"]["count"] == 2 and nodes["nodeList"]["max_ms"] == 1500
+    assert edges[("siteList", "nodeList")]["count"] == 2 and edges[("siteList", "nodeList")]["mean_ms"] == 4500.0
+    assert edges[("nodeList", "siteList")]["max_ms"] == 1500
+    assert edges[("login", "siteList")]["max_ms"] == 2000 and nodes["login"]["count"] == 1
+    assert flowchart["metadata"]["session_duration"]["max_ms"] == 10000
+
+    sessions = client.get("/sessions").json()
+    assert [s["duration_ms"] for s in sessions["sessions"]] == [10000, 6000]
+    assert sessions["duration"]["mean_ms"] == 8000.0
+
+
+def test_login_edges_add_to_a_screen_named_login():
+    # Navigation to a screen called "login", a login row, then home
+    result = compute_dwell([1, 1, 1], [0, 200, 300], [(0, "login"), (2, "home")], {1: 1})
+    assert result["transitions"][("login", "home")] == [300, 100]
+
+
+def test_dwell_matches_a_scan(client):
+    for index in range(2):
+        client.post("/read-log/", files={"file": (f"d{index}.log", render_lines(3000, 70 + index, 2, True).encode())})
+    logs = client.get("/logs").json()["logs"]
+
+    expected = {}
+    by_session = {}
+    for log in logs:
+        by_session.setdefault(log["session_id"], []).append(log)
+    for rows in by_session.values():
+        end = max((row["time_ms"] for row in rows if row["time_ms"] is not None), default=None)
+        navigations = [row for row in rows if lex(row["message"]).kind == NAVIGATE]
+        for row, following in zip(navigations, navigations[1:] + [None]):
+            leave = following["time_ms"] if following else end
+            if row["time_ms"] is not None and leave is not None and leave >= row["time_ms"]:
+                expected.setdefault(lex(row["message"]).screen, []).append(leave - row["time_ms"])
+
+    nodes = {node["id"]: node["dwell"] for node in client.get("/flowchart").json()["nodes"]}
+    for screen, samples in expected.items():
+        assert nodes[screen]["count"] == len(samples)
+        assert nodes[screen]["max_ms"] == max(samples)
+        assert nodes[screen]["p95_ms"] == round(float(np.percentile(samples, 95)), 1)
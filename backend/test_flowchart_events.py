@@ -0,0 +1,90 @@
+import pytest
+
+import app as backend
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt
+
+
+def navigate(time: str, screen: str) -> str:
+    return f"{time} | ECS-ACTIVITY: NAVIGATE-TO : {{ screen : {screen} }}"
+
+
+SESSION_1 = [
+    "10:00:00:000 | LOG-APP: App Version: 4.1.0",
+    "10:00:00:500 | LOG-APP: Model Name: Pixel 7",
+    "10:00:01:000 | INFO : after login",
+    navigate("10:00:02:000", "siteList"),
+    "10:00:03:000 | INFO : first list",
+    navigate("10:00:04:000", "nodeList"),
+    "10:00:05:000 | INFO : on nodes",
+    navigate("10:00:06:000", "settings"),
+    navigate("10:00:07:000", "siteList"),
+    navigate("10:00:08:000", "settings"),
+]
+SESSION_2 = [
+    "11:00:00:000 | LOG-APP: App Version: 4.1.0",
+    "11:00:00:500 | LOG-APP: Model Name: Pixel 7",
+    navigate("11:00:01:000", "nodeList"),
+    "11:00:02:000 | INFO : second session",
+]
+
+
+@pytest.fixture
+def client(client):
+    lines = ["DEVICE ID DEV-0001"] + SESSION_1 + SESSION_2
+    payload = "\n".join(cryptojs_encrypt(PASSPHRASE, line) for line in lines).encode()
+    client.post("/read-log/", files={"file": ("events.log", payload)})
+    return client
+
+
+def events(client, **params):
+    return client.get("/flowchart/events", params=params).json()
+
+
+def messages(result):
+    return [event["message"] for event in result["events"]]
+
+
+def test_edge_occurrences_and_pagination(client):
+    # siteList -> settings: from a siteList navigation to the next settings one, other screens in between
+    first = events(client, from_state="siteList", to_state="settings")
+    assert messages(first) == [
+        "INFO : first list",
+        "ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeList }",
+        "INFO : on nodes",
+    ]
+    assert (first["total_occurrences"], first["has_next"]) == (2, True)
+    assert all(event["device_id"] == "DEV-0001" for event in first["events"])
+
+    # The second occurrence is the consecutive siteList -> settings of the same session
+    second = events(client, from_state="siteList", to_state="settings", occurrence=1)
+    assert messages(second) == [] and second["session_id"] == first["session_id"] and not second["has_next"]
+    assert events(client, from_state="siteList", to_state="settings", occurrence=2)["events"] == []
+
+    assert messages(events(client, from_state="nodeList", to_state="settings")) == ["INFO : on nodes"]
+    assert events(client, from_state="settings", to_state="nodeList")["total_occurrences"] == 0
+
+
+def test_login_edge(client):
+    # Up to the first navigation to to_state after the login, not just the first screen
+    result = events(client, from_state="login", to_state="nodeList")
+    assert messages(result) == ["INFO : after login", "ECS-ACTIVITY: NAVIGATE-TO : { screen : siteList }", "INFO : first list"]
+    assert result["total_occurrences"] == 2
+    assert messages(events(client, from_state="login", to_state="nodeList", occurrence=1)) == []
+
+    # A session without to_state after its login contributes the rest of the session
+    result = events(client, from_state="login", to_state="siteList", occurrence=1)
+    assert messages(result) == ["ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeList }", "INFO : second session"]
+
+    session_id = result["session_id"]
+    restricted = events(client, from_state="login", to_state="siteList", session_id=session_id)
+    assert restricted["total_occurrences"] == 1 and restricted["events"] == result["events"]
+
+
+def test_occurrences_are_found_once_per_edge(client, monkeypatch):
+    calls = []
+    find = backend.EdgeOccurrenceIndex._find_occurrences
+    monkeypatch.setattr(backend.EdgeOccurrenceIndex, "_find_occurrences", lambda self, *args: calls.append(args[:2]) or find(self, *args))
+    for occurrence in range(3):
+        events(client, from_state="siteList", to_state="settings", occurrence=occurrence)
+    events(client, from_state="nodeList", to_state="settings")
+    assert calls == [("siteList", "settings"), ("nodeList", "settings")]
@@ -0,0 +1,53 @@
+import json
+import threading
+
+import app as backend
+import ingest_progress as backend_ingest_progress
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt
+from ingest_progress import IngestProgress
+
+PAYLOAD = "\n".join(
+    cryptojs_encrypt(PASSPHRASE, line)
+    for line in ["DEVICE ID DEV-0001", "10:00:00:000 | LOG-APP: App Version: 4.1.0", "10:00:01:000 | INFO : hello"]
+).encode()
+
+
+def read_events(response):
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+def test_unknown_ingest_stream_ends(client, monkeypatch):
+    monkeypatch.setattr(backend, "START_WAIT_SECONDS", 0.3)
+    events = read_events(client.get("/ingest/never-started/events"))
+    assert events == [{"event": "error", "ingest_id": "never-started", "error": "Ingest not found"}]
+    # Subscribing does not create a tracker
+    assert client.get("/ingest/never-started").status_code == 404
+
+
+def test_reused_ingest_id_starts_fresh(client):
+    for filename in ("first.log", "second.log"):
+        client.post("/read-log/", params={"ingest_id": "reused"}, files={"file": (filename, PAYLOAD)})
+        events = read_events(client.get("/ingest/reused/events"))
+        assert [event["event"] for event in events][0] == "started"
+        assert [event["event"] for event in events][-1] == "summary"
+        assert all(event["filenames"] == [filename] for event in events)
+        assert events[-1]["logs_stored"] == 2
+
+
+def test_concurrent_updates_are_counted_and_published_in_order(monkeypatch):
+    monkeypatch.setattr(backend_ingest_progress, "PROGRESS_INTERVAL_SECONDS", 0)  # publish on every update
+    progress = IngestProgress("concurrent")
+    progress.begin("batch", ["a.log", "b.log"])
+
+    def work():
+        for _ in range(2000):
+            progress.add(lines_read=1, bytes_read=10)
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert (progress.snapshot()["lines_read"], progress.snapshot()["bytes_read"]) == (8000, 80000)
+    published = [event["lines_read"] for event in progress.events_since(0)]
+    assert published == sorted(published) and published[-1] == 8000
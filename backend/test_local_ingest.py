@@ -0,0 +1,157 @@
+import os
+
+import pytest
+
+import app as backend
+import local_ingest as backend_local_ingest
+from generate_test_logs import render_lines
+from log_parser import LogFileParser
+
+ADMIN = {"X-Admin-Token": "test-token"}
+PAYLOAD = render_lines(3000, 41, 2, True).encode()
+PLAIN = render_lines(800, 42, 2, False).encode()
+OTHER = render_lines(600, 43, 2, True).encode()
+
+
+@pytest.fixture
+def client(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "ADMIN_TOKEN", "test-token")
+    monkeypatch.setattr(backend_local_ingest, "LOCAL_INGEST_ROOTS", [os.path.realpath(tmp_path)])
+    monkeypatch.setattr(backend.local_follows, "interval", 3600)
+    return client
+
+
+def stored(client, rename=None):
+    logs, sessions = client.get("/logs").json()["logs"], client.get("/sessions").json()["sessions"]
+    if rename:
+        for row in logs + sessions:
+            row["filename"] = rename.get(row["filename"], row["filename"])
+    return logs, sessions
+
+
+def test_local_files_match_upload(client, tmp_path):
+    client.post("/read-log/", files={"file": ("a.log", PAYLOAD)})
+    expected = stored(client)
+    client.post("/clear-data/")
+
+    (tmp_path / "a.log").write_bytes(PAYLOAD)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.log").write_bytes(PLAIN)
+    response = client.post("/admin/local-ingest", json={"path": str(tmp_path / "**" / "*.log")}, headers=ADMIN)
+    assert response.status_code == 200, response.text
+    a_path, b_path = (os.path.realpath(tmp_path / name) for name in ("a.log", "sub/b.log"))
+    assert [entry["path"] for entry in response.json()["files"]] == [a_path, b_path]
+
+    logs, sessions = stored(client, {a_path: "a.log"})
+    assert [log for log in logs if log["filename"] == "a.log"] == expected[0]
+    assert [session for session in sessions if session["filename"] == "a.log"] == expected[1]
+    # The decrypted file is detected as such and parsed without decrypting
+    parser = LogFileParser(b_path, decrypt=False, log_id_start=expected[0][-1]["id"] + 1, session_id_start=expected[0][-1]["session_id"])
+    parser.feed_lines(PLAIN.decode().split("\n"))
+    plain = parser.finish()
+    assert [log for log in logs if log["filename"] == b_path] == plain.logs
+
+
+def test_local_ingest_is_confined_to_roots(client, tmp_path):
+    outside = os.path.dirname(os.path.realpath(tmp_path))
+    response = client.post("/admin/local-ingest", json={"path": os.path.join(outside, "*", "*")}, headers=ADMIN)
+    assert response.status_code in (403, 404)
+    assert client.post("/admin/local-ingest", json={"path": "relative/*.log"}, headers=ADMIN).status_code == 400
+    assert client.post("/admin/local-ingest", json={"path": str(tmp_path / "a.log")}).status_code == 403
+
+
+def test_follow_appends_continue_the_open_session(client, tmp_path):
+    client.post("/read-log/", files={"file": ("a.log", PAYLOAD)})
+    expected = stored(client)
+    client.post("/clear-data/")
+
+    path = tmp_path / "a.log"
+    cuts = [len(PAYLOAD) // 3 + 5, 2 * len(PAYLOAD) // 3 + 11, len(PAYLOAD) - 3]  # mid-line cuts
+    path.write_bytes(PAYLOAD[:cuts[0]])
+    result = client.post("/admin/local-ingest", json={"path": str(path), "follow": True}, headers=ADMIN).json()
+    follow = backend.local_follows.get(result["follow_id"])
+    # The unterminated last line is not read yet
+    assert result["files"][0]["offset"] == PAYLOAD.rfind(b"\n", 0, cuts[0]) + 1
+
+    for start, end in zip(cuts, cuts[1:]):
+        with open(path, "ab") as f:
+            f.write(PAYLOAD[start:end])
+        backend.store_writer.submit(backend.poll_local_follow, follow).result()
+    with open(path, "ab") as f:
+        f.write(PAYLOAD[cuts[-1]:])
+
+    status = client.get("/admin/local-ingest/follows", headers=ADMIN).json()["follows"]
+    assert [item["follow_id"] for item in status] == [follow.follow_id]
+    client.delete(f"/admin/local-ingest/follows/{follow.follow_id}", headers=ADMIN)
+    assert stored(client, {os.path.realpath(path): "a.log"}) == expected
+    assert client.get("/admin/local-ingest/follows", headers=ADMIN).json()["follows"] == []
+
+
+def test_follow_interleaved_with_uploads_keeps_ids_unique(client, tmp_path):
+    path = tmp_path / "a.log"
+    half = PAYLOAD.rfind(b"\n", 0, len(PAYLOAD) // 2) + 1
+    path.write_bytes(PAYLOAD[:half])
+    follow_id = client.post("/admin/local-ingest", json={"path": str(path), "follow": True}, headers=ADMIN).json()["follow_id"]
+    client.post("/read-log/", files={"file": ("other.log", OTHER)})
+    with open(path, "ab") as f:
+        f.write(PAYLOAD[half:])
+    backend.store_writer.submit(backend.poll_local_follow, backend.local_follows.get(follow_id)).result()
+    client.delete(f"/admin/local-ingest/follows/{follow_id}", headers=ADMIN)
+
+    logs, sessions = stored(client)
+    ids = [log["id"] for log in logs]
+    assert len(set(ids)) == len(ids)
+    session_ids = [session["session_id"] for session in sessions]
+    assert len(set(session_ids)) == len(session_ids)
+    # Sessions of the two files never share an id
+    by_file = {}
+    for log in logs:
+        by_file.setdefault(log["filename"], set()).add(log["session_id"])
+    assert len(by_file) == 2
+    assert not set.intersection(*by_file.values())
+
+
+def test_follow_polls_extend_the_last_segment(client, tmp_path):
+    path = tmp_path / "a.log"
+    cuts = [0] + [PAYLOAD.rfind(b"\n", 0, len(PAYLOAD) * i // 4) + 1 for i in (1, 2, 3)] + [len(PAYLOAD)]
+    path.write_bytes(PAYLOAD[:cuts[1]])
+    follow_id = client.post("/admin/local-ingest", json={"path": str(path), "follow": True}, headers=ADMIN).json()["follow_id"]
+    follow = backend.local_follows.get(follow_id)
+    real_path = os.path.realpath(path)
+
+    def append_and_poll(start, end):
+        with open(path, "ab") as f:
+            f.write(PAYLOAD[start:end])
+        backend.store_writer.submit(backend.poll_local_follow, follow).result()
+
+    append_and_poll(cuts[1], cuts[2])
+    assert len(backend.log_store.snapshot().segments(real_path)) == 1
+    # Another file in between: the next poll starts a new segment, so segments stay in id order
+    client.post("/read-log/", files={"file": ("other.log", OTHER)})
+    append_and_poll(cuts[2], cuts[3])
+    append_and_poll(cuts[3], cuts[4])
+    assert len(backend.log_store.snapshot().segments(real_path)) == 2
+    ids = [log["id"] for log in client.get("/logs").json()["logs"]]
+    assert ids == sorted(ids)
+    client.delete(f"/admin/local-ingest/follows/{follow_id}", headers=ADMIN)
+
+
+def test_clear_stops_follows(client, tmp_path):
+    half = PAYLOAD.rfind(b"\n", 0, len(PAYLOAD) // 2) + 1
+    for name in ("a.log", "b.log"):
+        (tmp_path / name).write_bytes(PAYLOAD[:half])
+    follow_id = client.post("/admin/local-ingest", json={"path": str(tmp_path / "*.log"), "follow": True}, headers=ADMIN).json()["follow_id"]
+    follow = backend.local_follows.get(follow_id)
+
+    # Clearing one followed file stops tailing it, but not the other
+    client.get("/clear-file-data/", params={"filename": "a.log"})
+    for name in ("a.log", "b.log"):
+        with open(tmp_path / name, "ab") as f:
+            f.write(PAYLOAD[half:])
+    backend.store_writer.submit(backend.poll_local_follow, follow).result()
+    assert client.get("/logs/files").json()["files"] == [os.path.realpath(tmp_path / "b.log")]
+
+    assert client.post("/clear-data/").json()["stopped_follows"] == 1
+    assert client.get("/admin/local-ingest/follows", headers=ADMIN).json()["follows"] == []
+    backend.store_writer.submit(backend.poll_local_follow, follow).result()
+    assert client.get("/logs").json()["logs"] == []
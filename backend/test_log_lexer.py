@@ -0,0 +1,43 @@
+from log_lexer import (
+    ACTIVE, ACTIVITY, BACKGROUND, DEBUG, DEVICE, ENTRY, ERROR, INFO, LOGIN, MESSAGE, NAVIGATE, TESTING_INFO, WARNING,
+    lex, lex_message,
+)
+
+
+def test_kinds():
+    cases = [
+        ("DEVICE ID DEV-0001", DEVICE),
+        ("23:13:24:961 | LOG-APP: App Version: 4.8.0 (build 8628)", ENTRY),
+        ("23:14:27:311 | LOG-APP: Model Name: Galaxy S23, OS: 14", LOGIN),
+        ("23:14:38:896 | ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeDetails }", NAVIGATE),
+        ("ECS-ACTIVITY: TESTING-INFO : { details : Test Started , info : {} }", TESTING_INFO),
+        ("23:14:22:666 | INFO : App moved to background", BACKGROUND),
+        ("INFO : App did become active", ACTIVE),
+        ("ECS-ACTIVITY: BUTTON-TAP : { id : save }", ACTIVITY),
+        ("Model Name: without LOG-APP", MESSAGE),
+        ("TESTING-INFO without an activity marker", MESSAGE),
+    ]
+    assert [(line, lex(line).kind) for line, _ in cases] == cases
+
+
+def test_fields():
+    token = lex("23:14:38:896 | ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeDetails }")
+    assert (token.time, token.screen, token.level) == ("23:14:38:896", "nodeDetails", None)
+    assert token.message == "ECS-ACTIVITY: NAVIGATE-TO : { screen : nodeDetails }"
+    assert lex("DEVICE ID DEV-0001").device_id == "DEV-0001"
+    assert lex("no time here").time is None
+
+
+def test_levels():
+    assert lex("Exception : NullPointerException in TestAdapter").level == ERROR
+    assert lex("WARN : an error was retried").level == ERROR  # errors win over warnings
+    assert lex("warn : Battery level 15%").level == WARNING
+    assert lex("TESTING-INFO : { details : Test Completed }").level == INFO
+    assert lex("DEBUG : cache hit").level == DEBUG
+    assert lex("Sync started").level is None
+
+
+def test_lex_message_is_memoized():
+    message = "ECS-ACTIVITY: NAVIGATE-TO : { screen : siteList }"
+    assert lex_message(message) is lex_message(message)
+    assert lex_message(message).screen == lex(message).screen == "siteList"
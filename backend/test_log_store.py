@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import app as backend
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt
+from log_store import LogStore, estimate_rows_size
+
+
+def make_rows(first_id: int, count: int, filename: str):
+    logs = [
+        {"id": first_id + i, "session_id": 1, "device_id": "DEV-1", "time": None, "time_ms": None, "message": f"{filename} row {i}", "filename": filename}
+        for i in range(count)
+    ]
+    return logs, [{"session_id": 1, "filename": filename}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Budget for about two of the 100-row segments below
+    budget = int(estimate_rows_size(make_rows(1, 100, "x.log")[0]) * 2.5)
+    store = LogStore(memory_budget_bytes=budget, spill_dir=str(tmp_path))
+    for index in range(4):
+        store.add_segment(f"f{index}.log", *make_rows(1 + index * 100, 100, f"f{index}.log"))
+    yield store
+    store.residency.close()
+
+
+def resident(store):
+    return [segment.filename for segment in store.snapshot().segments() if segment.resident]
+
+
+def test_spill_and_page_in(store):
+    # The two oldest segments were spilled to their own files
+    assert resident(store) == ["f2.log", "f3.log"]
+    spilled = [segment for segment in store.snapshot().segments() if not segment.resident]
+    assert all(os.path.exists(segment._spill_path) for segment in spilled)
+    assert store.residency.spills == 2
+    assert store.residency.resident_bytes <= store.residency.budget_bytes
+
+    # Reading a spilled segment pages it back in, with the same rows
+    assert store.snapshot().logs("f0.log") == make_rows(1, 100, "f0.log")[0]
+    assert store.residency.page_ins == 1
+    assert "f0.log" in resident(store)
+
+
+def test_least_recently_used_is_spilled(store):
+    store.snapshot().logs("f2.log")  # f3 is now the least recently used resident segment
+    store.snapshot().logs("f0.log")
+    assert resident(store) == ["f0.log", "f2.log"]
+    # A segment is written at most once: spilling f0 again reuses its file
+    spill_path = store.snapshot().segments("f0.log")[0]._spill_path
+    store.snapshot().logs("f3.log")
+    store.snapshot().logs("f1.log")
+    assert store.snapshot().segments("f0.log")[0]._spill_path == spill_path
+
+
+def test_remove_spilled_file(store):
+    segment = store.snapshot().segments("f0.log")[0]
+    spill_path = segment._spill_path
+    assert store.remove_file("f0.log") == ["f0.log"]
+    assert store.snapshot().filenames() == ["f1.log", "f2.log", "f3.log"]
+    # An old snapshot can still read it; the spill file goes with the last reference
+    assert len(segment.logs) == 100
+    del segment
+    assert not os.path.exists(spill_path)
+    assert store.residency.resident_bytes == sum(s.nbytes for s in store.snapshot().segments() if s.resident)
+
+
+def test_residency_stats(store):
+    stats = store.residency_stats()
+    assert stats["memory_budget_bytes"] == store.residency.budget_bytes
+    assert (stats["spills"], stats["page_ins"]) == (2, 0)
+    files = {entry["filename"]: entry for entry in stats["files"]}
+    assert files["f0.log"]["spilled_segments"] == 1 and files["f0.log"]["spilled_bytes_on_disk"] > 0
+    assert files["f3.log"]["resident_segments"] == 1 and files["f3.log"]["rows"] == 100
+    assert stats["resident_bytes"] == files["f2.log"]["resident_bytes"] + files["f3.log"]["resident_bytes"]
+
+
+def test_remove_file_drops_only_its_segments():
+    store = LogStore()
+    store.add_segment("a.log", *make_rows(1, 10, "a.log"))
+    store.add_segments([("bucket/2024/b.log", *make_rows(11, 10, "bucket/2024/b.log"), 1), ("c.log", *make_rows(21, 10, "c.log"), 1)])
+    store.add_segment("a.log", *make_rows(31, 10, "a.log"))
+    kept = store.snapshot().segments("c.log")[0]
+
+    # Both segments of a.log go; the others are the same objects, ids unchanged
+    assert store.remove_file("a.log") == ["a.log"]
+    assert store.snapshot().segments("c.log")[0] is kept
+    assert [log["id"] for log in store.snapshot().logs()] == list(range(11, 31))
+    # S3 files are matched by the end of their path
+    assert store.remove_file("b.log") == ["bucket/2024/b.log"]
+    assert store.remove_file("missing.log") == []
+    assert store.snapshot().filenames() == ["c.log"]
+    # Numbering goes on after the removed rows
+    assert store.next_log_id == 41
+
+
+def test_clear_file_data_endpoint(client):
+    def payload(device: str) -> bytes:
+        lines = [f"DEVICE ID {device}", "10:00:00:000 | LOG-APP: App Version: 4.1.0", "10:00:01:000 | INFO : hello"]
+        return "\n".join(cryptojs_encrypt(PASSPHRASE, line) for line in lines).encode()
+
+    for name in ("one.log", "two.log", "three.log"):
+        client.post("/read-log/", files={"file": (name, payload(f"DEV-{name}"))})
+    before = client.get("/logs").json()["logs"]
+    generation = backend.log_store.generation
+
+    result = client.get("/clear-file-data/", params={"filename": "two.log"}).json()
+    assert (result["remaining_logs"], result["remaining_sessions"]) == (4, 2)
+    assert backend.log_store.generation == generation + 1
+    assert client.get("/logs").json()["logs"] == [log for log in before if log["filename"] != "two.log"]
+    assert [s["filename"] for s in client.get("/sessions").json()["sessions"]] == ["one.log", "three.log"]
@@ -0,0 +1,46 @@
+import re
+from typing import Optional
+
+import app as backend
+from generate_test_logs import render_lines
+
+
+def sample_value(text: str, name: str, **labels) -> Optional[float]:
+    """Value of one sample in a Prometheus text exposition (None if absent)."""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + (f"{{{label_text}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_metrics_after_ingest_and_reads(client):
+    # 5000 generated lines, including a few that fail to decrypt
+    payload = render_lines(5000, 7, 3, True).encode()
+    before = client.get("/metrics").text
+    upload = client.post("/read-log/", files={"file": ("metrics.log", payload)})
+    assert upload.status_code == 200
+    client.get("/logs/12")
+    client.get("/logs/13")
+    etag = client.get("/sessions").headers["etag"]
+    assert client.get("/sessions", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    # Routes are labelled by template, and requests answered before routing still get theirs
+    assert sample_value(text, "http_request_duration_seconds_count", method="GET", route="/logs/{log_id}", status="200") >= 2
+    assert sample_value(text, "http_request_duration_seconds_count", method="GET", route="/sessions", status="304") >= 1
+
+    lines_before = sample_value(before, "ingest_lines_total", kind="upload") or 0.0
+    assert sample_value(text, "ingest_lines_total", kind="upload") - lines_before == 5000
+    assert sample_value(text, "ingest_decrypt_failures_total", kind="upload") > 0
+
+    snapshot = backend.log_store.snapshot()
+    assert sample_value(text, "log_store_rows") == snapshot.log_count()
+    assert sample_value(text, "log_store_sessions") == snapshot.session_count()
+    assert sample_value(text, "log_store_files") == 1
+    assert sample_value(text, "log_store_bytes", state="resident") > 0
+    assert "# TYPE event_loop_lag_seconds histogram" in text
+    assert "# TYPE result_cache_hit_ratio gauge" in text
@@ -0,0 +1,82 @@
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as backend
+from generate_test_logs import render_lines
+from profiling import ProfilingMiddleware, RequestProfiler
+
+ADMIN = {"X-Admin-Token": "test-token"}
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(backend, "ADMIN_TOKEN", "test-token")
+    yield client
+    backend.request_profiler.disarm()
+
+
+def test_admin_endpoints_need_token(client, monkeypatch):
+    assert client.get("/admin/profile/captures").status_code == 403
+    assert client.get("/admin/profile/captures", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profile/captures", headers={"X-Admin-Token": "t\xe9st".encode("latin-1")}).status_code == 403
+    monkeypatch.setattr(backend, "ADMIN_TOKEN", "")
+    assert client.get("/admin/profile/captures", headers=ADMIN).status_code == 404
+
+
+def test_armed_route_is_profiled(client):
+    payload = render_lines(3000, 11, 2, True).encode()
+    armed = client.post("/admin/profile/arm", json={"requests": 1, "route": "/read-log/", "allocations": True}, headers=ADMIN)
+    assert armed.json() == {"requests": 1, "route": "/read-log/", "allocations": True}
+
+    # Other routes do not use up the armed request
+    assert "x-profile-id" not in client.get("/health").headers
+    upload = client.post("/read-log/", files={"file": ("profiled.log", payload)})
+    capture_id = upload.headers["x-profile-id"]
+    assert "x-profile-id" not in client.post("/read-log/", files={"file": ("second.log", payload)}).headers
+
+    captures = client.get("/admin/profile/captures", headers=ADMIN).json()
+    assert captures["armed"]["requests"] == 0
+    summary = next(c for c in captures["captures"] if str(c["capture_id"]) == capture_id)
+    assert summary["route"] == "/read-log/" and summary["status"] == 200
+
+    speedscope = client.get(f"/admin/profile/captures/{capture_id}", headers=ADMIN).json()
+    profile = speedscope["profiles"][0]
+    assert profile["type"] == "sampled" and len(profile["samples"]) == len(profile["weights"])
+    names = {frame["name"] for frame in speedscope["shared"]["frames"]}
+    assert "ingest_encrypted_file" in names
+
+    collapsed = client.get(f"/admin/profile/captures/{capture_id}", params={"format": "collapsed"}, headers=ADMIN).text
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.splitlines())
+
+    allocations = client.get(f"/admin/profile/captures/{capture_id}", params={"format": "allocations"}, headers=ADMIN).json()
+    assert allocations["top_allocations"] and allocations["peak_traced_bytes"] > 0
+
+
+def test_tracing_started_elsewhere_is_left_running():
+    profiler = RequestProfiler()
+    tracemalloc.start()
+    try:
+        profiler.stop(profiler.start("GET", "/logs", "", "/logs", allocations=True), 200)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    profiler.stop(profiler.start("GET", "/logs", "", "/logs", allocations=True), 200)
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.parametrize("mode, token, profiled", [
+    (b"cpu", b"test-token", True),
+    (b"alloc", b"test-token", True),
+    (b"off", b"test-token", False),
+    (b"cpu", b"t\xe9st", False),
+])
+def test_profile_header(mode, token, profiled):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    client = TestClient(ProfilingMiddleware(app, RequestProfiler(), admin_token="test-token"))
+    response = client.get("/", headers={"X-Profile": mode, "X-Admin-Token": token})
+    assert ("x-profile-id" in response.headers) == profiled
@@ -0,0 +1,204 @@
+import io
+import random
+import re
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app as backend
+from conftest import zipped
+from generate_test_logs import generate_plain_lines
+from remote_zip import MemberReader, RemoteZip
+
+
+class ArchiveServer:
+    """Serves one archive over HTTP, with or without Range support, and counts the bytes sent."""
+
+    def __init__(self, archive: bytes, ranges: bool = True):
+        self.archive = archive
+        self.ranges = ranges
+        self.bytes_sent = 0
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                data = server.archive
+                match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+                if server.ranges and match:
+                    first, last = match.groups()
+                    if not first:
+                        start, end = max(0, len(data) - int(last)), len(data)
+                    else:
+                        start, end = int(first), min(len(data), int(last) + 1 if last else len(data))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+                    data = data[start:end]
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                server.bytes_sent += len(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/decryptedLogs.zip"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_archive(members: int = 40, member_size: int = 50_000, prefix: bytes = b"") -> bytes:
+    buffer = io.BytesIO()
+    buffer.write(prefix)
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(members):
+            # Random content so the archive stays as large as its members
+            zf.writestr(f"logs/DEV-{i:04d}/device.log", random.Random(i).randbytes(member_size))
+        zf.writestr("logs/", b"")
+        zf.writestr("README.md", b"not a log")
+    return buffer.getvalue()
+
+
+def expected_members(archive: bytes):
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        return [(info.filename, info.file_size, info.compress_size, info.header_offset) for info in zf.infolist()]
+
+
+def listed(remote: RemoteZip):
+    return [(m.name, m.file_size, m.compress_size, m.header_offset) for m in remote.members()]
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(archive, ranges=True):
+        servers.append(ArchiveServer(archive, ranges))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_lists_members_from_the_tail_only(serve):
+    archive = build_archive(members=60, member_size=200_000)
+    server = serve(archive)
+    remote = RemoteZip(server.url)
+    assert listed(remote) == expected_members(archive)
+    assert server.requests == 1
+    assert server.bytes_sent <= 16 * 1024 < len(archive) // 10
+    assert remote.members()[0].modified() is not None
+
+
+def test_large_central_directory_and_prepended_data(serve, monkeypatch):
+    monkeypatch.setattr("remote_zip.REMOTE_ZIP_TAIL_BYTES", 512)
+    archive = build_archive(members=30, member_size=1000, prefix=b"#!stub\n" * 10)
+    server = serve(archive)
+    assert listed(RemoteZip(server.url)) == expected_members(archive)
+    assert server.requests == 2  # tail, then the central directory
+
+
+def test_zip64_archive(serve, monkeypatch):
+    # Force ZIP64 end records (as written for archives of more than 65535 members)
+    monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 1)
+    archive = build_archive(members=5, member_size=1000)
+    assert b"PK\x06\x06" in archive[-200:]
+    monkeypatch.undo()
+    server = serve(archive)
+    assert listed(RemoteZip(server.url)) == expected_members(archive)
+
+
+def test_falls_back_to_full_download_without_ranges(serve):
+    archive = build_archive(members=5, member_size=1000)
+    server = serve(archive, ranges=False)
+    remote = RemoteZip(server.url)
+    assert listed(remote) == expected_members(archive)
+    assert not remote.ranges_supported and remote.archive == archive
+
+
+def test_list_zip_files_endpoint(client, serve, monkeypatch):
+    archive = build_archive(members=3, member_size=1000)
+    server = serve(archive)
+    monkeypatch.setattr(backend, "decrypted_zip_url", lambda company, site, timestamp: server.url)
+    response = client.post("/s3/list-zip-files", json={"companyCode": "C", "siteCode": "S", "timestamp_ms": "1"})
+    body = response.json()
+    assert body["files"] == [f"logs/DEV-{i:04d}/device.log" for i in range(3)]
+    assert body["total_files"] == 3 and len(body["all_files"]) == 5
+    assert body["members"][0]["size"] == 1000
+
+
+def test_fetches_only_selected_members(serve):
+    archive = build_archive(members=20, member_size=100_000)
+    stored = zipped([("stored.log", b"plain\n" * 1000)], zipfile.ZIP_STORED)  # plus a stored member
+    server = serve(archive)
+    remote = RemoteZip(server.url)
+    members = {m.name: m for m in remote.members()}
+    selected = [members["logs/DEV-0003/device.log"], members["logs/DEV-0011/device.log"]]
+    sent_before = server.bytes_sent
+
+    downloads = remote.fetch_members(selected, workers=2)
+    for member, download in zip(selected, downloads):
+        index = int(member.name.split("-")[1][:4])
+        assert MemberReader(member, download.result()).read() == random.Random(index).randbytes(100_000)
+    assert server.bytes_sent - sent_before < 2 * (100_000 + 2048)
+
+    stored_server = serve(stored, ranges=False)
+    stored_zip = RemoteZip(stored_server.url)
+    member = stored_zip.members()[0]
+    assert MemberReader(member, stored_zip.fetch_members([member])[0].result()).read() == b"plain\n" * 1000
+
+
+def test_process_selected_files_endpoint(client, serve, monkeypatch):
+    archive = zipped([(f"DEV-{i}.log", "\n".join(generate_plain_lines(3000, seed=i, corrupt_rate=0))) for i in range(10)])
+    server = serve(archive)
+    full_server = serve(archive, ranges=False)
+    body = {"companyCode": "C", "siteCode": "S", "timestamp_ms": "1", "selectedFiles": ["DEV-2.log", "DEV-7.log", "missing.log"]}
+    results = []
+    for url in (server.url, full_server.url):
+        monkeypatch.setattr(backend, "decrypted_zip_url", lambda company, site, timestamp: url)
+        client.post("/clear-data/")
+        response = client.post("/s3/process-selected-files", json=body)
+        assert response.status_code == 200, response.text
+        assert client.get("/logs/files").json()["files"] == ["DEV-2.log", "DEV-7.log"]
+        assert response.json()["processed_files"] == ["DEV-2.log", "DEV-7.log"]
+        assert response.json()["file_errors"] == [{"filename": "missing.log", "error": "Not found in the archive"}]
+        results.append(client.get("/logs").json()["logs"])
+    # Same rows as from the fully downloaded archive, for a fraction of the bytes
+    assert results[0] == results[1] and len(results[0]) > 5000
+    assert server.bytes_sent < len(archive) / 3
+
+
+@pytest.mark.parametrize("method", [zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA])
+def test_bzip2_and_lzma_members(serve, method):
+    data = "\n".join(generate_plain_lines(2000, seed=3, corrupt_rate=0)).encode()
+    remote = RemoteZip(serve(zipped([("device.log", data)], method)).url)
+    member = remote.members()[0]
+    assert MemberReader(member, remote.fetch_members([member])[0].result()).read() == data
+
+
+def test_unreadable_member_is_reported(client, serve, monkeypatch):
+    archive = bytearray(zipped([
+        ("good.log", "\n".join(generate_plain_lines(500, seed=1, corrupt_rate=0))),
+        ("bad.log", "\n".join(generate_plain_lines(500, seed=2, corrupt_rate=0))),
+    ]))
+    # Corrupt the compressed data of bad.log (its CRC no longer matches)
+    info = zipfile.ZipFile(io.BytesIO(bytes(archive))).getinfo("bad.log")
+    data_start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    archive[data_start + 100] ^= 0xFF
+    server = serve(bytes(archive))
+    monkeypatch.setattr(backend, "decrypted_zip_url", lambda company, site, timestamp: server.url)
+    body = {"companyCode": "C", "siteCode": "S", "timestamp_ms": "1", "selectedFiles": ["good.log", "bad.log"]}
+    result = client.post("/s3/process-selected-files", json=body).json()
+    assert result["processed_files"] == ["good.log"]
+    assert [error["filename"] for error in result["file_errors"]] == ["bad.log"]
+    assert client.get("/logs/files").json()["files"] == ["good.log"]
@@ -0,0 +1,55 @@
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt
+from result_cache import ResultCache, estimate_size
+
+
+def make_payload(screen: str) -> bytes:
+    lines = [
+        "DEVICE ID DEV-0001",
+        "10:00:00:000 | LOG-APP: App Version: 4.1.0",
+        f"10:00:01:000 | ECS-ACTIVITY: NAVIGATE-TO : {{ screen : {screen} }}",
+    ]
+    return "\n".join(cryptojs_encrypt(PASSPHRASE, line) for line in lines).encode()
+
+
+def test_keys_and_eviction():
+    cache = ResultCache(max_bytes=estimate_size([0] * 100) * 2)
+    calls = []
+    compute = lambda value: lambda: calls.append(value) or [value] * 100
+
+    assert cache.get_or_compute("a", {"x": 1, "y": None}, 1, compute(1)) == [1] * 100
+    assert cache.get_or_compute("a", {"x": 1}, 1, compute(2)) == [1] * 100  # None arguments are dropped
+    assert cache.get_or_compute("a", {"x": 1}, 2, compute(3)) == [3] * 100  # another generation
+    cache.get_or_compute("a", {"x": 1}, 1, compute(4))  # a hit: the generation 1 entry is now the most recent
+    cache.get_or_compute("b", {}, 2, compute(5))  # over budget: generation 2 of "a" goes
+    assert calls == [1, 3, 5]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+    assert cache.get_or_compute("a", {"x": 1}, 2, compute(6)) == [6] * 100
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_superseded_generation_is_not_stored():
+    cache = ResultCache(max_bytes=1 << 20)
+    # The store moves on to generation 3 while a generation 2 result is being computed
+    assert cache.get_or_compute("a", {}, 2, lambda: cache.invalidate(3) or [2]) == [2]
+    assert cache.stats()["entries"] == 0
+    cache.get_or_compute("a", {}, 3, lambda: [3])
+    assert cache.stats()["entries"] == 1
+
+
+def test_generation_bump_invalidates(client):
+    client.post("/read-log/", files={"file": ("one.log", make_payload("siteList"))})
+    first = client.get("/flowchart").json()
+    assert client.get("/flowchart").json() == first
+    stats = client.get("/cache/stats").json()
+    assert stats["entries"] >= 1 and stats["hits"] >= 1
+
+    # A new file bumps the generation: the cache is emptied and the next answer includes it
+    client.post("/read-log/", files={"file": ("two.log", make_payload("nodeList"))})
+    assert client.get("/cache/stats").json()["entries"] == 0
+    nodes = {node["id"] for node in client.get("/flowchart").json()["nodes"]}
+    assert {"siteList", "nodeList"} <= nodes
+
+    client.get("/clear-file-data/", params={"filename": "two.log"})
+    assert "nodeList" not in {node["id"] for node in client.get("/flowchart").json()["nodes"]}
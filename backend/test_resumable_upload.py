@@ -0,0 +1,67 @@
+import threading
+
+from generate_test_logs import render_lines
+from resumable_upload import ResumableUpload
+
+PAYLOAD = render_lines(3000, 17, 2, True).encode()
+OTHER = render_lines(500, 18, 2, True).encode()
+
+
+def stored(client):
+    return client.get("/logs").json()["logs"], client.get("/sessions").json()["sessions"]
+
+
+def test_chunks_out_of_order_match_a_plain_upload(client):
+    # Reference: the same files uploaded in one go
+    client.post("/read-log/", files={"file": ("other.log", OTHER)})
+    client.post("/read-log/", files={"file": ("device.log", PAYLOAD)})
+    expected = stored(client)
+    client.post("/clear-data/")
+
+    upload = client.post("/uploads", json={"filename": "device.log", "size": len(PAYLOAD)}).json()
+    upload_id = upload["upload_id"]
+    cuts = [0, 1000, 25_000, 60_000, len(PAYLOAD) - 7, len(PAYLOAD)]
+    chunks = [(start, PAYLOAD[start:end]) for start, end in zip(cuts, cuts[1:])]
+
+    # Early chunks wait for the gap before them; a resent chunk changes nothing
+    client.put(f"/uploads/{upload_id}", params={"offset": chunks[2][0]}, content=chunks[2][1])
+    status = client.put(f"/uploads/{upload_id}", params={"offset": chunks[0][0]}, content=chunks[0][1]).json()
+    assert status["parsed_offset"] == 1000
+    assert status["missing"] == [[1000, 25_000], [60_000, len(PAYLOAD)]]
+    client.put(f"/uploads/{upload_id}", params={"offset": chunks[0][0]}, content=chunks[0][1])
+    assert client.post(f"/uploads/{upload_id}/finalize").status_code == 409
+
+    client.put(f"/uploads/{upload_id}", params={"offset": chunks[1][0]}, content=chunks[1][1])
+    client.put(f"/uploads/{upload_id}", params={"offset": chunks[3][0]}, content=chunks[3][1])
+    status = client.get(f"/uploads/{upload_id}").json()
+    assert status["parsed_offset"] == len(PAYLOAD) - 7 and status["logs_parsed"] > 0
+
+    # Another file is published while the upload is still open: ids are assigned at finalize
+    client.post("/read-log/", files={"file": ("other.log", OTHER)})
+    status = client.put(f"/uploads/{upload_id}", params={"offset": chunks[4][0]}, content=chunks[4][1]).json()
+    assert status["complete"] and status["missing"] == []
+
+    result = client.post(f"/uploads/{upload_id}/finalize").json()
+    assert stored(client) == expected
+    assert result["next_log_id"] == expected[0][-1]["id"] + 1
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_chunk_outside_declared_size_is_rejected(client):
+    upload_id = client.post("/uploads", json={"filename": "device.log", "size": 10}).json()["upload_id"]
+    assert client.put(f"/uploads/{upload_id}", params={"offset": 5}, content=b"0123456789").status_code == 416
+    assert client.delete(f"/uploads/{upload_id}").status_code == 200
+    assert client.put(f"/uploads/{upload_id}", params={"offset": 0}, content=b"x").status_code == 404
+
+
+def test_status_waits_for_a_chunk_in_progress():
+    upload = ResumableUpload("status-test", "device.log", len(OTHER))
+    statuses = []
+    with upload.lock:  # as while a chunk is being parsed
+        reader = threading.Thread(target=lambda: statuses.append(upload.status()))
+        reader.start()
+        reader.join(0.2)
+        assert reader.is_alive()
+    reader.join()
+    assert statuses[0]["received"] == [] and statuses[0]["missing"] == [[0, len(OTHER)]]
+    upload.close()
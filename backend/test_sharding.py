@@ -0,0 +1,150 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from generate_test_logs import render_lines
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module: str, port: int, env: dict) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **env},
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{module} on port {port} did not start")
+
+
+@pytest.fixture(scope="module")
+def local_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("local_ingest")
+
+
+@pytest.fixture(scope="module")
+def coordinator_url(local_dir):
+    shard_ports = [free_port(), free_port()]
+    shard_env = {"BACKEND_ROLE": "standalone", "ADMIN_TOKEN": "test-token", "LOCAL_INGEST_ROOTS": str(local_dir)}
+    procs = [start_server("app", port, shard_env) for port in shard_ports]
+    try:
+        port = free_port()
+        shard_urls = ",".join(f"http://127.0.0.1:{p}" for p in shard_ports)
+        procs.append(start_server("coordinator", port, {"BACKEND_ROLE": "coordinator", "SHARD_URLS": shard_urls}))
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+def test_coordinator_matches_single_node(coordinator_url, client):
+    files = [(f"shard-test-{i}.log", render_lines(300, i, 3).encode()) for i in range(5)]
+    requests.post(coordinator_url + "/clear-data/").raise_for_status()
+    for name, payload in files:
+        assert client.post("/read-log/", files={"file": (name, payload)}).status_code == 200
+        assert requests.post(coordinator_url + "/read-log/", files={"file": (name, payload)}).status_code == 200
+
+    # Files were spread over both shards
+    shards = requests.get(coordinator_url + "/health").json()["shards"]
+    assert all(shard["total_logs"] > 0 for shard in shards)
+
+    # Time bounds inside the generated data: the first time of day, and a middle third in ms
+    times = sorted(log["time_ms"] for log in client.get("/logs").json()["logs"] if log["time_ms"] is not None)
+    first = times[0]
+    first_clock = f"{first // 3_600_000:02d}:{first // 60_000 % 60:02d}:{first // 1000 % 60:02d}"
+    middle = (times[len(times) // 3], times[2 * len(times) // 3])
+
+    def both(method, path, **kwargs):
+        expected = client.request(method, path, **kwargs)
+        actual = requests.request(method, coordinator_url + path, **kwargs)
+        assert actual.status_code == expected.status_code, path
+        return expected.json(), actual.json()
+
+    # Paginated logs come back in the same global id order
+    for params in ({"page": 1, "per_page": 50}, {"page": 4, "per_page": 50}, {"page": 2, "per_page": 20, "device_id": "DEV-0001"}):
+        expected, actual = both("GET", "/logs/paginated", params=params)
+        assert actual == expected
+
+    expected, actual = both("GET", "/sessions")
+    assert actual == expected
+
+    expected, actual = both("GET", "/logs/files")
+    assert actual == expected
+
+    expected, actual = both("GET", "/logs/37")
+    assert actual == expected
+
+    expected, actual = both("GET", "/stats/devices")
+    key = lambda device: device["device_id"]
+    assert sorted(actual["devices"], key=key) == sorted(expected["devices"], key=key)
+
+    for params in ({"bucket_ms": 10000}, {"bucket_ms": 30000, "group_by": "device,file", "time_from": first_clock}):
+        expected, actual = both("GET", "/stats/timeline", params=params)
+        series_key = lambda series: (series.get("device_id", ""), series.get("filename", ""))
+        assert sorted(actual.pop("series"), key=series_key) == sorted(expected.pop("series"), key=series_key)
+        assert actual == expected
+
+    expected, actual = both("GET", "/logs", params={"time_from": middle[0], "time_to": middle[1]})
+    assert actual == expected and expected["logs"]
+
+    expected, actual = both("POST", "/test-results", json={})
+    extract = lambda body: json.loads(body["data"]["data"]["runWorkflow"]["stepResults"][0]["result"])
+    assert extract(actual) == extract(expected)
+
+    expected, actual = both("GET", "/flowchart")
+    assert actual["nodes"] == expected["nodes"]
+    assert actual["metadata"] == expected["metadata"]
+    edge_key = lambda edge: (edge["from"], edge["to"])
+    assert sorted(actual["edges"], key=edge_key) == sorted(expected["edges"], key=edge_key)
+
+
+def test_coordinator_uploads_and_local_ingest(coordinator_url, local_dir, client):
+    files = [(f"route-test-{i}.log", render_lines(300, 10 + i, 3).encode()) for i in range(3)]
+    admin = {"X-Admin-Token": "test-token"}
+    requests.post(coordinator_url + "/clear-data/").raise_for_status()
+    for name, payload in files:
+        client.post("/read-log/", files={"file": (name, payload)})
+
+    # A plain upload, a resumable upload and a local file, in that order
+    name, payload = files[0]
+    requests.post(coordinator_url + "/read-log/", files={"file": (name, payload)}).raise_for_status()
+    name, payload = files[1]
+    upload = requests.post(coordinator_url + "/uploads", json={"filename": name, "size": len(payload)}).json()
+    for offset in range(0, len(payload), 4096):
+        requests.put(f"{coordinator_url}/uploads/{upload['upload_id']}", params={"offset": offset}, data=payload[offset:offset + 4096])
+    assert requests.get(f"{coordinator_url}/uploads/{upload['upload_id']}").json()["complete"]
+    requests.post(f"{coordinator_url}/uploads/{upload['upload_id']}/finalize").raise_for_status()
+    assert requests.get(f"{coordinator_url}/uploads/{upload['upload_id']}").status_code == 404
+    name, payload = files[2]
+    (local_dir / name).write_bytes(payload)
+    response = requests.post(coordinator_url + "/admin/local-ingest", json={"path": str(local_dir / name)}, headers=admin)
+    assert response.status_code == 200, response.text
+
+    expected = client.get("/logs").json()["logs"]
+    actual = requests.get(coordinator_url + "/logs").json()["logs"]
+    strip = lambda logs: [{**log, "filename": os.path.basename(log["filename"])} for log in logs]
+    assert strip(actual) == strip(expected)
+
+    follow = requests.post(coordinator_url + "/admin/local-ingest", json={"path": str(local_dir / name), "follow": True}, headers=admin)
+    assert follow.status_code == 400
+    assert requests.get(coordinator_url + "/admin/local-ingest/follows", headers=admin).json() == {"follows": []}
+    assert requests.delete(coordinator_url + "/admin/local-ingest/follows/missing", headers=admin).status_code == 404
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import app as backend
+from generate_test_logs import render_lines
+
+ADMIN = {"X-Admin-Token": "test-token"}
+
+
+@pytest.fixture
+def client(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "ADMIN_TOKEN", "test-token")
+    monkeypatch.setattr(backend.slow_requests, "threshold_ms", 0)
+    monkeypatch.setattr(backend.slow_requests, "path", str(tmp_path / "slow.jsonl"))
+    client.post("/read-log/", files={"file": ("slow.log", render_lines(2000, 5, 2, True).encode())})
+    client.delete("/admin/slow-requests", headers=ADMIN)
+    yield client
+    backend.slow_requests.clear()
+
+
+def test_slow_request_records_params_and_rows(client, tmp_path):
+    page = client.get("/logs/paginated", params={"page": 2, "per_page": 50, "device_id": "DEV-0001"})
+    assert page.status_code == 200
+    client.get("/flowchart", params={"timings": "true"})
+
+    recorded = client.get("/admin/slow-requests", params={"route": "/logs/paginated"}, headers=ADMIN).json()
+    entry = recorded["requests"][0]
+    assert entry["params"] == {"page": "2", "per_page": "50", "device_id": "DEV-0001"}
+    assert entry["status"] == 200
+    assert entry["rows_returned"] == len(page.json()["logs"])
+    # The device filter reads every stored row
+    assert entry["rows_scanned"] == backend.log_store.snapshot().log_count()
+    assert entry["store"]["generation"] == backend.log_store.generation
+    assert entry["store"]["files"] == 1
+
+    flowchart = client.get("/admin/slow-requests", params={"route": "/flowchart"}, headers=ADMIN).json()["requests"][0]
+    assert "stages" in flowchart["timings"]
+
+    with open(tmp_path / "slow.jsonl") as f:
+        routes = [json.loads(line)["route"] for line in f]
+    assert "/logs/paginated" in routes and "/flowchart" in routes
+
+
+def test_slow_request_log_filters(client):
+    client.get("/logs/1")
+    assert client.get("/admin/slow-requests", params={"route": "/logs/{log_id}"}, headers=ADMIN).json()["requests"][0]["rows_scanned"] == 1
+    assert client.get("/admin/slow-requests", params={"min_duration_ms": 60_000}, headers=ADMIN).json()["requests"] == []
+    assert client.get("/admin/slow-requests").status_code == 403
+
+
+def test_json_body_with_parameters_is_kept(client):
+    body = json.dumps({"siteCode": "S1"})
+    client.post("/test-results", content=body, headers={"Content-Type": "Application/JSON; charset=utf-8"})
+    entry = client.get("/admin/slow-requests", params={"route": "/test-results"}, headers=ADMIN).json()["requests"][0]
+    assert entry["body"] == {"siteCode": "S1"}
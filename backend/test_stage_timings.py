@@ -0,0 +1,24 @@
+import json
+import logging
+
+from stage_timings import StageTimer, timed_stage
+
+
+def test_stages_are_logged_only_when_enabled(caplog):
+    timer = StageTimer("flowchart", device_id="DEV-1")
+    with timer.activate():
+        with timed_stage("build"):
+            with timed_stage("normalize"):
+                pass
+    timer.finish()
+
+    with caplog.at_level(logging.WARNING, logger="stage_timings"):
+        timer.log()
+    assert caplog.records == []
+
+    with caplog.at_level(logging.INFO, logger="stage_timings"):
+        timer.log()
+    (record,) = caplog.records
+    payload = json.loads(record.getMessage())
+    assert (payload["event"], payload["operation"], payload["device_id"]) == ("stage_timings", "flowchart", "DEV-1")
+    assert set(payload["stages"]) == {"build", "normalize"}
@@ -0,0 +1,33 @@
+from log_store import LogStore, SegmentResidency
+from store_catalog import CatalogReader, CatalogWriter
+
+
+def make_rows(first_id: int, count: int, filename: str):
+    logs = [
+        {"id": first_id + i, "session_id": 1, "device_id": "DEV-1", "time": None, "time_ms": None, "message": f"row {i} " * 20, "filename": filename}
+        for i in range(count)
+    ]
+    return logs, []
+
+
+def test_worker_copy_stays_within_the_memory_budget(tmp_path):
+    store = LogStore()
+    writer = CatalogWriter(str(tmp_path / "catalog"))
+    store.add_listener(lambda generation: writer.publish(store.snapshot()))
+    for index in range(4):
+        store.add_segment(f"f{index}.log", *make_rows(1 + index * 200, 200, f"f{index}.log"))
+
+    residency = SegmentResidency(budget_bytes=1, spill_dir=str(tmp_path / "spill"))
+    reader = CatalogReader(str(tmp_path / "catalog"), residency=residency)
+    snapshot = reader.refresh()
+    assert snapshot.log_count() == 800
+    # Only the most recently loaded segment stays in memory
+    assert [segment.resident for segment in snapshot.segments()] == [False, False, False, True]
+    assert residency.spills == 3
+    assert snapshot.logs("f0.log") == store.snapshot().logs("f0.log")
+
+    store.remove_file("f0.log")
+    snapshot = reader.refresh()
+    assert snapshot.filenames() == ["f1.log", "f2.log", "f3.log"]
+    assert residency.resident_bytes == sum(segment.nbytes for segment in snapshot.segments() if segment.resident)
+    residency.close()
@@ -0,0 +1,70 @@
+from generate_test_logs import PASSPHRASE, cryptojs_encrypt, render_lines
+from log_parser import MS_PER_DAY, LogFileParser, time_to_ms
+
+PAYLOADS = [render_lines(4000, 50 + i, 3, True).encode() for i in range(2)]
+
+
+def test_time_to_ms():
+    assert time_to_ms("01:02:03:456") == 3723456
+    assert time_to_ms("01:02:03:45") == 3723450  # hundredths
+    assert time_to_ms("01:02") == 3720000
+    assert time_to_ms("24:00:00:000") is None
+    assert time_to_ms("soon") is None
+
+
+def test_midnight_rollover_per_device():
+    parser = LogFileParser("multi-day.log", decrypt=False)
+    parser.feed_lines([
+        "DEVICE ID DEV-A",
+        "23:59:58:900 | LOG-APP: App Version: 4.1.0",
+        "23:59:58:850 | INFO : slightly out of order",
+        "00:00:01:05 | INFO : after midnight",
+        "DEVICE ID DEV-B",
+        "08:00:00:000 | LOG-APP: App Version: 4.1.0",
+        "DEVICE ID DEV-A",
+        "23:00:00:000 | INFO : the next evening",
+        "00:00:00:001 | INFO : third day",
+    ])
+    parsed = parser.finish()
+    times = [(log["device_id"], log["time_ms"]) for log in parsed.logs]
+    assert times == [
+        ("DEV-A", 86398900),
+        ("DEV-A", 86398850),
+        ("DEV-A", MS_PER_DAY + 1050),
+        ("DEV-B", 28800000),  # each device counts its own days
+        ("DEV-A", MS_PER_DAY + 82800000),
+        ("DEV-A", 2 * MS_PER_DAY + 1),
+    ]
+    # The summary of the last session covers DEV-A's rows
+    assert [(s["start_time_ms"], s["end_time_ms"]) for s in parsed.sessions] == [(MS_PER_DAY + 82800000, 2 * MS_PER_DAY + 1)]
+
+
+def test_time_range_queries_match_a_scan(client):
+    lines = ["DEVICE ID DEV-0009"] + [f"{hour:02d}:30:00:000 | LOG-APP: App Version: 4.{hour}.0" for hour in (22, 23, 1, 2)]
+    multi_day = "\n".join(cryptojs_encrypt(PASSPHRASE, line) for line in lines).encode()
+    for index, payload in enumerate(PAYLOADS + [multi_day]):
+        client.post("/read-log/", files={"file": (f"f{index}.log", payload)})
+    logs, sessions = client.get("/logs").json()["logs"], client.get("/sessions").json()["sessions"]
+    assert logs[-1]["time_ms"] == MS_PER_DAY + 2 * 3600000 + 1800000
+
+    times = sorted(log["time_ms"] for log in logs if log["time_ms"] is not None)
+    time_from, time_to = times[len(times) // 3], times[len(times) // 2]
+    params = {"time_from": time_from, "time_to": time_to}
+    expected = [log for log in logs if log["time_ms"] is not None and time_from <= log["time_ms"] <= time_to]
+    assert expected and len(expected) < len(logs)
+    assert client.get("/logs", params=params).json()["logs"] == expected
+    page = client.get("/logs/paginated", params={**params, "page": 2, "per_page": 50}).json()
+    assert page["metadata"]["total_logs"] == len(expected) and page["logs"] == expected[50:100]
+    device = expected[0]["device_id"]
+    assert client.get("/logs", params={**params, "device_id": device}).json()["logs"] == [log for log in expected if log["device_id"] == device]
+
+    expected_sessions = [
+        s for s in sessions
+        if s["start_time_ms"] is not None and s["start_time_ms"] <= time_to and s["end_time_ms"] >= time_from
+    ]
+    assert client.get("/sessions", params=params).json()["sessions"] == expected_sessions
+    # Times of day are on the first day of each file
+    assert [log["time_ms"] for log in client.get("/logs", params={"time_from": "22:00"}).json()["logs"]][-3:] == [
+        23 * 3600000 + 1800000, MS_PER_DAY + 3600000 + 1800000, MS_PER_DAY + 2 * 3600000 + 1800000,
+    ]
+    assert client.get("/logs", params={"time_from": "noon"}).status_code == 400
@@ -0,0 +1,69 @@
+from collections import Counter
+
+import pytest
+
+from generate_test_logs import render_lines
+from log_lexer import INFO, lex
+
+PAYLOADS = [render_lines(3000, 60 + i, 3, True).encode() for i in range(2)]
+
+
+@pytest.fixture
+def client(client):
+    for index, payload in enumerate(PAYLOADS):
+        client.post("/read-log/", files={"file": (f"t{index}.log", payload)})
+    return client
+
+
+def scan_counts(logs, bucket_ms, group):
+    """(group, bucket start, level) -> count, the slow way."""
+    counts = Counter()
+    for log in logs:
+        if log["time_ms"] is not None:
+            level = lex(log["message"]).level or INFO
+            counts[(group(log), log["time_ms"] // bucket_ms * bucket_ms, level)] += 1
+    return counts
+
+
+def timeline_counts(timeline, group):
+    counts = Counter()
+    for series in timeline["series"]:
+        for level, values in series["counts"].items():
+            for start, value in zip(timeline["buckets"], values):
+                if value:
+                    counts[(group(series), start, level)] += value
+    return counts
+
+
+def test_timeline_matches_a_scan(client):
+    logs = client.get("/logs").json()["logs"]
+    by_device_file = lambda row: (row["device_id"], row["filename"])
+    timeline = client.get("/stats/timeline", params={"bucket_ms": 60000, "group_by": "device,file"}).json()
+    assert timeline["levels"] == ["ERROR", "WARNING", "INFO", "DEBUG"]
+    assert timeline["buckets"] == list(range(timeline["buckets"][0], timeline["buckets"][-1] + 1, 60000))
+    assert all(len(values) == len(timeline["buckets"]) for series in timeline["series"] for values in series["counts"].values())
+    assert timeline_counts(timeline, by_device_file) == scan_counts(logs, 60000, by_device_file)
+
+    device = logs[0]["device_id"]
+    time_from = logs[len(logs) // 2]["time_ms"]
+    params = {"bucket_ms": 5000, "device_id": device, "time_from": time_from, "filename": "t1.log"}
+    timeline = client.get("/stats/timeline", params=params).json()
+    selected = [row for row in logs if row["device_id"] == device and row["filename"] == "t1.log" and (row["time_ms"] or -1) >= time_from]
+    assert len(timeline["series"]) == 1
+    assert timeline_counts(timeline, lambda _: None) == scan_counts(selected, 5000, lambda _: None)
+
+
+def test_device_stats_from_columns(client):
+    expected = {}
+    for log in client.get("/logs").json()["logs"]:
+        stats = expected.setdefault(log["device_id"], Counter())
+        stats["total_logs"] += 1
+        level = lex(log["message"]).level
+        stats["error_count" if level == "ERROR" else "warning_count" if level == "WARNING" else "info_count"] += 1
+    devices = client.get("/stats/devices").json()["devices"]
+    assert {device.pop("device_id"): device for device in devices} == {key: dict(value) for key, value in expected.items()}
+
+
+def test_timeline_errors(client):
+    assert client.get("/stats/timeline", params={"group_by": "session"}).status_code == 400
+    assert client.get("/stats/timeline", params={"bucket_ms": 1}).status_code == 400  # too many buckets